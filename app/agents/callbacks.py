@@ -0,0 +1,80 @@
+# ========================================
+# app/agents/callbacks.py - Callbacks de LangChain para Observabilidad
+# ========================================
+
+from typing import Any, Dict
+import time
+
+from langchain.callbacks.base import BaseCallbackHandler
+from opentelemetry.trace import Status, StatusCode
+
+from ..services.metrics import LLM_CALL_SECONDS, LLM_TOKENS
+from ..services.tracing import tracer
+
+# Viven junto a los agentes para que metrics/tracing no importen LangChain al arrancar
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """Callback de LangChain que registra latencia y tokens de cada llamada al LLM"""
+
+    def __init__(self, agent: str):
+        self.agent = agent
+        self._started: Dict[Any, float] = {}
+        self._histogram = LLM_CALL_SECONDS.labels(agent)
+
+    def on_llm_start(self, serialized, prompts, *, run_id=None, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id=None, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id=None, **kwargs):
+        start = self._started.pop(run_id, None)
+        if start is not None:
+            self._histogram.observe(time.perf_counter() - start)
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if usage.get(kind):
+                LLM_TOKENS.labels(self.agent, kind.replace("_tokens", "")).inc(usage[kind])
+
+    def on_llm_error(self, error, *, run_id=None, **kwargs):
+        start = self._started.pop(run_id, None)
+        if start is not None:
+            self._histogram.observe(time.perf_counter() - start)
+
+
+class LLMTracingCallback(BaseCallbackHandler):
+    """Callback de LangChain que abre un span por cada llamada al LLM"""
+
+    def __init__(self, agent: str):
+        self.agent = agent
+        self._spans: Dict[Any, Any] = {}
+
+    def _start(self, run_id):
+        span = tracer.start_span("llm.call", attributes={"agent": self.agent})
+        if span.is_recording():
+            self._spans[run_id] = span
+
+    def on_llm_start(self, serialized, prompts, *, run_id=None, **kwargs):
+        self._start(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id=None, **kwargs):
+        self._start(run_id)
+
+    def on_llm_end(self, response, *, run_id=None, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is None:
+            return
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if usage.get(kind):
+                span.set_attribute(f"llm.{kind}", usage[kind])
+        span.end()
+
+    def on_llm_error(self, error, *, run_id=None, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is None:
+            return
+        span.record_exception(error)
+        span.set_status(Status(StatusCode.ERROR, str(error)))
+        span.end()
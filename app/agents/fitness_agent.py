@@ -10,10 +10,17 @@ from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from ..tools.fitness_apis import ExerciseDBTool
 from ..tools.calculators import WorkoutCalculatorTool
+from ..services.prompt_builder import PromptBuilder
+from ..services.profiling import run_profiled
+from ..services.tracing import traced
+from .callbacks import LLMMetricsCallback, LLMTracingCallback
 
 class FitnessAgent:
     def __init__(self):
-        self.llm = ChatOpenAI(temperature=0.3, model="gpt-3.5-turbo")
+        self.llm = ChatOpenAI(
+            temperature=0.3, model="gpt-3.5-turbo", callbacks=[LLMMetricsCallback("fitness"), LLMTracingCallback("fitness")]
+        )
+        self.prompt_builder = PromptBuilder()
         
         self.tools = [
             ExerciseDBTool(),
@@ -100,19 +107,19 @@ class FitnessAgent:
         self.agent = create_openapi_agent(self.llm, self.tools, self.prompt)
         self.executor = AgentExecutor(agent=self.agent, tools=self.tools, verbose=True)
 
+    @traced("agent.fitness")
     async def process(self, message: str, user_profile: Dict, context: List[Dict]) -> Dict[str, Any]:
         """Procesa una consulta de fitness"""
         
-        user_context = self._prepare_user_context(user_profile, context)
-        
-        full_input = f"""
-        Perfil del usuario: {user_context}
-        Consulta: {message}
-        """
+        user_context = self._prepare_user_context(user_profile)
+        full_input, prompt_metrics = self.prompt_builder.build(
+            "fitness", user_profile.get("user_id"), message, user_context, context
+        )
         
         try:
+            # run_profiled: si la petición se está perfilando, también este hilo
             result = await asyncio.to_thread(
-                self.executor.invoke,
+                run_profiled, self.executor.invoke,
                 {"input": full_input}
             )
             
@@ -132,7 +139,8 @@ class FitnessAgent:
                 "metadata": {
                     "tools_used": tools_used,
                     "user_profile_used": bool(user_profile),
-                    "context_items": len(context) if context else 0
+                    "context_items": len(context) if context else 0,
+                    "prompt": prompt_metrics
                 }
             }
             
@@ -143,8 +151,12 @@ class FitnessAgent:
                 "metadata": {"error": str(e)}
             }
 
-    def _prepare_user_context(self, user_profile: Dict, context: List[Dict]) -> str:
-        """Prepara contexto específico para fitness"""
+    def _prepare_user_context(self, user_profile: Dict) -> str:
+        """Prepara el perfil específico para fitness (cacheado por versión del perfil)"""
+        return self.prompt_builder.render_profile("fitness", user_profile, self._render_user_context)
+
+    def _render_user_context(self, user_profile: Dict) -> str:
+        """Renderiza los campos del perfil relevantes para fitness"""
         context_parts = []
         
         if user_profile:
@@ -172,12 +184,6 @@ class FitnessAgent:
             if user_profile.get("activity_level"):
                 context_parts.append(f"Nivel actividad: {user_profile['activity_level']}")
         
-        # Agregar contexto de conversaciones previas
-        if context:
-            recent_context = [item.get("content", "") for item in context[-3:]]  # Últimas 3 interacciones
-            if recent_context:
-                context_parts.append(f"Contexto previo: {' | '.join(recent_context)}")
-        
         return " | ".join(context_parts) if context_parts else "Sin información específica de fitness"
 
     def _should_generate_plan(self, message: str, response: str) -> bool:
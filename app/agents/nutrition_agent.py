@@ -10,10 +10,17 @@ from langchain.prompts import ChatPromptTemplate
 from langchain.tools import BaseTool
 from ..tools.nutrition_apis import EdamamMealPlannerTool
 from ..tools.calculators import MacroCalculatorTool, CalorieCalculatorTool
+from ..services.prompt_builder import PromptBuilder
+from ..services.profiling import run_profiled
+from ..services.tracing import traced
+from .callbacks import LLMMetricsCallback, LLMTracingCallback
 
 class NutritionAgent:
     def __init__(self):
-        self.llm = ChatOpenAI(temperature=0.3, model="gpt-3.5-turbo")
+        self.llm = ChatOpenAI(
+            temperature=0.3, model="gpt-3.5-turbo", callbacks=[LLMMetricsCallback("nutrition"), LLMTracingCallback("nutrition")]
+        )
+        self.prompt_builder = PromptBuilder()
         
         # Herramientas específicas de nutrición
         self.tools = [
@@ -45,22 +52,21 @@ class NutritionAgent:
         self.agent = create_openai_tools_agent(self.llm, self.tools, self.prompt)
         self.executor = AgentExecutor(agent=self.agent, tools=self.tools, verbose=True)
 
+    @traced("agent.nutrition")
     async def process(self, message: str, user_profile: Dict, context: List[Dict]) -> Dict[str, Any]:
         """Procesa una consulta de nutrición"""
         
-        # Preparar contexto del usuario
-        user_context = self._prepare_user_context(user_profile, context)
-        
-        # Crear input completo
-        full_input = f"""
-        Perfil del usuario: {user_context}
-        Consulta: {message}
-        """
+        # Preparar contexto del usuario y crear input completo dentro del presupuesto
+        user_context = self._prepare_user_context(user_profile)
+        full_input, prompt_metrics = self.prompt_builder.build(
+            "nutrition", user_profile.get("user_id"), message, user_context, context
+        )
         
         try:
             # Ejecutar agente
+            # run_profiled: si la petición se está perfilando, también este hilo
             result = await asyncio.to_thread(
-                self.executor.invoke,
+                run_profiled, self.executor.invoke,
                 {"input": full_input}
             )
             
@@ -79,7 +85,8 @@ class NutritionAgent:
                 "plan_data": self._extract_plan_data(response_content) if generate_plan else None,
                 "metadata": {
                     "tools_used": [tool.name for tool in self.tools],
-                    "user_profile_used": bool(user_profile)
+                    "user_profile_used": bool(user_profile),
+                    "prompt": prompt_metrics
                 }
             }
             
@@ -90,8 +97,12 @@ class NutritionAgent:
                 "metadata": {"error": str(e)}
             }
 
-    def _prepare_user_context(self, user_profile: Dict, context: List[Dict]) -> str:
-        """Prepara el contexto del usuario para el agente"""
+    def _prepare_user_context(self, user_profile: Dict) -> str:
+        """Prepara el perfil del usuario para el agente (cacheado por versión del perfil)"""
+        return self.prompt_builder.render_profile("nutrition", user_profile, self._render_user_context)
+
+    def _render_user_context(self, user_profile: Dict) -> str:
+        """Renderiza los campos del perfil relevantes para nutrición"""
         context_parts = []
         
         if user_profile:
@@ -108,12 +119,6 @@ class NutritionAgent:
             if user_profile.get("restrictions"):
                 context_parts.append(f"Restricciones dietéticas: {user_profile['restrictions']}")
         
-        if context:
-            recent_context = context[-3:]  # Últimas 3 interacciones
-            context_parts.append("Contexto reciente de la conversación:")
-            for ctx in recent_context:
-                context_parts.append(f"- {ctx.get('message', '')[:100]}...")
-        
         return " | ".join(context_parts) if context_parts else "Sin información de perfil disponible"
 
     def _extract_plan_data(self, response: str) -> Dict[str, Any]:
@@ -4,82 +4,231 @@
 
 from typing import Dict, Any, Optional, List
 import asyncio
+import importlib
 import logging
+import threading
+import time
 from datetime import datetime
-from .nutrition_agent import NutritionAgent
-from .fitness_agent import FitnessAgent
-from .research_agent import ResearchAgent
-from .personalization_agent import PersonalizationAgent
 from ..services.memory_service import MemoryService
-from ..services.plan_generator import PlanGenerator
+from ..services.rate_limiter import rate_limiter
+from ..services.session_prefetch import SessionPrefetcher, SessionSnapshot
+from ..services.conversation_window import WINDOW_STATS, ConversationWindow
+from ..services.metrics import PROCESS_MESSAGE_SECONDS, flush_cache_counts
+from ..services.tracing import traced, tracer
 
 logger = logging.getLogger(__name__)
 
 class AgentOrchestrator:
+    # Keywords para routing (compartidas por todas las instancias)
+    nutrition_keywords = [
+        'dieta', 'alimentación', 'comida', 'nutrición', 'calorías', 
+        'macros', 'proteína', 'carbohidratos', 'grasas', 'vitaminas'
+    ]
+    fitness_keywords = [
+        'ejercicio', 'rutina', 'entrenamiento', 'gimnasio', 'músculo',
+        'cardio', 'fuerza', 'peso', 'repeticiones', 'series'
+    ]
+    research_keywords = [
+        'estudio', 'investigación', 'científico', 'evidencia', 'pubmed'
+    ]
+
+    # Agentes por tipo: (módulo, clase). Se importan y construyen en el primer uso
+    # porque arrastran LangChain y langchain_openai, que dominan el arranque
+    agent_classes = {
+        "nutrition": (".nutrition_agent", "NutritionAgent"),
+        "fitness": (".fitness_agent", "FitnessAgent"),
+        "research": (".research_agent", "ResearchAgent"),
+        "personalization": (".personalization_agent", "PersonalizationAgent"),
+    }
+    # Instancias compartidas por todas las conexiones (los agentes no guardan estado por usuario)
+    _agents: Dict[str, Any] = {}
+    _agents_lock = threading.Lock()
+
     def __init__(self):
-        self.nutrition_agent = NutritionAgent()
-        self.fitness_agent = FitnessAgent()
-        self.research_agent = ResearchAgent()
-        self.personalization_agent = PersonalizationAgent()
         self.memory_service = MemoryService()
-        self.plan_generator = PlanGenerator()
-        
-        # Keywords para routing
-        self.nutrition_keywords = [
-            'dieta', 'alimentación', 'comida', 'nutrición', 'calorías', 
-            'macros', 'proteína', 'carbohidratos', 'grasas', 'vitaminas'
-        ]
-        self.fitness_keywords = [
-            'ejercicio', 'rutina', 'entrenamiento', 'gimnasio', 'músculo',
-            'cardio', 'fuerza', 'peso', 'repeticiones', 'series'
-        ]
-        self.research_keywords = [
-            'estudio', 'investigación', 'científico', 'evidencia', 'pubmed'
-        ]
+        self.rate_limiter = rate_limiter
+        self.prefetcher = SessionPrefetcher(self.memory_service)
+        self._plan_generator = None
+        # Precarga lanzada al conectar; la consume el primer mensaje
+        self._session_task: Optional[asyncio.Task] = None
+        # Últimos turnos del usuario de esta conexión (se leen sin ir a Redis)
+        self.window: Optional[ConversationWindow] = None
+
+    @classmethod
+    def get_agent(cls, agent_type: str):
+        """Devuelve el agente del tipo indicado, importándolo y creándolo si hace falta"""
+        agent = cls._agents.get(agent_type)
+        if agent is not None:
+            return agent
+
+        with cls._agents_lock:
+            if agent_type not in cls._agents:
+                module_name, class_name = cls.agent_classes[agent_type]
+                module = importlib.import_module(module_name, __package__)
+                cls._agents[agent_type] = getattr(module, class_name)()
+                logger.info(f"Agente {agent_type} inicializado")
+            return cls._agents[agent_type]
+
+    @classmethod
+    def warm_up(cls):
+        """Importa y construye todos los agentes (pensado para ejecutarse en segundo plano)"""
+        for agent_type in cls.agent_classes:
+            try:
+                cls.get_agent(agent_type)
+            except Exception as e:
+                logger.error(f"Error precargando agente {agent_type}: {str(e)}")
+
+    @property
+    def plan_generator(self):
+        # PlanGenerator importa SQLAlchemy, los modelos y numpy: sólo cuando se genera un plan
+        if self._plan_generator is None:
+            from ..services.plan_generator import PlanGenerator
+            self._plan_generator = PlanGenerator()
+        return self._plan_generator
+
+    def start_prefetch(self, user_id: str):
+        """Carga perfil, contexto y objetivos en segundo plano mientras llega el primer mensaje"""
+        self._session_task = asyncio.create_task(self._prefetch(user_id))
+
+    async def _prefetch(self, user_id: str) -> SessionSnapshot:
+        session = await self.prefetcher.load(user_id)
+        # La ventana se abre ya: recibe los turnos que escriban otras conexiones del usuario
+        await self._open_window(user_id, session.context, session.seq)
+        return session
+
+    def cancel_prefetch(self):
+        if self._session_task and not self._session_task.done():
+            self._session_task.cancel()
+        self._session_task = None
+        self.prefetcher.cancel()
+
+    async def close(self):
+        """Libera lo asociado a la conexión: precarga pendiente y ventana de conversación"""
+        self.cancel_prefetch()
+        if self.window is not None:
+            await self.memory_service.conversation_windows.unregister(self.window)
+            self.window = None
+
+    async def _open_window(self, user_id: str, context: List[Dict[str, Any]], seq: int):
+        if self.window is not None and self.window.user_id == user_id:
+            self.window.reset(context, seq)
+            return
+        if self.window is not None:
+            await self.memory_service.conversation_windows.unregister(self.window)
+        self.window = ConversationWindow(user_id, context, seq, self.prefetcher.context_limit)
+        await self.memory_service.conversation_windows.register(self.window)
+
+    async def _window_context(self, user_id: str) -> Optional[List[Dict[str, Any]]]:
+        """Contexto de la ventana local, o None si hay que recargarlo de Redis"""
+        window = self.window
+        if window is None or window.user_id != user_id:
+            return None
+        if not window.stale and window.needs_verify():
+            # Comprobación periódica por si se perdió algún aviso de otra conexión
+            if await self.memory_service.get_conversation_seq(user_id) == window.seq:
+                window.verified_at = time.monotonic()
+            else:
+                window.stale = True
+        if window.stale:
+            WINDOW_STATS.misses += 1
+            return None
+        WINDOW_STATS.hits += 1
+        return window.entries()
+
+    async def _take_session(self, user_id: str) -> Optional[SessionSnapshot]:
+        """Instantánea precargada si sigue siendo válida (sólo se usa una vez)"""
+        task, self._session_task = self._session_task, None
+        if task is None:
+            return None
+        try:
+            session = await task
+        except Exception as e:
+            logger.error(f"Error en la precarga de sesión: {str(e)}")
+            return None
+        if session.user_id != user_id or not session.is_fresh():
+            return None
+        return session
+
+    @traced("orchestrator.update_profile")
+    async def update_profile(self, user_id: str, profile_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Actualiza el perfil y recalcula en los planes vigentes sólo lo que depende de los
+        campos cambiados; devuelve un mensaje por plan actualizado
+        """
+        previous = await self.memory_service.get_user_profile(user_id)
+        profile = await self.memory_service.update_user_profile(user_id, profile_data)
+        if profile is None:
+            return []
+        # La precarga tiene el perfil anterior
+        self.cancel_prefetch()
+
+        changed = [field for field, value in profile_data.items() if previous.get(field) != value]
+        messages = []
+        for plan, patch in await self.plan_generator.update_plans_for_profile(user_id, changed, profile):
+            messages.append({
+                "agent": "plans",
+                "message": "He actualizado tu plan con los cambios de tu perfil.",
+                # Los clientes v2 reciben sólo el delta respecto al plan que ya tienen (ws_protocol.py)
+                "plan": plan,
+                "metadata": {"updated_fields": sorted(field for field in patch if field != "updated_at")},
+                "timestamp": datetime.utcnow().isoformat()
+            })
+        return messages
 
+    @traced("orchestrator.process_message")
     async def process_message(self, user_id: str, message: str, context: Dict[str, Any] = None) -> Dict[str, Any]:
         """Procesa un mensaje y lo enruta al agente apropiado"""
+        start = time.perf_counter()
+        agent_type = "unrouted"
         try:
-            # Cargar contexto de conversación
-            conversation_context = await self.memory_service.get_conversation_context(user_id)
-            
-            # Cargar perfil de usuario
-            user_profile = await self.memory_service.get_user_profile(user_id)
+            # Contexto de conversación, perfil y objetivos: precargados al conectar, de la
+            # ventana local y la caché de perfiles o en una sola ida y vuelta a Redis
+            targets = None
+            session = await self._take_session(user_id)
+            # La ventana parte de la precarga e incluye los turnos escritos desde entonces
+            conversation_context = await self._window_context(user_id)
+            if conversation_context is None:
+                conversation_context, user_profile, seq = await self.memory_service.load_session(user_id)
+                await self._open_window(user_id, conversation_context, seq)
+            elif session is not None:
+                user_profile, targets = session.profile, session.targets
+            else:
+                user_profile = await self.memory_service.get_user_profile(user_id)
             
             # Determinar el agente apropiado
-            agent_type = self._determine_agent(message, conversation_context)
+            with tracer.start_as_current_span("orchestrator.route"):
+                agent_type = self._determine_agent(message, conversation_context)
             
             logger.info(f"Enrutando a {agent_type} para usuario {user_id}")
             
-            # Procesar con el agente seleccionado
-            if agent_type == "nutrition":
-                response = await self.nutrition_agent.process(
-                    message, user_profile, conversation_context
-                )
-            elif agent_type == "fitness":
-                response = await self.fitness_agent.process(
-                    message, user_profile, conversation_context
-                )
-            elif agent_type == "research":
-                response = await self.research_agent.process(
+            # Control de admisión: token buckets por usuario y globales y plazas de concurrencia
+            admission = await self.rate_limiter.acquire(user_id, agent_type)
+            if not admission.allowed:
+                logger.warning(f"Mensaje de {user_id} rechazado ({admission.reason}), reintentar en {admission.retry_after}s")
+                agent_type = "rate_limited"
+                return self._rate_limited_response(admission)
+            
+            try:
+                # Procesar con el agente seleccionado
+                agent = self.get_agent(agent_type)
+                response = await agent.process(
                     message, user_profile, conversation_context
                 )
-            else:  # personalization
-                response = await self.personalization_agent.process(
-                    message, user_profile, conversation_context
+                
+                # Actualizar memoria de conversación
+                await self.memory_service.update_conversation(
+                    user_id, message, response["content"], agent_type
                 )
-            
-            # Actualizar memoria de conversación
-            await self.memory_service.update_conversation(
-                user_id, message, response["content"], agent_type
-            )
-            
-            # Generar plan si es necesario
-            if response.get("generate_plan"):
-                plan = await self.plan_generator.generate_plan(
-                    user_id, response["plan_type"], response["plan_data"]
-                )
-                response["plan"] = plan
+                
+                # Generar plan si es necesario
+                if response.get("generate_plan"):
+                    plan = await self.plan_generator.generate_plan(
+                        user_id, response["plan_type"], response["plan_data"],
+                        user_profile=user_profile, targets=targets
+                    )
+                    response["plan"] = plan
+            finally:
+                await admission.release()
             
             return {
                 "agent": agent_type,
@@ -91,12 +240,28 @@ class AgentOrchestrator:
             
         except Exception as e:
             logger.error(f"Error procesando mensaje: {str(e)}")
+            agent_type = "error"
             return {
                 "agent": "error",
                 "message": "Lo siento, ha ocurrido un error procesando tu consulta. Por favor, inténtalo de nuevo.",
                 "error": str(e),
                 "timestamp": datetime.utcnow().isoformat()
             }
+        finally:
+            PROCESS_MESSAGE_SECONDS.labels(agent_type).observe(time.perf_counter() - start)
+            # Publicar los contadores de caché acumulados durante el mensaje
+            flush_cache_counts()
+
+    def _rate_limited_response(self, admission) -> Dict[str, Any]:
+        """Respuesta estructurada de rechazo con el tiempo de espera sugerido"""
+        return {
+            "agent": "rate_limited",
+            "message": "Has enviado demasiadas consultas seguidas. Espera unos segundos e inténtalo de nuevo.",
+            "error": "rate_limited",
+            "reason": admission.reason,
+            "retry_after": admission.retry_after,
+            "timestamp": datetime.utcnow().isoformat()
+        }
 
     def _determine_agent(self, message: str, context: List[Dict]) -> str:
         """Determina qué agente debe procesar el mensaje"""
@@ -5,10 +5,16 @@
 from typing import Dict, Any, List
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
+from ..services.prompt_builder import PromptBuilder
+from ..services.tracing import traced
+from .callbacks import LLMMetricsCallback, LLMTracingCallback
 
 class PersonalizationAgent:
     def __init__(self):
-        self.llm = ChatOpenAI(temperature=0.4, model="gpt-3.5-turbo")
+        self.llm = ChatOpenAI(
+            temperature=0.4, model="gpt-3.5-turbo", callbacks=[LLMMetricsCallback("personalization"), LLMTracingCallback("personalization")]
+        )
+        self.prompt_builder = PromptBuilder()
         
         self.prompt = ChatPromptTemplate.from_messages([
             ("system", """Eres un asistente especializado en recopilar información personal 
@@ -28,6 +34,7 @@ class PersonalizationAgent:
             ("assistant", "")
         ])
 
+    @traced("agent.personalization")
     async def process(self, message: str, user_profile: Dict, context: List[Dict]) -> Dict[str, Any]:
         """Procesa consultas de personalización y configuración de perfil"""
         
@@ -62,14 +69,13 @@ class PersonalizationAgent:
     async def _handle_existing_user(self, message: str, user_profile: Dict, context: List[Dict]) -> str:
         """Maneja usuarios existentes"""
         
-        full_input = f"""
-        Información del usuario:
-        - Objetivos: {user_profile.get('goals', 'No especificados')}
-        - Edad: {user_profile.get('age', 'No especificada')}
-        - Nivel de actividad: {user_profile.get('activity_level', 'No especificado')}
-        - Restricciones: {user_profile.get('restrictions', 'Ninguna')}
-        
-        Mensaje del usuario: {message}
+        # Perfil, turnos relevantes y consulta dentro del presupuesto del agente; el bloque
+        # de perfil va primero para que el prefijo del prompt sea estable
+        prompt_input, _ = self.prompt_builder.build(
+            "personalization", user_profile.get("user_id"), message,
+            self._prepare_user_context(user_profile), context
+        )
+        full_input = f"""{prompt_input}
         
         Responde de manera personalizada y útil. Si el usuario quiere actualizar su información,
         haz preguntas específicas para obtener los datos necesarios.
@@ -81,6 +87,19 @@ class PersonalizationAgent:
         except Exception as e:
             return f"Hola! ¿En qué puedo ayudarte hoy con tu nutrición y fitness? (Error: {str(e)})"
 
+    def _prepare_user_context(self, user_profile: Dict) -> str:
+        """Prepara el perfil del usuario (cacheado por versión del perfil)"""
+        return self.prompt_builder.render_profile("personalization", user_profile, self._render_user_context)
+
+    def _render_user_context(self, user_profile: Dict) -> str:
+        """Renderiza la información del usuario relevante para personalización"""
+        return " | ".join([
+            f"Objetivos: {user_profile.get('goals', 'No especificados')}",
+            f"Edad: {user_profile.get('age', 'No especificada')}",
+            f"Nivel de actividad: {user_profile.get('activity_level', 'No especificado')}",
+            f"Restricciones: {user_profile.get('restrictions', 'Ninguna')}",
+        ])
+
     def _needs_profile_update(self, message: str) -> bool:
         """Determina si el mensaje requiere actualización de perfil"""
         update_keywords = [
@@ -8,11 +8,18 @@ from langchain.agents import AgentExecutor, create_openai_tools_agent
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from ..tools.research_tools import PubMedTool, HealthlineTool, ExamineTool
+from ..services.profiling import run_profiled
+from ..services.prompt_builder import PromptBuilder
+from ..services.tracing import traced
+from .callbacks import LLMMetricsCallback, LLMTracingCallback
 
 
 class ResearchAgent:
     def __init__(self):
-        self.llm = ChatOpenAI(temperature=0.2, model="gpt-3.5-turbo")
+        self.llm = ChatOpenAI(
+            temperature=0.2, model="gpt-3.5-turbo", callbacks=[LLMMetricsCallback("research"), LLMTracingCallback("research")]
+        )
+        self.prompt_builder = PromptBuilder()
         
         self.tools = [
             PubMedTool(),
@@ -40,13 +47,20 @@ class ResearchAgent:
         self.agent = create_openai_tools_agent(self.llm, self.tools, self.prompt)
         self.executor = AgentExecutor(agent=self.agent, tools=self.tools, verbose=True)
 
+    @traced("agent.research")
     async def process(self, message: str, user_profile: Dict, context: List[Dict]) -> Dict[str, Any]:
         """Procesa consultas de investigación científica"""
         
+        user_context = self._prepare_user_context(user_profile)
+        full_input, prompt_metrics = self.prompt_builder.build(
+            "research", user_profile.get("user_id"), message, user_context, context
+        )
+        
         try:
+            # run_profiled: si la petición se está perfilando, también este hilo
             result = await asyncio.to_thread(
-                self.executor.invoke,
-                {"input": message}
+                run_profiled, self.executor.invoke,
+                {"input": full_input}
             )
             
             return {
@@ -54,7 +68,8 @@ class ResearchAgent:
                 "generate_plan": False,
                 "metadata": {
                     "tools_used": [tool.name for tool in self.tools],
-                    "research_based": True
+                    "research_based": True,
+                    "prompt": prompt_metrics
                 }
             }
             
@@ -63,4 +78,17 @@ class ResearchAgent:
                 "content": f"Lo siento, ha ocurrido un error buscando información científica: {str(e)}",
                 "generate_plan": False,
                 "metadata": {"error": str(e)}
-            }
\ No newline at end of file
+            }
+
+    def _prepare_user_context(self, user_profile: Dict) -> str:
+        """Prepara el perfil del usuario para el agente (cacheado por versión del perfil)"""
+        return self.prompt_builder.render_profile("research", user_profile, self._render_user_context)
+
+    def _render_user_context(self, user_profile: Dict) -> str:
+        """Renderiza los campos del perfil que acotan la búsqueda de evidencia"""
+        return " | ".join([
+            f"Objetivos: {user_profile.get('goals', 'No especificados')}",
+            f"Edad: {user_profile.get('age', 'No especificada')}",
+            f"Nivel de fitness: {user_profile.get('fitness_level', 'No especificado')}",
+            f"Restricciones: {user_profile.get('restrictions', 'Ninguna')}",
+        ])
@@ -0,0 +1,165 @@
+# ========================================
+# app/api/plans.py - API de Planes
+# ========================================
+#
+# GET /api/plans/{user_id}/{plan_type}            resumen de los planes (sin plan_data),
+#                                                 más recientes primero, paginado por cursor
+# GET /api/plans/{user_id}/{plan_type}/active     plan activo completo
+# GET /api/plans/{user_id}/{plan_type}/{plan_id}  plan completo
+#
+# La paginación es por clave (user_id, created_at, id) y no por OFFSET: cada página
+# es un rango del índice ix_<tabla>_user_created. El plan activo sale del índice
+# parcial ix_<tabla>_user_active. Las respuestas llevan ETag; con If-None-Match el
+# detalle se resuelve con las columnas de fecha, sin leer plan_data. La compresión
+# la hace GZipMiddleware (ver main.py).
+#
+# SQLAlchemy y los modelos se importan al primer uso: el servidor arranca sin ellos.
+
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+import base64
+import hashlib
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+
+from ..services.plan_store import plan_model
+from ..services.ws_protocol import encode_json
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Columnas de resumen de cada tipo de plan (todas menos plan_data)
+SUMMARY_COLUMNS = {
+    "nutrition": ("plan_id", "name", "duration", "daily_calories", "protein_g", "carbs_g",
+                  "fats_g", "fiber_g", "is_active", "created_at", "updated_at"),
+    "fitness": ("plan_id", "name", "duration", "fitness_level", "weekly_frequency",
+                "is_active", "created_at", "updated_at"),
+}
+MAX_PAGE_SIZE = 100
+
+
+def get_session() -> Iterator[Any]:
+    from ..database.connection import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def _model(plan_type: str):
+    model = plan_model(plan_type) if plan_type in SUMMARY_COLUMNS else None
+    if model is None:
+        raise HTTPException(status_code=404, detail=f"Tipo de plan no soportado: {plan_type}")
+    return model
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Cursor no válido")
+
+
+def _etag(*parts: Any) -> str:
+    # Débil: el cuerpo puede ir comprimido o no con el mismo ETag
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    requested = request.headers.get("if-none-match", "")
+    return etag in (tag.strip() for tag in requested.split(",")) or requested.strip() == "*"
+
+
+def _json(body: Dict[str, Any], etag: str) -> Response:
+    return Response(content=encode_json(body), media_type="application/json",
+                    headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+
+def _summary(row, columns) -> Dict[str, Any]:
+    return {column: getattr(row, column) for column in columns}
+
+
+@router.get("/{user_id}/{plan_type}")
+def list_plans(user_id: str, plan_type: str, request: Request,
+               limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+               cursor: Optional[str] = None, active: Optional[bool] = None,
+               session=Depends(get_session)):
+    """Resumen de los planes del usuario, del más reciente al más antiguo"""
+    from sqlalchemy import and_, or_
+
+    model = _model(plan_type)
+    columns = SUMMARY_COLUMNS[plan_type]
+    # Proyección: sólo las columnas de resumen (y id para el cursor), nunca plan_data
+    query = session.query(model.id, *(getattr(model, column) for column in columns)).filter(
+        model.user_id == user_id
+    )
+    if active is not None:
+        query = query.filter(model.is_active == (1 if active else 0))
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < row_id),
+        ))
+    # Una fila de más indica si hay otra página
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    items: List[Dict[str, Any]] = [_summary(row, columns) for row in rows]
+
+    etag = _etag(user_id, plan_type, cursor, active, limit,
+                 *((row.plan_id, row.updated_at or row.created_at, row.is_active) for row in rows))
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return _json({"items": items, "next_cursor": next_cursor}, etag)
+
+
+def _plan_response(request: Request, session, model, plan_type: str, query) -> Response:
+    """Detalle de un plan: primero sólo las fechas (ETag) y plan_data sólo si hace falta"""
+    version = query.with_entities(model.id, model.created_at, model.updated_at).first()
+    if version is None:
+        raise HTTPException(status_code=404, detail="Plan no encontrado")
+    etag = _etag(version.id, version.updated_at or version.created_at)
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    columns = SUMMARY_COLUMNS[plan_type]
+    row = session.query(*(getattr(model, column) for column in columns), model.plan_data).filter(
+        model.id == version.id
+    ).one()
+    body = _summary(row, columns)
+    body["plan"] = row.plan_data
+    return _json(body, etag)
+
+
+@router.get("/{user_id}/{plan_type}/active")
+def get_active_plan(user_id: str, plan_type: str, request: Request, session=Depends(get_session)):
+    """Plan activo del usuario (índice parcial sobre is_active = 1)"""
+    model = _model(plan_type)
+    query = session.query(model).filter(model.user_id == user_id, model.is_active == 1).order_by(
+        model.created_at.desc()
+    )
+    return _plan_response(request, session, model, plan_type, query)
+
+
+@router.get("/{user_id}/{plan_type}/{plan_id}")
+def get_plan(user_id: str, plan_type: str, plan_id: str, request: Request, session=Depends(get_session)):
+    """Plan completo por su id"""
+    model = _model(plan_type)
+    query = session.query(model).filter(model.plan_id == plan_id, model.user_id == user_id)
+    return _plan_response(request, session, model, plan_type, query)
@@ -0,0 +1,189 @@
+# ========================================
+# app/application.py - Construcción de la Aplicación FastAPI
+# ========================================
+#
+# create_app monta middlewares, routers, /metrics, el WebSocket /ws/{user_id} y,
+# si se indica su directorio, el frontend estático. app/main.py la construye con
+# todos los routers; los benchmarks (benchmarks/loadtest/bench_app.py) sólo con
+# los que no necesitan nada externo.
+
+from fastapi import FastAPI, APIRouter, WebSocket, WebSocketDisconnect
+from fastapi.staticfiles import StaticFiles
+from fastapi.responses import HTMLResponse, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from contextlib import asynccontextmanager
+import asyncio
+import os
+from typing import Iterable, Optional, Tuple
+import logging
+
+from .services.memory_service import MemoryService
+from .agents.orchestrator import AgentOrchestrator
+from .services.metrics import render_metrics
+from .services.connection_registry import ConnectionRegistry
+from .database.redis_connection import close_async_redis
+from .tools.resilience import close_http_clients
+from .services.api_cache import api_cache
+from .services.session_prefetch import PREFETCH_ON_CONNECT
+from .services.profile_cache import profile_cache
+from .services.tiering import tiering_job
+from .services.tracing import setup_tracing, tracer
+from .services.profiling import ProfilingMiddleware, request_profiler
+
+# Configuración de logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Trazas OpenTelemetry (TRACING_EXPORTER / TRACING_SAMPLE_RATE) y trace_id en los logs
+setup_tracing()
+
+# Registro de conexiones WebSocket: varias por usuario y reparto entre workers por Redis pub/sub
+manager = ConnectionRegistry()
+
+# Precarga opcional tras el arranque (agentes y, si se pide, esquema de BD)
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+WARMUP_DELAY = float(os.getenv("WARMUP_DELAY", "0.5"))
+DB_CREATE_ALL_ON_STARTUP = os.getenv("DB_CREATE_ALL_ON_STARTUP", "false").lower() == "true"
+# Respuestas HTTP a partir de este tamaño (bytes) van comprimidas si el cliente lo acepta
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1000"))
+
+async def warm_up():
+    """Precarga en hilos de fondo lo que se cargaría de forma diferida en el primer mensaje"""
+    # Esperar a que uvicorn termine el arranque y empiece a aceptar conexiones
+    await asyncio.sleep(WARMUP_DELAY)
+    start = asyncio.get_running_loop().time()
+    try:
+        if DB_CREATE_ALL_ON_STARTUP:
+            from .database.init_db import init_db
+            await asyncio.to_thread(init_db)
+        if WARMUP_ON_STARTUP:
+            await asyncio.to_thread(AgentOrchestrator.warm_up)
+        logger.info(f"Precarga completada en {asyncio.get_running_loop().time() - start:.2f}s")
+    except Exception as e:
+        logger.error(f"Error en la precarga: {str(e)}")
+
+# Startup event
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # El esquema se crea con `python -m app.database.init_db`, no en el arranque
+    memory_service = MemoryService()
+    try:
+        await manager.pubsub.start()
+    except Exception as e:
+        # Sin pub/sub cada worker sólo entrega a sus propias conexiones
+        logger.error(f"Error iniciando pub/sub: {str(e)}")
+    # Invalidación de la caché local de perfiles cuando otro worker los modifica
+    await profile_cache.start()
+    warmup_task = asyncio.create_task(warm_up()) if WARMUP_ON_STARTUP or DB_CREATE_ALL_ON_STARTUP else None
+    # Recarga programada de las respuestas de APIs más pedidas
+    api_cache.start_scheduler()
+    # Bajada periódica a la BD de los datos de usuarios inactivos
+    tiering_job.start_scheduler()
+    
+    yield
+    
+    # Cleanup
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
+    await profile_cache.stop()
+    await manager.pubsub.stop()
+    await api_cache.stop_scheduler()
+    await tiering_job.stop_scheduler()
+    await close_async_redis()
+    await close_http_clients()
+    await memory_service.close()
+
+
+async def metrics():
+    """Métricas en formato Prometheus"""
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
+
+
+async def websocket_endpoint(websocket: WebSocket, user_id: str):
+    await manager.connect(websocket, user_id)
+    protocol = manager.protocol(websocket)
+    orchestrator = AgentOrchestrator()
+    if PREFETCH_ON_CONNECT:
+        # Perfil, contexto y objetivos listos antes del primer mensaje
+        orchestrator.start_prefetch(user_id)
+    
+    try:
+        while True:
+            # Recibir mensaje del usuario (JSON o MessagePack según el subprotocolo negociado)
+            message_data = await protocol.receive(websocket)
+            
+            # Una traza por mensaje: raíz de los spans de orquestador, agentes, LLM y herramientas
+            with tracer.start_as_current_span("websocket.message", attributes={"user_id": user_id}):
+                logger.info(f"Mensaje recibido de {user_id}: {message_data}")
+                
+                # Cambios de perfil: se recalculan sólo los campos afectados de los planes vigentes
+                if message_data.get("type") == "profile_update":
+                    for update in await orchestrator.update_profile(user_id, message_data.get("profile") or {}):
+                        await manager.send_message(update, user_id)
+                    continue
+                
+                # Procesar con el orquestador (la corrutina se crea justo antes de esperarla)
+                def process():
+                    return orchestrator.process_message(
+                        user_id=user_id,
+                        message=message_data["message"],
+                        context=message_data.get("context", {})
+                    )
+                
+                # Perfilado bajo demanda: sólo con un profile_token válido y dentro del límite
+                profile_token = message_data.get("profile_token")
+                if profile_token and request_profiler.authorize(profile_token):
+                    inline = bool(message_data.get("profile_inline"))
+                    async with request_profiler.profile(f"ws-{user_id}", inline=inline) as profile:
+                        response = await process()
+                    response.setdefault("metadata", {})["profile"] = profile
+                else:
+                    response = await process()
+                
+                # Enviar respuesta: los rechazos por límite sólo al socket que envió el mensaje
+                if response.get("error") == "rate_limited":
+                    await protocol.send(websocket, response)
+                else:
+                    await manager.send_message(response, user_id)
+            
+    except WebSocketDisconnect:
+        logger.info(f"Usuario {user_id} desconectado")
+    finally:
+        # También si el bucle termina por un error: no dejar sockets muertos en el registro
+        await orchestrator.close()
+        await manager.disconnect(websocket, user_id)
+
+
+def create_app(routers: Iterable[Tuple[APIRouter, str, str]] = (),
+               frontend_dir: Optional[str] = "frontend") -> FastAPI:
+    """Aplicación con los routers (router, prefijo, tag) dados y, si frontend_dir no es None, el frontend"""
+    app = FastAPI(
+        title="Nutrition & Fitness AI Agent",
+        description="Agente especializado en nutrición y fitness con IA",
+        version="1.0.0",
+        lifespan=lifespan
+    )
+
+    # Perfilado bajo demanda de peticiones HTTP (cabecera X-Profile-Token)
+    app.add_middleware(ProfilingMiddleware)
+
+    # Compresión de respuestas HTTP grandes (planes completos); los WebSockets no pasan por aquí
+    app.add_middleware(GZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE)
+
+    if frontend_dir is not None:
+        # Montar archivos estáticos
+        app.mount("/static", StaticFiles(directory=frontend_dir), name="static")
+
+        @app.get("/")
+        async def get_frontend():
+            with open(os.path.join(frontend_dir, "index.html")) as f:
+                return HTMLResponse(f.read())
+
+    # Incluir routers
+    for router, prefix, tag in routers:
+        app.include_router(router, prefix=prefix, tags=[tag])
+
+    app.add_api_route("/metrics", metrics, methods=["GET"])
+    app.add_api_websocket_route("/ws/{user_id}", websocket_endpoint)
+    return app
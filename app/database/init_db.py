@@ -0,0 +1,27 @@
+# ========================================
+# app/database/init_db.py - Creación del Esquema de BD
+# ========================================
+#
+# El esquema ya no se crea al arrancar la app: se ejecuta como paso de despliegue
+# (python -m app.database.init_db) o, si DB_CREATE_ALL_ON_STARTUP=true, en segundo
+# plano después de que el servidor empiece a aceptar conexiones.
+
+import logging
+
+from .connection import Base, engine
+
+logger = logging.getLogger(__name__)
+
+
+def init_db():
+    """Importa los modelos y crea las tablas que falten"""
+    # Registrar los modelos en Base.metadata antes de create_all
+    from ..models import user, plans, cold_data, conversation_turn  # noqa: F401
+
+    Base.metadata.create_all(bind=engine)
+    logger.info("Esquema de base de datos verificado")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    init_db()
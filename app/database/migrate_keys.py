@@ -0,0 +1,143 @@
+# ========================================
+# app/database/migrate_keys.py - Migración de Claves Redis al Esquema con Hash Tags
+# ========================================
+#
+# Paso de despliegue (python -m app.database.migrate_keys): convierte las claves con
+# el formato anterior (conversation:<id>, profile:<id>, plan:<plan_id>,
+# plans:user:<id>, ...) a las de redis_keys.py. Copia con DUMP/RESTORE conservando
+# el TTL, así que sirve en el mismo Redis y para pasar de un Redis único a un
+# clúster (--source con el Redis antiguo; el destino es REDIS_URL/REDIS_CLUSTER).
+# Si la clave nueva ya existe (la app la escribió después) no se sobrescribe.
+# También renombra las claves de la tabla cold_data (datos fríos, ver tiering.py).
+#
+# Se puede repetir: sólo encuentra claves con el formato anterior.
+
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+import argparse
+import logging
+
+from .redis_connection import REDIS_URL, get_redis
+from .redis_keys import (
+    ACTIVITY_KEY, conversation_key, conversation_seq_key, plan_key, plans_index_key, profile_key
+)
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+# Prefijo antiguo -> clave nueva a partir del resto de la clave
+USER_KEY_FAMILIES = (
+    ("conversation_seq:", conversation_seq_key),
+    ("conversation:", conversation_key),
+    ("profile:", profile_key),
+    ("plans:user:", plans_index_key),
+    ("plan:", plan_key),
+)
+# Claves compartidas: mismo nombre; sólo se copian si el destino es otro Redis
+SHARED_KEY_PREFIXES = ("api_cache:", ACTIVITY_KEY)
+
+
+def new_key(key: str, copy_shared: bool = False) -> Optional[str]:
+    """Nombre en el esquema nuevo de una clave antigua, o None si no hay que migrarla"""
+    for prefix, build in USER_KEY_FAMILIES:
+        if key.startswith(prefix):
+            rest = key[len(prefix):]
+            # Las claves nuevas llevan el hash tag justo después del prefijo
+            return None if not rest or rest.startswith("{") else build(rest)
+    if copy_shared and key.startswith(SHARED_KEY_PREFIXES) and not key.endswith(":lock"):
+        return key
+    return None
+
+
+def _copy_batch(source, target, batch: List[Tuple[bytes, str]], delete_source: bool, stats: Counter):
+    pipe = source.pipeline(transaction=False)
+    for old, _ in batch:
+        pipe.dump(old)
+        pipe.pttl(old)
+    results = pipe.execute()
+
+    pending = []
+    pipe = target.pipeline(transaction=False)
+    for (old, new), dumped, pttl in zip(batch, results[::2], results[1::2]):
+        if dumped is None or pttl == -2:
+            continue  # caducó entre SCAN y DUMP
+        # RESTORE recibe el TTL en ms; 0 = sin caducidad
+        pipe.restore(new, max(pttl, 0), dumped)
+        pending.append(old)
+    done = []
+    for old, result in zip(pending, pipe.execute(raise_on_error=False)):
+        if not isinstance(result, Exception):
+            stats["copied"] += 1
+            done.append(old)
+        elif "BUSYKEY" in str(result):
+            # La app ya escribió la clave nueva: la antigua está obsoleta
+            stats["existing"] += 1
+            done.append(old)
+        else:
+            stats["errors"] += 1
+            logger.error(f"Error copiando {old!r}: {str(result)}")
+
+    if delete_source and done:
+        pipe = source.pipeline(transaction=False)
+        for old in done:
+            pipe.delete(old)
+        pipe.execute()
+
+
+def migrate_keys(source, target, delete_source: bool = True, copy_shared: bool = False,
+                 batch_size: int = BATCH_SIZE, dry_run: bool = False) -> Dict[str, int]:
+    """Copia al esquema nuevo las claves antiguas de source; devuelve contadores"""
+    stats: Counter = Counter()
+    batch: List[Tuple[bytes, str]] = []
+    for key in source.scan_iter(count=batch_size):
+        name = key.decode() if isinstance(key, bytes) else key
+        target_name = new_key(name, copy_shared)
+        if target_name is None:
+            continue
+        if dry_run:
+            logger.info(f"{name} -> {target_name}")
+            stats["found"] += 1
+            continue
+        batch.append((key, target_name))
+        if len(batch) >= batch_size:
+            _copy_batch(source, target, batch, delete_source, stats)
+            batch = []
+            logger.info(f"Claves migradas: {dict(stats)}")
+    if batch:
+        _copy_batch(source, target, batch, delete_source, stats)
+    return dict(stats)
+
+
+def migrate_cold_data() -> int:
+    """Renombra en cold_data las claves guardadas con el formato anterior"""
+    from .connection import SessionLocal
+    from ..models.cold_data import ColdData
+
+    renamed = 0
+    with SessionLocal() as session:
+        for row in session.query(ColdData).filter(~ColdData.key.contains("{")):
+            family, _, rest = row.key.partition(":")
+            row.key = conversation_key(row.user_id) if family == "conversation" else plan_key(rest, row.user_id)
+            renamed += 1
+        session.commit()
+    return renamed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migra las claves Redis al esquema con hash tags")
+    parser.add_argument("--source", help="Redis con las claves antiguas (por defecto, REDIS_URL)")
+    parser.add_argument("--keep-source", action="store_true", help="No borrar las claves antiguas")
+    parser.add_argument("--skip-cold-data", action="store_true", help="No tocar la tabla cold_data")
+    parser.add_argument("--dry-run", action="store_true", help="Sólo listar las claves a migrar")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    target = get_redis()
+    other_source = args.source is not None and args.source != REDIS_URL
+    source = get_redis(url=args.source, cluster=False) if other_source else target
+    stats = migrate_keys(source, target, delete_source=not args.keep_source,
+                         copy_shared=other_source, dry_run=args.dry_run)
+    logger.info(f"Migración de claves terminada: {stats}")
+    if not args.skip_cold_data and not args.dry_run:
+        logger.info(f"cold_data: {migrate_cold_data()} claves renombradas")
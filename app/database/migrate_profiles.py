@@ -0,0 +1,121 @@
+# ========================================
+# app/database/migrate_profiles.py - Migración de Perfiles de Redis a PostgreSQL
+# ========================================
+#
+# Paso de despliegue (python -m app.database.migrate_profiles), después de init_db:
+#   1. adapta user_profiles al esquema actual (user_id de texto y único, version) y
+#      las tablas de planes (user_id de texto, índices de la API de planes);
+#   2. copia a la BD por lotes todos los perfiles profile:<id> que hay en Redis,
+#      con un upsert por lote.
+# Se puede repetir sin riesgo: una fila sólo se actualiza si el perfil de Redis trae
+# una versión más nueva. Sirve también para llevar a la BD los perfiles que se
+# guardaron sólo en Redis mientras la BD no estaba disponible.
+
+from typing import Any, Dict, List, Tuple
+import logging
+import os
+
+from sqlalchemy import text
+
+from .connection import engine
+from .init_db import init_db
+from .redis_connection import get_redis
+from .redis_keys import user_from_key
+from ..services.codecs import CODECS
+from ..services.profile_store import ProfileStore, profile_store
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("PROFILE_MIGRATION_BATCH_SIZE", "500"))
+
+
+def upgrade_schema():
+    """Convierte las tablas creadas con el esquema anterior (sólo PostgreSQL)"""
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.begin() as conn:
+        conn.execute(text(
+            "ALTER TABLE user_profiles ALTER COLUMN user_id TYPE VARCHAR USING user_id::varchar"
+        ))
+        conn.execute(text(
+            "ALTER TABLE user_profiles ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0"
+        ))
+        indexdef = conn.execute(text(
+            "SELECT indexdef FROM pg_indexes WHERE indexname = 'ix_user_profiles_user_id'"
+        )).scalar()
+        if not indexdef or "UNIQUE" not in indexdef:
+            # El upsert necesita un índice único sobre user_id
+            conn.execute(text("DROP INDEX IF EXISTS ix_user_profiles_user_id"))
+            conn.execute(text("CREATE UNIQUE INDEX ix_user_profiles_user_id ON user_profiles (user_id)"))
+        # Las tablas de planes usan el mismo user_id de texto y los índices de app/api/plans.py
+        for table in ("nutrition_plans", "workout_plans"):
+            conn.execute(text(
+                f"ALTER TABLE {table} ALTER COLUMN user_id TYPE VARCHAR USING user_id::varchar"
+            ))
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{table}_user_created ON {table} (user_id, created_at, id)"
+            ))
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{table}_user_active ON {table} (user_id, created_at) "
+                f"WHERE is_active = 1"
+            ))
+    logger.info("Esquema de user_profiles y de las tablas de planes actualizado")
+
+
+def _decode_batch(keys: List[bytes], values: List[Any]) -> List[Dict[str, Any]]:
+    codec = CODECS["profile"]
+    profiles: Dict[str, Dict[str, Any]] = {}
+    for key, raw in zip(keys, values):
+        if not raw:
+            continue  # caducó entre SCAN y GET
+        key = key.decode()
+        # profile:{<id>} o, antes de migrate_keys, profile:<id>
+        user_id = user_from_key(key) or key.split(":", 1)[1]
+        try:
+            profile = codec.decode(raw)
+        except ValueError:
+            logger.warning(f"Perfil de {user_id} ilegible en Redis; no se migra")
+            continue
+        if not profile:
+            continue  # marca de usuario sin perfil
+        profile["user_id"] = user_id
+        # SCAN puede devolver una clave dos veces y el upsert no admite filas repetidas
+        profiles[user_id] = profile
+    return list(profiles.values())
+
+
+def migrate_profiles(redis_client, store: ProfileStore = profile_store,
+                     batch_size: int = BATCH_SIZE) -> Tuple[int, int]:
+    """Copia los perfiles de Redis a la BD; devuelve (perfiles leídos, filas escritas)"""
+    read = written = 0
+    keys: List[bytes] = []
+
+    def flush():
+        nonlocal read, written
+        # GET en pipeline y no MGET: en Redis Cluster cada perfil está en el slot de su usuario
+        pipe = redis_client.pipeline(transaction=False)
+        for key in keys:
+            pipe.get(key)
+        profiles = _decode_batch(keys, pipe.execute())
+        read += len(profiles)
+        written += store.save_many(profiles)
+        keys.clear()
+
+    for key in redis_client.scan_iter(match="profile:*", count=batch_size):
+        keys.append(key)
+        if len(keys) >= batch_size:
+            flush()
+            logger.info(f"Perfiles migrados: {written}/{read}")
+    if keys:
+        flush()
+    return read, written
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    upgrade_schema()
+    client = get_redis()
+    read, written = migrate_profiles(client)
+    logger.info(f"Migración terminada: {read} perfiles en Redis, {written} escritos en la BD "
+                f"(el resto ya estaba al día)")
@@ -0,0 +1,53 @@
+# ========================================
+# app/database/redis_connection.py - Conexión a Redis
+# ========================================
+#
+# Con REDIS_CLUSTER=true los clientes son de Redis Cluster (REDIS_URL apunta a
+# cualquier nodo; el resto se descubren). El esquema de claves de redis_keys.py
+# mantiene en un mismo slot las operaciones que tocan varias claves. Pub/sub usa
+# una conexión normal al nodo de REDIS_URL: PUBLISH llega a todo el clúster.
+
+import os
+from typing import Dict, Tuple
+
+import redis
+import redis.asyncio as aioredis
+from redis.asyncio.cluster import RedisCluster as AsyncRedisCluster
+from redis.cluster import RedisCluster
+
+# En Render REDIS_URL apunta a la instancia gestionada
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_CLUSTER = os.getenv("REDIS_CLUSTER", "false").lower() == "true"
+
+_async_clients: Dict[Tuple[bool, bool], aioredis.Redis] = {}
+
+
+def get_redis(decode_responses: bool = False, url: str = REDIS_URL, cluster: bool = REDIS_CLUSTER):
+    """Cliente Redis síncrono nuevo (de clúster si REDIS_CLUSTER=true)"""
+    if cluster:
+        return RedisCluster.from_url(url, decode_responses=decode_responses)
+    return redis.Redis.from_url(url, decode_responses=decode_responses)
+
+
+def get_async_redis(decode_responses: bool = True, node: bool = False) -> aioredis.Redis:
+    """
+    Cliente Redis asíncrono compartido por el proceso (pool de conexiones propio).
+
+    Con decode_responses=False devuelve bytes: para valores serializados con codecs.py.
+    Con node=True es siempre una conexión al nodo de REDIS_URL (para pub/sub).
+    """
+    cluster = REDIS_CLUSTER and not node
+    client = _async_clients.get((decode_responses, cluster))
+    if client is None:
+        factory = AsyncRedisCluster if cluster else aioredis.Redis
+        client = _async_clients[(decode_responses, cluster)] = factory.from_url(
+            REDIS_URL, decode_responses=decode_responses
+        )
+    return client
+
+
+async def close_async_redis():
+    """Cierra los clientes asíncronos compartidos"""
+    for client in list(_async_clients.values()):
+        await client.close()
+    _async_clients.clear()
@@ -0,0 +1,91 @@
+# ========================================
+# app/database/redis_keys.py - Esquema de Claves Redis
+# ========================================
+#
+# Todas las claves de un usuario llevan su id como hash tag ({user_id}): en Redis
+# Cluster caen en el mismo slot, así que se pueden leer y escribir juntas con un
+# script Lua o un pipeline que va a un solo nodo. Los planes usan el tag de su
+# dueño, y los buckets y plazas de admisión de un usuario, el suyo. Las claves
+# compartidas (caché de APIs, actividad, stream de turnos) no llevan tag y se
+# reparten por el clúster, salvo los límites globales de admisión, que comparten
+# el tag {admission} porque se comprueban juntos en un script (ver rate_limiter.py).
+#
+# Las claves con el formato anterior (conversation:<id>, plan:<id>, ...) se
+# convierten con python -m app.database.migrate_keys.
+
+from typing import Optional
+
+# Usuarios por última actividad (puntuación = timestamp); ver tiering.py
+ACTIVITY_KEY = "activity:users"
+# Hash tag de los buckets y plazas globales del control de admisión
+GLOBAL_ADMISSION_TAG = "{admission}"
+# Stream con todos los turnos de conversación (ver turn_events.py) y el de los
+# eventos que los consumidores no han podido procesar
+TURN_STREAM_KEY = "events:turns"
+TURN_DEAD_LETTER_KEY = "events:turns:dead"
+
+
+def conversation_key(user_id: str) -> str:
+    return f"conversation:{{{user_id}}}"
+
+
+def conversation_seq_key(user_id: str) -> str:
+    return f"conversation_seq:{{{user_id}}}"
+
+
+def profile_key(user_id: str) -> str:
+    return f"profile:{{{user_id}}}"
+
+
+def profile_fill_key(user_id: str) -> str:
+    """Lock de la carga del perfil desde la BD"""
+    return f"profile_fill:{{{user_id}}}"
+
+
+def active_at_key(user_id: str) -> str:
+    """Última actividad del usuario, en su slot (la comprueba el script de tiering)"""
+    return f"active_at:{{{user_id}}}"
+
+
+def plans_index_key(user_id: str) -> str:
+    """Conjunto con los plan_id guardados de un usuario"""
+    return f"plans:{{{user_id}}}"
+
+
+def plan_owner(plan_id: str) -> str:
+    """user_id de un plan a partir de su id (<tipo>_<user_id>_<timestamp>, ver plan_generator.py)"""
+    parts = plan_id.split("_", 1)
+    if len(parts) == 2 and "_" in parts[1]:
+        return parts[1].rsplit("_", 1)[0]
+    return plan_id
+
+
+def plan_key(plan_id: str, user_id: Optional[str] = None) -> str:
+    return f"plan:{{{user_id or plan_owner(plan_id)}}}:{plan_id}"
+
+
+def api_cache_key(key: str) -> str:
+    return f"api_cache:{key}"
+
+
+def rate_bucket_key(agent_type: str, user_id: Optional[str] = None) -> str:
+    """Bucket del usuario (en su slot) o, sin user_id, el global del tipo de agente"""
+    if user_id is not None:
+        return f"ratelimit:{{{user_id}}}:{agent_type}"
+    return f"ratelimit:{GLOBAL_ADMISSION_TAG}:{agent_type}:global"
+
+
+def concurrency_key(user_id: Optional[str] = None) -> str:
+    """Plazas de ejecución del usuario (en su slot) o, sin user_id, las globales"""
+    if user_id is not None:
+        return f"concurrency:{{{user_id}}}"
+    return f"concurrency:{GLOBAL_ADMISSION_TAG}:global"
+
+
+def user_from_key(key: str) -> Optional[str]:
+    """user_id del hash tag de una clave de usuario (None si la clave no lleva tag)"""
+    start = key.find("{")
+    end = key.find("}", start + 1)
+    if start == -1 or end == -1:
+        return None
+    return key[start + 1:end]
@@ -0,0 +1,17 @@
+# ========================================
+# app/models/cold_data.py - Datos Fríos Bajados de Redis
+# ========================================
+
+from sqlalchemy import Column, String, DateTime, LargeBinary
+from sqlalchemy.sql import func
+from ..database.connection import Base
+
+class ColdData(Base):
+    __tablename__ = "cold_data"
+    
+    key = Column(String, primary_key=True)          # clave de Redis (conversation:<id>, plan:<id>)
+    user_id = Column(String, index=True, nullable=False)
+    kind = Column(String, nullable=False)           # conversation, plan
+    payload = Column(LargeBinary, nullable=False)   # valor compacto (ver app/services/cold_storage.py)
+    expires_at = Column(DateTime(timezone=True), index=True)  # cuándo habría caducado en Redis
+    demoted_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,20 @@
+# ========================================
+# app/models/conversation_turn.py - Histórico de Turnos de Conversación
+# ========================================
+
+from sqlalchemy import Column, String, DateTime, Text, Index
+from ..database.connection import Base
+
+class ConversationTurn(Base):
+    __tablename__ = "conversation_turns"
+
+    event_id = Column(String, primary_key=True)     # id de la entrada en el stream events:turns
+    user_id = Column(String, nullable=False)
+    agent = Column(String)
+    user_message = Column(Text)
+    agent_response = Column(Text)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("ix_conversation_turns_user_created", "user_id", "created_at"),
+    )
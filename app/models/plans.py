@@ -2,7 +2,7 @@
 # app/models/plans.py - Modelos de Planes
 # ========================================
 
-from sqlalchemy import Column, Integer, String, DateTime, JSON, Text, Float
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Text, Float, LargeBinary, Index, UniqueConstraint, text
 from sqlalchemy.sql import func
 from ..database.connection import Base
 
@@ -10,7 +10,7 @@ class NutritionPlan(Base):
     __tablename__ = "nutrition_plans"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, index=True, nullable=False)
+    user_id = Column(String, nullable=False)  # mismo id que en Redis y en user_profiles
     plan_id = Column(String, unique=True, index=True)  # ID único del plan
     name = Column(String)
     duration = Column(String)  # 7_days, 14_days, 30_days
@@ -24,11 +24,19 @@ class NutritionPlan(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    __table_args__ = (
+        # Paginación por (user_id, created_at); id desempata los creados en el mismo instante
+        Index("ix_nutrition_plans_user_created", "user_id", "created_at", "id"),
+        # Plan activo de un usuario: índice parcial, sólo las filas activas
+        Index("ix_nutrition_plans_user_active", "user_id", "created_at",
+              postgresql_where=text("is_active = 1"), sqlite_where=text("is_active = 1")),
+    )
+
 class WorkoutPlan(Base):
     __tablename__ = "workout_plans"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, index=True, nullable=False)
+    user_id = Column(String, nullable=False)
     plan_id = Column(String, unique=True, index=True)
     name = Column(String)
     duration = Column(String)  # 4_weeks, 8_weeks, 12_weeks
@@ -38,3 +46,30 @@ class WorkoutPlan(Base):
     is_active = Column(Integer, default=1)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    # Mismos índices que nutrition_plans
+    __table_args__ = (
+        Index("ix_workout_plans_user_created", "user_id", "created_at", "id"),
+        Index("ix_workout_plans_user_active", "user_id", "created_at",
+              postgresql_where=text("is_active = 1"), sqlite_where=text("is_active = 1")),
+    )
+
+class PlanVersion(Base):
+    """Historial de un plan por usuario y tipo: instantáneas y merge patches (ver plan_history.py)"""
+    __tablename__ = "plan_versions"
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String, nullable=False)
+    plan_type = Column(String, nullable=False)  # nutrition, fitness
+    version = Column(Integer, nullable=False)
+    plan_id = Column(String, nullable=False)
+    kind = Column(String, nullable=False)  # snapshot, patch
+    base_version = Column(Integer, nullable=False)  # instantánea de la que parte la cadena de patches
+    data = Column(LargeBinary, nullable=False)  # instantánea o patch respecto a la versión anterior
+    size = Column(Integer, nullable=False)  # bytes de data (se suman sin leer data)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # Sirve la última versión, una versión concreta y el historial paginado
+        UniqueConstraint("user_id", "plan_type", "version", name="uq_plan_versions_user_type_version"),
+    )
@@ -21,7 +21,10 @@ class UserProfile(Base):
     __tablename__ = "user_profiles"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, index=True, nullable=False)
+    # Mismo identificador que en Redis y en el WebSocket (/ws/{user_id})
+    user_id = Column(String, unique=True, index=True, nullable=False)
+    # Versión del perfil: una escritura sólo se aplica si trae una versión más nueva
+    version = Column(Integer, nullable=False, default=0)
     age = Column(Integer)
     weight = Column(Integer)  # en kg
     height = Column(Integer)  # en cm
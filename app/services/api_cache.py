@@ -0,0 +1,296 @@
+# ========================================
+# app/services/api_cache.py - Caché de APIs Externas (stale-while-revalidate)
+# ========================================
+#
+# Cada entrada tiene dos TTL:
+#   - soft: hasta entonces el valor es fresco; después se sirve igualmente y se
+#     recarga en segundo plano, sin que ningún usuario espere a la API;
+#   - hard: TTL de la clave en Redis; sólo tras él una petición espera a la API.
+# Las claves más pedidas (y las marcadas como hot) se recargan periódicamente antes
+# de caducar. Un lock en Redis garantiza que cada clave se recarga una sola vez en
+# todo el clúster, y dentro de cada worker las peticiones de la misma clave se unen.
+
+from collections import Counter, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import logging
+import os
+import time
+import uuid
+
+from ..database.redis_connection import get_async_redis
+from .codecs import CODECS
+from .metrics import API_CACHE_REFRESHES, cache_stats
+
+logger = logging.getLogger(__name__)
+
+API_CACHE_ENABLED = os.getenv("API_CACHE_ENABLED", "true").lower() == "true"
+# Cada cuánto se revisan las claves hot y cuántas de las más pedidas se recargan
+API_CACHE_REFRESH_INTERVAL = float(os.getenv("API_CACHE_REFRESH_INTERVAL", "300"))
+API_CACHE_HOT_KEYS = int(os.getenv("API_CACHE_HOT_KEYS", "20"))
+# Duración máxima del lock de recarga (por encima del timeout de las herramientas)
+REFRESH_LOCK_SECONDS = 45
+# En un fallo sin valor, cuánto se espera a que otro worker termine de cargar la clave
+MISS_WAIT_SECONDS = 3.0
+MISS_POLL_SECONDS = 0.1
+# Claves con fetcher registrado (para poder recargarlas sin una petición de usuario)
+MAX_TRACKED_KEYS = 512
+
+# Borra el lock sólo si sigue siendo nuestro
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+Fetcher = Callable[[], Awaitable[Any]]
+
+API_CACHE_STATS = cache_stats("api")
+
+
+def _is_cacheable(value: Any) -> bool:
+    # Las herramientas devuelven {"error": ...} en lugar de lanzar excepciones
+    return value is not None and not (isinstance(value, dict) and "error" in value)
+
+
+class CachedCall:
+    """Cómo recargar una clave: fetcher, TTLs y si se recarga siempre en el planificador"""
+
+    __slots__ = ("fetch", "soft_ttl", "hard_ttl", "hot")
+
+    def __init__(self, fetch: Fetcher, soft_ttl: int, hard_ttl: int, hot: bool):
+        self.fetch = fetch
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = hard_ttl
+        self.hot = hot
+
+
+class ApiCache:
+    """Caché en Redis de respuestas de APIs externas con recarga en segundo plano"""
+
+    def __init__(self, redis_client=None, codec=None, prefix: str = "api_cache",
+                 enabled: bool = API_CACHE_ENABLED):
+        self.redis_client = redis_client
+        self.codec = codec or CODECS["api_cache"]
+        self.prefix = prefix
+        self.enabled = enabled
+        self._calls: "OrderedDict[str, CachedCall]" = OrderedDict()
+        self._access: Counter = Counter()
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._release_script = None
+        self._scheduler: Optional[asyncio.Task] = None
+
+    def _client(self):
+        if self.redis_client is None:
+            self.redis_client = get_async_redis(decode_responses=False)
+        return self.redis_client
+
+    async def get_or_fetch(self, key: str, fetch: Fetcher, soft_ttl: int, hard_ttl: int,
+                           hot: bool = False) -> Any:
+        """
+        Valor cacheado de key; si no existe, lo obtiene con fetch y lo guarda.
+
+        Pasado soft_ttl se devuelve el valor guardado y se recarga en segundo plano.
+        Los resultados con "error" se devuelven pero no se guardan.
+        """
+        if not self.enabled:
+            return await fetch()
+
+        call = CachedCall(fetch, soft_ttl, hard_ttl, hot)
+        self._track(key, call)
+        entry = await self._read(key)
+        if entry is not None:
+            API_CACHE_STATS.hits += 1
+            if entry["fresh_until"] <= time.time():
+                self.refresh_in_background(key, "stale")
+            return entry["value"]
+
+        API_CACHE_STATS.misses += 1
+        # Peticiones simultáneas de la misma clave en este worker esperan a la misma carga
+        future = self._loading.get(key)
+        if future is None:
+            future = self._loading[key] = asyncio.ensure_future(self._load(key, call))
+            future.add_done_callback(lambda _: self._loading.pop(key, None))
+        return await asyncio.shield(future)
+
+    def _track(self, key: str, call: CachedCall):
+        self._access[key] += 1
+        self._calls[key] = call
+        self._calls.move_to_end(key)
+        while len(self._calls) > MAX_TRACKED_KEYS:
+            evicted, _ = self._calls.popitem(last=False)
+            self._access.pop(evicted, None)
+
+    async def _load(self, key: str, call: CachedCall) -> Any:
+        token = await self._acquire_lock(key)
+        if token is None:
+            # Otro worker está cargando la clave: se espera a que la escriba
+            deadline = time.monotonic() + MISS_WAIT_SECONDS
+            while time.monotonic() < deadline:
+                await asyncio.sleep(MISS_POLL_SECONDS)
+                entry = await self._read(key)
+                if entry is not None:
+                    return entry["value"]
+            logger.warning(f"Timeout esperando la carga de {key} en otro worker; se consulta la API")
+        try:
+            value = await call.fetch()
+            if _is_cacheable(value):
+                await self._write(key, value, call)
+            API_CACHE_REFRESHES.labels("miss", "ok").inc()
+            return value
+        except Exception:
+            API_CACHE_REFRESHES.labels("miss", "error").inc()
+            raise
+        finally:
+            if token is not None:
+                await self._release_lock(key, token)
+
+    def refresh_in_background(self, key: str, trigger: str):
+        """Recarga key sin bloquear al llamante (una sola recarga por clave y worker)"""
+        if key in self._refreshing or key not in self._calls:
+            return
+        task = asyncio.create_task(self.refresh(key, trigger))
+        self._refreshing[key] = task
+        task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+
+    async def refresh(self, key: str, trigger: str, horizon: float = 0.0) -> bool:
+        """
+        Recarga key si deja de ser fresca en menos de horizon segundos y ningún otro
+        worker la está recargando ni acaba de hacerlo; True si se recargó.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            return False
+        token = await self._acquire_lock(key)
+        if token is None:
+            API_CACHE_REFRESHES.labels(trigger, "skipped").inc()
+            return False
+        try:
+            entry = await self._read(key)
+            if entry is not None and entry["fresh_until"] - time.time() > horizon:
+                API_CACHE_REFRESHES.labels(trigger, "skipped").inc()
+                return False
+            value = await call.fetch()
+            if not _is_cacheable(value):
+                # Se sigue sirviendo el valor anterior hasta el hard TTL
+                API_CACHE_REFRESHES.labels(trigger, "error").inc()
+                return False
+            await self._write(key, value, call)
+            API_CACHE_REFRESHES.labels(trigger, "ok").inc()
+            return True
+        except Exception as e:
+            API_CACHE_REFRESHES.labels(trigger, "error").inc()
+            logger.error(f"Error recargando {key} en caché de APIs: {str(e)}")
+            return False
+        finally:
+            await self._release_lock(key, token)
+
+    def hot_keys(self) -> List[str]:
+        """Claves marcadas como hot y las más pedidas desde la última revisión"""
+        keys = [key for key, call in self._calls.items() if call.hot]
+        for key, _ in self._access.most_common(API_CACHE_HOT_KEYS):
+            if key not in keys and key in self._calls:
+                keys.append(key)
+        return keys
+
+    async def refresh_hot_keys(self, horizon: float = API_CACHE_REFRESH_INTERVAL) -> int:
+        """Recarga las claves hot que dejarán de ser frescas antes de la próxima revisión"""
+        keys = self.hot_keys()
+        if not keys:
+            return 0
+        try:
+            # GET en pipeline y no MGET: en Redis Cluster las claves están en slots distintos
+            pipe = self._client().pipeline(transaction=False)
+            for key in keys:
+                pipe.get(self._key(key))
+            raw_values = await pipe.execute()
+        except Exception as e:
+            logger.error(f"Error leyendo claves hot de caché de APIs: {str(e)}")
+            return 0
+
+        now = time.time()
+        refreshed = 0
+        for key, raw in zip(keys, raw_values):
+            entry = self._decode(raw)
+            if entry is None or entry["fresh_until"] - now <= horizon:
+                refreshed += await self.refresh(key, "scheduled", horizon)
+        # La popularidad decae para que las claves que dejan de pedirse salgan del top
+        for key in list(self._access):
+            self._access[key] //= 2
+            if not self._access[key]:
+                del self._access[key]
+        return refreshed
+
+    def start_scheduler(self, interval: float = API_CACHE_REFRESH_INTERVAL):
+        if self.enabled and (self._scheduler is None or self._scheduler.done()):
+            self._scheduler = asyncio.create_task(self._run_scheduler(interval))
+
+    async def stop_scheduler(self):
+        tasks = [t for t in [self._scheduler, *self._refreshing.values()] if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._scheduler = None
+
+    async def _run_scheduler(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                refreshed = await self.refresh_hot_keys(interval)
+                if refreshed:
+                    logger.info(f"Caché de APIs: {refreshed} claves hot recargadas")
+            except Exception as e:
+                logger.error(f"Error en la recarga programada de caché de APIs: {str(e)}")
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    def _decode(self, raw: Optional[bytes]) -> Optional[Dict[str, Any]]:
+        if raw is None:
+            return None
+        try:
+            entry = self.codec.decode(raw)
+        except ValueError:
+            return None
+        if isinstance(entry, dict) and "fresh_until" in entry and "value" in entry:
+            return entry
+        # Valor guardado sin TTL soft (cache_api_response): se sirve y se recarga
+        return {"value": entry, "fresh_until": 0}
+
+    async def _read(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self._decode(await self._client().get(self._key(key)))
+        except Exception as e:
+            logger.error(f"Error leyendo caché de APIs: {str(e)}")
+            return None
+
+    async def _write(self, key: str, value: Any, call: CachedCall):
+        entry = {"value": value, "fresh_until": time.time() + call.soft_ttl}
+        try:
+            await self._client().set(self._key(key), self.codec.encode(entry), ex=call.hard_ttl)
+        except Exception as e:
+            logger.error(f"Error escribiendo caché de APIs: {str(e)}")
+
+    async def _acquire_lock(self, key: str) -> Optional[str]:
+        """Token del lock de recarga de key, o None si otro worker lo tiene"""
+        token = uuid.uuid4().hex
+        try:
+            acquired = await self._client().set(f"{self._key(key)}:lock", token, nx=True, ex=REFRESH_LOCK_SECONDS)
+        except Exception as e:
+            # Sin Redis no hay coordinación: se recarga desde este worker
+            logger.error(f"Error tomando lock de caché de APIs: {str(e)}")
+            return token
+        return token if acquired else None
+
+    async def _release_lock(self, key: str, token: str):
+        try:
+            if self._release_script is None:
+                self._release_script = self._client().register_script(RELEASE_LOCK_SCRIPT)
+            await self._release_script(keys=[f"{self._key(key)}:lock"], args=[token])
+        except Exception as e:
+            logger.error(f"Error liberando lock de caché de APIs: {str(e)}")
+
+
+api_cache = ApiCache()
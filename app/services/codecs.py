@@ -0,0 +1,139 @@
+# ========================================
+# app/services/codecs.py - Codecs de Valores Redis
+# ========================================
+#
+# Formato binario: b"\x00" + id de formato (1 byte) + flags (1 byte) + cuerpo.
+# Ningún JSON válido empieza por un byte nulo, así que los valores antiguos
+# (json.dumps en texto) se siguen leyendo sin migración.
+#
+# Configuración por familia de claves con REDIS_CODEC_<FAMILIA>, por ejemplo:
+#   REDIS_CODEC_PLAN="msgpack:512"   -> MessagePack, comprime a partir de 512 bytes
+#   REDIS_CODEC_PROFILE="json:none"  -> JSON en texto como antes (sin cabecera ni compresión)
+
+from typing import Any, Dict, Optional, Sequence
+import logging
+import os
+import zlib
+
+import msgpack
+import orjson
+
+logger = logging.getLogger(__name__)
+
+MARKER = 0x00
+FORMAT_JSON = 1
+FORMAT_MSGPACK = 2
+FORMAT_RECORD = 3  # MessagePack posicional: lista de valores en el orden de `fields`
+FLAG_ZLIB = 0x01
+
+DEFAULT_COMPRESS_THRESHOLD = 1024
+COMPRESS_LEVEL = 6
+
+# Campos de una entrada de conversación. Sólo se pueden añadir al final:
+# los valores ya guardados se leen por posición.
+CONVERSATION_FIELDS = ("timestamp", "user_message", "agent_response", "agent")
+
+
+class ValueCodec:
+    """Serializa valores de una familia de claves; lee también el JSON antiguo"""
+
+    def __init__(self, fmt: str = "msgpack", compress_threshold: Optional[int] = DEFAULT_COMPRESS_THRESHOLD,
+                 fields: Sequence[str] = ()):
+        self.fmt = fmt
+        self.compress_threshold = compress_threshold
+        self.fields = tuple(fields)
+
+    def encode(self, value: Any) -> bytes:
+        if self.fmt == "json":
+            format_id, body = FORMAT_JSON, orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        elif self.fmt == "record" and isinstance(value, dict):
+            format_id, body = FORMAT_RECORD, msgpack.packb(self._to_record(value), use_bin_type=True)
+        else:
+            format_id, body = FORMAT_MSGPACK, msgpack.packb(value, use_bin_type=True, default=str)
+
+        if self.compress_threshold is not None and len(body) >= self.compress_threshold:
+            compressed = zlib.compress(body, COMPRESS_LEVEL)
+            if len(compressed) < len(body):
+                return bytes((MARKER, format_id, FLAG_ZLIB)) + compressed
+
+        if format_id == FORMAT_JSON:
+            # JSON sin comprimir va sin cabecera: lo leen también las versiones anteriores
+            return body
+        return bytes((MARKER, format_id, 0)) + body
+
+    def decode(self, raw: Any) -> Any:
+        if raw is None:
+            return None
+        if isinstance(raw, str):
+            return orjson.loads(raw)
+        if not raw or raw[0] != MARKER:
+            # Valor escrito con json.dumps antes de existir los codecs
+            return orjson.loads(raw)
+
+        format_id, flags, body = raw[1], raw[2], raw[3:]
+        if flags & FLAG_ZLIB:
+            body = zlib.decompress(body)
+        if format_id == FORMAT_MSGPACK:
+            return msgpack.unpackb(body, raw=False, strict_map_key=False)
+        if format_id == FORMAT_RECORD:
+            return self._from_record(msgpack.unpackb(body, raw=False, strict_map_key=False))
+        if format_id == FORMAT_JSON:
+            return orjson.loads(body)
+        raise ValueError(f"Formato de valor Redis desconocido: {format_id}")
+
+    def _to_record(self, value: Dict[str, Any]) -> list:
+        record = [value.get(field) for field in self.fields]
+        extra = {k: v for k, v in value.items() if k not in self.fields}
+        # Claves fuera del esquema (o ausentes) viajan en un dict final
+        missing = [field for field in self.fields if field not in value]
+        if extra or missing:
+            record.append({"extra": extra, "missing": missing})
+        return record
+
+    def _from_record(self, record: list) -> Dict[str, Any]:
+        value = dict(zip(self.fields, record))
+        if len(record) > len(self.fields):
+            trailer = record[len(self.fields)]
+            for field in trailer.get("missing", ()):
+                value.pop(field, None)
+            value.update(trailer.get("extra", {}))
+        return value
+
+
+DEFAULT_SPECS = {
+    "conversation": "record:2048",
+    "profile": "msgpack",
+    "api_cache": "msgpack:1024",
+    "plan": "msgpack:512",
+}
+
+FAMILY_FIELDS = {
+    "conversation": CONVERSATION_FIELDS,
+}
+
+
+def parse_spec(spec: str, fields: Sequence[str] = ()) -> ValueCodec:
+    """'formato[:umbral]' -> ValueCodec; umbral 'none' desactiva la compresión"""
+    fmt, _, threshold = spec.strip().lower().partition(":")
+    if fmt not in ("json", "msgpack", "record"):
+        raise ValueError(f"Codec Redis desconocido: {spec}")
+    if threshold == "none":
+        compress_threshold = None
+    else:
+        compress_threshold = int(threshold) if threshold else DEFAULT_COMPRESS_THRESHOLD
+    return ValueCodec(fmt, compress_threshold, fields)
+
+
+def build_codecs() -> Dict[str, ValueCodec]:
+    codecs = {}
+    for family, default in DEFAULT_SPECS.items():
+        spec = os.getenv(f"REDIS_CODEC_{family.upper()}", default)
+        try:
+            codecs[family] = parse_spec(spec, FAMILY_FIELDS.get(family, ()))
+        except ValueError as e:
+            logger.error(f"{str(e)}; usando {default} para {family}")
+            codecs[family] = parse_spec(default, FAMILY_FIELDS.get(family, ()))
+    return codecs
+
+
+CODECS = build_codecs()
@@ -0,0 +1,126 @@
+# ========================================
+# app/services/cold_storage.py - Datos Fríos en PostgreSQL
+# ========================================
+#
+# Valores de Redis de usuarios inactivos guardados en la tabla cold_data con la
+# misma clave que tenían en Redis (ver app/services/tiering.py). El payload es
+# MessagePack comprimido con los valores tal y como estaban en Redis (ya
+# codificados con su codec), así que devolverlos a Redis no los re-serializa.
+#
+# SQLAlchemy y los modelos se importan al primer uso, como en profile_store.py.
+
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import logging
+
+from .codecs import ValueCodec
+
+logger = logging.getLogger(__name__)
+
+# Las conversaciones de 50 turnos comprimen mucho mejor juntas que entrada a entrada
+COLD_CODEC = ValueCodec("msgpack", compress_threshold=256)
+
+
+def pack_conversation(entries: List[bytes], seq: int) -> bytes:
+    """entries en el orden de LRANGE (el turno más reciente primero)"""
+    return COLD_CODEC.encode({"entries": entries, "seq": seq})
+
+
+def unpack_conversation(payload: bytes) -> Tuple[List[bytes], int]:
+    value = COLD_CODEC.decode(payload)
+    return value["entries"], int(value.get("seq") or 0)
+
+
+def pack_value(raw: bytes) -> bytes:
+    return COLD_CODEC.encode({"value": raw})
+
+
+def unpack_value(payload: bytes) -> bytes:
+    return COLD_CODEC.decode(payload)["value"]
+
+
+def _as_utc(moment: datetime) -> datetime:
+    # SQLite devuelve las fechas sin zona horaria
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+class ColdStorage:
+    """Lectura y escritura de la tabla cold_data (síncrona, en hilos aparte)"""
+
+    def __init__(self, session_factory=None):
+        self._session_factory = session_factory
+
+    def _session(self):
+        if self._session_factory is None:
+            from ..database.connection import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    def save_many(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """Guarda filas {key, user_id, kind, payload, expires_at}; sustituye las que ya existan"""
+        rows = list(rows)
+        if not rows:
+            return 0
+        from ..models.cold_data import ColdData
+
+        with self._session() as session:
+            dialect = session.get_bind().dialect.name
+            if dialect == "sqlite":
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            stmt = insert(ColdData).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ColdData.key],
+                set_={column: stmt.excluded[column] for column in ("user_id", "kind", "payload", "expires_at")},
+            )
+            session.execute(stmt)
+            session.commit()
+        return len(rows)
+
+    def get(self, key: str) -> Optional[Tuple[str, bytes, Optional[float]]]:
+        """(user_id, payload, segundos que le quedaban en Redis o None si no caducaba) de key"""
+        from ..models.cold_data import ColdData
+
+        with self._session() as session:
+            row = session.get(ColdData, key)
+            if row is None:
+                return None
+            ttl = None
+            if row.expires_at is not None:
+                ttl = (_as_utc(row.expires_at) - datetime.now(timezone.utc)).total_seconds()
+            return row.user_id, row.payload, ttl
+
+    def keys_for_user(self, user_id: str, kind: str) -> List[str]:
+        """Claves de un usuario guardadas en la tabla (sólo las del tipo kind)"""
+        from ..models.cold_data import ColdData
+
+        with self._session() as session:
+            rows = session.query(ColdData.key).filter(ColdData.user_id == user_id, ColdData.kind == kind)
+            return [key for (key,) in rows]
+
+    def delete(self, keys: List[str]) -> int:
+        if not keys:
+            return 0
+        from ..models.cold_data import ColdData
+
+        with self._session() as session:
+            deleted = session.query(ColdData).filter(ColdData.key.in_(keys)).delete(synchronize_session=False)
+            session.commit()
+            return deleted
+
+    def purge_expired(self) -> int:
+        """Borra las filas que ya habrían caducado en Redis"""
+        from ..models.cold_data import ColdData
+
+        with self._session() as session:
+            deleted = (
+                session.query(ColdData)
+                .filter(ColdData.expires_at < datetime.now(timezone.utc))
+                .delete(synchronize_session=False)
+            )
+            session.commit()
+            return deleted
+
+
+cold_storage = ColdStorage()
@@ -0,0 +1,137 @@
+# ========================================
+# app/services/connection_registry.py - Registro de Conexiones WebSocket
+# ========================================
+
+from typing import Any, Dict, List, Optional, Set
+import asyncio
+import logging
+import os
+
+from fastapi import WebSocket
+
+from ..database.redis_connection import REDIS_CLUSTER
+from .metrics import WEBSOCKET_CONNECTIONS
+from .pubsub import PubSubBus, bus as default_bus
+from .ws_protocol import WireProtocol
+
+logger = logging.getLogger(__name__)
+
+# Aviso que publica un worker en el canal de un usuario al suscribirse a él
+PRESENCE_JOIN = "join"
+# Un cliente que no acepta un mensaje en este tiempo (segundos) se desconecta
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+
+
+class ConnectionRegistry:
+    """Varias conexiones por usuario en este worker; el resto de workers se alcanza por pub/sub"""
+
+    def __init__(self, pubsub: PubSubBus = default_bus):
+        self.pubsub = pubsub
+        # user_id -> sockets abiertos en este proceso (alta y baja en O(1))
+        self.user_connections: Dict[str, Set[WebSocket]] = {}
+        # Formato negociado y planes ya enviados de cada socket
+        self.protocols: Dict[WebSocket, WireProtocol] = {}
+        # user_id -> si otro worker puede tener sockets del usuario (sin entrada: se supone que sí)
+        self.remote_subscribers: Dict[str, bool] = {}
+        # user_id -> avisos PRESENCE_JOIN recibidos (detecta avisos durante un PUBLISH)
+        self._joins: Dict[str, int] = {}
+
+    @staticmethod
+    def user_channel(user_id: str) -> str:
+        return f"ws:user:{user_id}"
+
+    @property
+    def connection_count(self) -> int:
+        return sum(len(sockets) for sockets in self.user_connections.values())
+
+    def connections(self, user_id: str) -> List[WebSocket]:
+        return list(self.user_connections.get(user_id, ()))
+
+    def protocol(self, websocket: WebSocket) -> WireProtocol:
+        return self.protocols[websocket]
+
+    async def connect(self, websocket: WebSocket, user_id: str):
+        protocol = WireProtocol.for_websocket(websocket)
+        await websocket.accept(subprotocol=protocol.subprotocol)
+        self.protocols[websocket] = protocol
+        sockets = self.user_connections.setdefault(user_id, set())
+        sockets.add(websocket)
+        WEBSOCKET_CONNECTIONS.inc()
+        # Primer socket del usuario en este worker: escuchar su canal
+        if len(sockets) == 1:
+            await self._subscribe_user(user_id)
+
+    async def disconnect(self, websocket: WebSocket, user_id: str):
+        sockets = self.user_connections.get(user_id)
+        if not sockets or websocket not in sockets:
+            return
+        sockets.discard(websocket)
+        self.protocols.pop(websocket, None)
+        WEBSOCKET_CONNECTIONS.dec()
+        if not sockets:
+            del self.user_connections[user_id]
+            self.remote_subscribers.pop(user_id, None)
+            self._joins.pop(user_id, None)
+            await self._unsubscribe_user(user_id)
+
+    async def send_message(self, message: Dict[str, Any], user_id: str, exclude: Optional[WebSocket] = None):
+        """Envía a todas las conexiones del usuario, en este worker y en los demás"""
+        await self.send_local(message, user_id, exclude=exclude)
+        # Sólo se publica si algún otro worker escucha el canal del usuario
+        if self.remote_subscribers.get(user_id, True):
+            await self._publish(user_id, message)
+
+    async def _publish(self, user_id: str, message: Dict[str, Any]):
+        joins = self._joins.get(user_id, 0)
+        receivers = await self.pubsub.publish(self.user_channel(user_id), message)
+        # En Redis Cluster PUBLISH sólo cuenta los suscriptores del nodo que lo recibe
+        if receivers is None or REDIS_CLUSTER or user_id not in self.user_connections:
+            return
+        # PUBLISH cuenta también la suscripción de este worker. Sin nadie más se deja de
+        # publicar hasta que otro worker avise con PRESENCE_JOIN (salvo si avisó durante
+        # este PUBLISH)
+        if self._joins.get(user_id, 0) == joins:
+            self.remote_subscribers[user_id] = receivers > 1
+
+    async def send_local(self, message: Dict[str, Any], user_id: str, exclude: Optional[WebSocket] = None):
+        """Envía sólo a las conexiones del usuario abiertas en este worker, cada una en su formato"""
+        for websocket in self.connections(user_id):
+            if websocket is exclude:
+                continue
+            try:
+                await asyncio.wait_for(self.protocols[websocket].send(websocket, message), WS_SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                # Cliente lento o sin leer: no debe retener los mensajes de las demás conexiones
+                logger.warning(f"Timeout enviando a usuario {user_id}; se cierra la conexión")
+                await self.disconnect(websocket, user_id)
+                try:
+                    await websocket.close(code=1013)
+                except Exception:
+                    pass
+            except Exception as e:
+                # Conexión cerrada sin pasar aún por disconnect
+                logger.warning(f"Error enviando a usuario {user_id}: {str(e)}")
+                await self.disconnect(websocket, user_id)
+
+    async def _subscribe_user(self, user_id: str):
+        async def deliver(message: Any, origin: str):
+            if message == PRESENCE_JOIN:
+                # Otro worker tiene ahora sockets del usuario: volver a publicar
+                self._joins[user_id] = self._joins.get(user_id, 0) + 1
+                self.remote_subscribers[user_id] = True
+                return
+            await self.send_local(message, user_id)
+
+        try:
+            await self.pubsub.subscribe(self.user_channel(user_id), deliver)
+        except Exception as e:
+            logger.error(f"Error suscribiendo canal de {user_id}: {str(e)}")
+            return
+        # Tras suscribirse: los workers que ya tienen al usuario vuelven a publicarle
+        await self.pubsub.publish(self.user_channel(user_id), PRESENCE_JOIN)
+
+    async def _unsubscribe_user(self, user_id: str):
+        try:
+            await self.pubsub.unsubscribe(self.user_channel(user_id))
+        except Exception as e:
+            logger.error(f"Error cancelando canal de {user_id}: {str(e)}")
@@ -0,0 +1,107 @@
+# ========================================
+# app/services/conversation_window.py - Ventana de Conversación por Conexión
+# ========================================
+#
+# Cada WebSocket mantiene en memoria los últimos turnos del usuario: se siembra al
+# conectar, se actualiza al escribir cada turno (write-through a Redis) y se lee
+# localmente. Cada turno lleva un número de secuencia (INCR en Redis, en la misma
+# transacción que el LPUSH):
+#   - las ventanas del mismo worker se actualizan directamente;
+#   - las de otros workers reciben el turno por pub/sub (canal conv:user:<id>);
+#   - si a una ventana le falta un número, queda obsoleta y se recarga de Redis.
+# Cada WINDOW_VERIFY_SECONDS una lectura comprueba la secuencia en Redis, por si
+# se perdió algún aviso (pub/sub caído).
+
+from collections import deque
+from typing import Any, Deque, Dict, List, Set
+import logging
+import os
+import time
+
+from .metrics import cache_stats
+from .pubsub import PubSubBus, bus
+
+logger = logging.getLogger(__name__)
+
+WINDOW_VERIFY_SECONDS = float(os.getenv("CONVERSATION_WINDOW_VERIFY_SECONDS", "60"))
+
+WINDOW_STATS = cache_stats("conversation_window")
+
+
+class ConversationWindow:
+    """Últimos turnos de un usuario vistos por una conexión"""
+
+    __slots__ = ("user_id", "limit", "seq", "stale", "verified_at", "_entries")
+
+    def __init__(self, user_id: str, entries: List[Dict[str, Any]], seq: int, limit: int = 10):
+        self.user_id = user_id
+        self.limit = limit
+        self._entries: Deque[Dict[str, Any]] = deque(maxlen=limit)
+        self.reset(entries, seq)
+
+    def reset(self, entries: List[Dict[str, Any]], seq: int):
+        self._entries.clear()
+        self._entries.extend(entries[-self.limit:])
+        self.seq = seq
+        self.stale = False
+        self.verified_at = time.monotonic()
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Turnos en orden cronológico (el más reciente al final)"""
+        return list(self._entries)
+
+    def apply(self, entry: Dict[str, Any], seq: int):
+        if seq <= self.seq:
+            return  # ya aplicado
+        if seq == self.seq + 1 and not self.stale:
+            self._entries.append(entry)
+            self.seq = seq
+        else:
+            # Falta algún turno intermedio: se recarga de Redis en la próxima lectura
+            self.stale = True
+
+    def needs_verify(self, interval: float = WINDOW_VERIFY_SECONDS) -> bool:
+        return time.monotonic() - self.verified_at >= interval
+
+
+class ConversationWindows:
+    """Ventanas abiertas en este proceso por usuario y su sincronización entre workers"""
+
+    def __init__(self, pubsub: PubSubBus = bus):
+        self.pubsub = pubsub
+        self._windows: Dict[str, Set[ConversationWindow]] = {}
+
+    @staticmethod
+    def channel(user_id: str) -> str:
+        return f"conv:user:{user_id}"
+
+    async def register(self, window: ConversationWindow):
+        windows = self._windows.setdefault(window.user_id, set())
+        windows.add(window)
+        if len(windows) == 1:
+            await self.pubsub.subscribe(self.channel(window.user_id), self._on_turn)
+
+    async def unregister(self, window: ConversationWindow):
+        windows = self._windows.get(window.user_id)
+        if not windows or window not in windows:
+            return
+        windows.discard(window)
+        if not windows:
+            del self._windows[window.user_id]
+            await self.pubsub.unsubscribe(self.channel(window.user_id))
+
+    async def publish_turn(self, user_id: str, entry: Dict[str, Any], seq: int):
+        """Añade un turno recién escrito en Redis a todas las ventanas del usuario"""
+        self._apply(user_id, entry, seq)
+        await self.pubsub.publish(self.channel(user_id), {"user_id": user_id, "entry": entry, "seq": seq})
+
+    async def _on_turn(self, data: Any, origin_node: str):
+        if isinstance(data, dict) and data.get("user_id"):
+            self._apply(data["user_id"], data.get("entry") or {}, int(data.get("seq", 0)))
+
+    def _apply(self, user_id: str, entry: Dict[str, Any], seq: int):
+        for window in self._windows.get(user_id, ()):
+            window.apply(entry, seq)
+
+
+conversation_windows = ConversationWindows()
@@ -2,54 +2,196 @@
 # app/services/memory_service.py - Servicio de Memoria
 # ========================================
 
-import redis
-import json
-from typing import Dict, Any, List, Optional
-from datetime import datetime, timedelta
+import os
+import asyncio
+import time
+import uuid
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
 import logging
 
+from ..database.redis_connection import get_redis
+from ..database.redis_keys import (
+    ACTIVITY_KEY, TURN_STREAM_KEY, active_at_key, api_cache_key, conversation_key, conversation_seq_key,
+    plan_key, plans_index_key, profile_fill_key, profile_key
+)
+from .api_cache import RELEASE_LOCK_SCRIPT
+from .codecs import CODECS
+from .metrics import TimedRedis, record_cache
+from .profile_cache import profile_cache
+from .profile_store import profile_store
+from .conversation_window import conversation_windows
+from .tiering import cold_plan_ids, rehydrate_conversation, rehydrate_plan
+from .turn_events import TURN_STREAM_ENABLED, TURN_STREAM_MAXLEN, turn_event_fields
+from .tracing import traced
+
 logger = logging.getLogger(__name__)
 
+# La BD es la fuente de verdad de los perfiles; en Redis sólo se guarda una copia con TTL
+PROFILE_REDIS_TTL = int(os.getenv("PROFILE_REDIS_TTL", "604800"))
+# Usuarios sin perfil en la BD: se recuerda en Redis para no consultarla en cada mensaje
+PROFILE_MISSING_TTL = int(os.getenv("PROFILE_MISSING_TTL", "300"))
+# Carga de un perfil desde la BD: una sola consulta por usuario en todo el clúster
+PROFILE_FILL_LOCK_SECONDS = 5
+PROFILE_FILL_WAIT_SECONDS = 2.0
+PROFILE_FILL_POLL_SECONDS = 0.05
+# Reintentos de una escritura que choca con otra más nueva del mismo perfil
+PROFILE_WRITE_ATTEMPTS = 3
+
+# Cargas desde la BD en curso en este proceso, por user_id
+_profile_fills: Dict[str, asyncio.Future] = {}
+
+# Las operaciones de varias claves de un usuario son scripts Lua y no MULTI: atómicos
+# también en Redis Cluster (todas las claves llevan el hash tag del usuario)
+
+# KEYS: profile, profile_fill; ARGV: token del lock, perfil, TTL. Sólo si el lock sigue siendo
+# de quien cargó el perfil: update_user_profile lo borra y la carga pudo leer la versión anterior
+FILL_PROFILE_SCRIPT = """
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    return 0
+end
+if redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3], 'NX') then
+    return 1
+end
+return 0
+"""
+
+# KEYS: conversation, conversation_seq, active_at[, profile]; ARGV: limit, ahora, TTL de active_at
+LOAD_SESSION_SCRIPT = """
+redis.call('SET', KEYS[3], ARGV[2], 'EX', ARGV[3])
+local result = {redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1), redis.call('GET', KEYS[2])}
+if KEYS[4] then
+    result[3] = redis.call('GET', KEYS[4])
+end
+return result
+"""
+
+# KEYS: conversation, conversation_seq, active_at; ARGV: entrada, TTL, máximo de turnos, ahora, TTL de active_at
+APPEND_TURN_SCRIPT = """
+redis.call('LPUSH', KEYS[1], ARGV[1])
+redis.call('LTRIM', KEYS[1], 0, tonumber(ARGV[3]) - 1)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+local seq = redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+redis.call('SET', KEYS[3], ARGV[4], 'EX', ARGV[5])
+return seq
+"""
+
+def _decode_member(member: Any) -> str:
+    return member.decode() if isinstance(member, bytes) else member
+
+
+def _plan_timestamp(plan_id: str) -> int:
+    try:
+        return int(plan_id.rsplit("_", 1)[1])
+    except (IndexError, ValueError):
+        return 0
+
+
 class MemoryService:
     def __init__(self):
-        # Configuración Redis - usar variables de entorno en producción
-        self.redis_client = redis.Redis(
-            host='localhost',  # En Render será la URL de Redis
-            port=6379,
-            db=0,
-            decode_responses=True
-        )
+        # Configuración Redis - en Render REDIS_URL apunta a la instancia gestionada
+        # TimedRedis registra el RTT de cada comando en /metrics
+        # Sin decode_responses: los valores son binarios (ver codecs.py)
+        # Con REDIS_CLUSTER=true es un cliente de Redis Cluster (claves en redis_keys.py)
+        self.redis_client = TimedRedis(get_redis())
+        # Codec por familia de claves: conversation, profile, api_cache, plan
+        self.codecs = CODECS
+        # Primer nivel en proceso para perfiles (compartido por todas las instancias)
+        self.profile_cache = profile_cache
+        # Perfiles en PostgreSQL (fuente de verdad)
+        self.profile_store = profile_store
+        # Ventanas de conversación abiertas en este proceso (se actualizan al escribir turnos)
+        self.conversation_windows = conversation_windows
         
         # TTL por defecto para conversaciones (24 horas)
         self.conversation_ttl = 86400
-        # TTL para perfiles de usuario (30 días)
-        self.profile_ttl = 2592000
+        # Turnos que se guardan por usuario
+        self.conversation_max_turns = 50
+        # TTL de la copia en Redis de los perfiles (7 días; el perfil sigue en la BD)
+        self.profile_ttl = PROFILE_REDIS_TTL
+        # TTL para planes guardados (30 días)
+        self.plan_ttl = 2592000
 
+    @traced("memory.get_conversation_context")
     async def get_conversation_context(self, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Obtiene el contexto de conversación del usuario"""
         try:
-            key = f"conversation:{user_id}"
+            key = conversation_key(user_id)
             messages_json = self.redis_client.lrange(key, 0, limit-1)
+            if not messages_json:
+                # Puede estar en la BD si el usuario estuvo inactivo (ver tiering.py)
+                restored = await asyncio.to_thread(
+                    rehydrate_conversation, self.redis_client, user_id, max_turns=self.conversation_max_turns
+                )
+                if restored:
+                    messages_json = restored[0][:limit]
             
-            messages = []
-            for msg_json in messages_json:
-                try:
-                    messages.append(json.loads(msg_json))
-                except json.JSONDecodeError:
-                    logger.warning(f"Error decodificando mensaje para usuario {user_id}")
-                    continue
-            
-            return messages[::-1]  # Más recientes primero
+            return self._decode_conversation(messages_json, user_id)
             
         except Exception as e:
             logger.error(f"Error obteniendo contexto de conversación: {str(e)}")
             return []
 
+    @traced("memory.load_session")
+    async def load_session(self, user_id: str, limit: int = 10) -> Tuple[List[Dict[str, Any]], Dict[str, Any], int]:
+        """
+        Contexto de conversación, perfil y secuencia del último turno en una sola ida y
+        vuelta a Redis (un script: la secuencia corresponde exactamente a los turnos leídos)
+        """
+        profile = self.profile_cache.get(user_id)
+        generation = self.profile_cache.generation
+        keys = [conversation_key(user_id), conversation_seq_key(user_id), active_at_key(user_id)]
+        if profile is None:
+            keys.append(profile_key(user_id))
+        try:
+            now = time.time()
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.eval(LOAD_SESSION_SCRIPT, len(keys), *keys, limit, repr(now), self.plan_ttl)
+            self._touch_activity(pipe, user_id, now)
+            results = pipe.execute()[0]
+        except Exception as e:
+            logger.error(f"Error cargando sesión de usuario: {str(e)}")
+            return [], profile or {}, 0
+
+        messages_json, seq = results[0], results[1]
+        if not messages_json and seq is None:
+            # Sin conversación en Redis: puede estar en la BD si el usuario estuvo inactivo
+            try:
+                restored = await asyncio.to_thread(
+                    rehydrate_conversation, self.redis_client, user_id, max_turns=self.conversation_max_turns
+                )
+                if restored:
+                    messages_json, seq = restored[0][:limit], restored[1]
+            except Exception as e:
+                logger.error(f"Error recuperando conversación de la BD: {str(e)}")
+
+        if profile is None:
+            try:
+                if len(results) < 3 or results[2] is None:
+                    profile = await self._fill_profile(user_id)
+                else:
+                    profile = self._decode_profile(results[2], user_id)
+                self.profile_cache.put(user_id, profile, generation)
+            except Exception as e:
+                logger.error(f"Error cargando perfil de usuario: {str(e)}")
+                profile = {}
+        return self._decode_conversation(messages_json, user_id), profile, int(seq or 0)
+
+    async def get_conversation_seq(self, user_id: str) -> int:
+        """Secuencia del último turno escrito (0 si no hay conversación)"""
+        try:
+            return int(self.redis_client.get(conversation_seq_key(user_id)) or 0)
+        except Exception as e:
+            logger.error(f"Error obteniendo secuencia de conversación: {str(e)}")
+            return -1
+
+    @traced("memory.update_conversation")
     async def update_conversation(self, user_id: str, user_message: str, 
                                 agent_response: str, agent_type: str):
-        """Actualiza el contexto de conversación"""
+        """Actualiza el contexto de conversación y las ventanas abiertas del usuario"""
         try:
-            key = f"conversation:{user_id}"
+            keys = [conversation_key(user_id), conversation_seq_key(user_id), active_at_key(user_id)]
             
             conversation_entry = {
                 "timestamp": datetime.utcnow().isoformat(),
@@ -58,69 +200,267 @@ class MemoryService:
                 "agent": agent_type
             }
             
-            # Agregar al inicio de la lista
-            self.redis_client.lpush(key, json.dumps(conversation_entry))
-            
-            # Mantener solo los últimos 50 mensajes
-            self.redis_client.ltrim(key, 0, 49)
+            # LPUSH + LTRIM + INCR atómicos: el número de secuencia corresponde a este turno
+            now = time.time()
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.eval(APPEND_TURN_SCRIPT, len(keys), *keys, self._encode_conversation_entry(conversation_entry),
+                      self.conversation_ttl, self.conversation_max_turns, repr(now), self.plan_ttl)
+            self._touch_activity(pipe, user_id, now)
+            if TURN_STREAM_ENABLED:
+                # Evento para los consumidores del stream (ver turn_events.py)
+                pipe.xadd(TURN_STREAM_KEY, turn_event_fields(user_id, conversation_entry),
+                          maxlen=TURN_STREAM_MAXLEN, approximate=True)
+            results = pipe.execute(raise_on_error=False)
+            if isinstance(results[0], Exception):
+                raise results[0]
+            if TURN_STREAM_ENABLED and isinstance(results[-1], Exception):
+                # El turno ya está guardado: el stream no bloquea la conversación
+                logger.error(f"Error publicando el turno en {TURN_STREAM_KEY}: {str(results[-1])}")
+            seq = results[0]
             
-            # Establecer TTL
-            self.redis_client.expire(key, self.conversation_ttl)
+            await self.conversation_windows.publish_turn(user_id, conversation_entry, seq)
             
         except Exception as e:
             logger.error(f"Error actualizando conversación: {str(e)}")
 
+    @staticmethod
+    def _touch_activity(pipe, user_id: str, now: float):
+        """Última actividad del usuario: los inactivos se bajan a la BD (tiering.py)"""
+        # Clave compartida, fuera del slot del usuario: va en el pipeline, no en el script
+        pipe.zadd(ACTIVITY_KEY, {user_id: now})
+
+    def _encode_conversation_entry(self, entry: Dict[str, Any]) -> bytes:
+        """Serializa una entrada de conversación para Redis"""
+        return self.codecs["conversation"].encode(entry)
+
+    def _decode_conversation(self, messages_json: List[bytes], user_id: str = "") -> List[Dict[str, Any]]:
+        """Deserializa una ventana de conversación leída con LRANGE"""
+        codec = self.codecs["conversation"]
+        messages = []
+        for msg_json in messages_json:
+            try:
+                messages.append(codec.decode(msg_json))
+            except ValueError:
+                logger.warning(f"Error decodificando mensaje para usuario {user_id}")
+                continue
+        
+        return messages[::-1]  # Orden cronológico: el más reciente al final
+
+    @traced("memory.get_user_profile")
     async def get_user_profile(self, user_id: str) -> Dict[str, Any]:
-        """Obtiene el perfil del usuario"""
+        """Obtiene el perfil del usuario (caché en proceso, Redis y, si no está, la BD)"""
+        profile = self.profile_cache.get(user_id)
+        if profile is not None:
+            return profile
+
+        generation = self.profile_cache.generation
         try:
-            key = f"profile:{user_id}"
-            profile_json = self.redis_client.get(key)
-            
-            if profile_json:
-                return json.loads(profile_json)
-            else:
-                return {}
-                
+            profile = await self._load_profile(user_id)
         except Exception as e:
             logger.error(f"Error obteniendo perfil de usuario: {str(e)}")
             return {}
+        self.profile_cache.put(user_id, profile, generation)
+        return profile
 
-    async def update_user_profile(self, user_id: str, profile_data: Dict[str, Any]):
-        """Actualiza el perfil del usuario"""
+    async def _load_profile(self, user_id: str) -> Dict[str, Any]:
+        """Perfil desde Redis o, si no está (caducado o Redis vaciado), desde la BD"""
         try:
-            key = f"profile:{user_id}"
+            profile_json = self.redis_client.get(profile_key(user_id))
+        except Exception as e:
+            logger.error(f"Error leyendo perfil de Redis: {str(e)}")
+            profile_json = None
+        if profile_json is not None:
+            return self._decode_profile(profile_json, user_id)
+        return await self._fill_profile(user_id)
+
+    async def _fill_profile(self, user_id: str) -> Dict[str, Any]:
+        """
+        Carga de la BD un perfil que no está en Redis y lo deja en Redis. Las peticiones
+        simultáneas del mismo usuario esperan a la misma consulta (en este worker y en el resto).
+        """
+        future = _profile_fills.get(user_id)
+        if future is None:
+            future = _profile_fills[user_id] = asyncio.ensure_future(self._fill_profile_once(user_id))
+            future.add_done_callback(lambda _: _profile_fills.pop(user_id, None))
+        return dict(await asyncio.shield(future))
+
+    async def _fill_profile_once(self, user_id: str) -> Dict[str, Any]:
+        key = profile_key(user_id)
+        lock_key = profile_fill_key(user_id)
+        token = uuid.uuid4().hex
+        try:
+            acquired = self.redis_client.set(lock_key, token, nx=True, ex=PROFILE_FILL_LOCK_SECONDS)
+        except Exception as e:
+            # Sin Redis no hay coordinación: se consulta la BD desde este worker
+            logger.error(f"Error tomando lock de carga de perfil: {str(e)}")
+            acquired = True
+
+        if not acquired:
+            # Otro worker está consultando la BD: se espera a que deje el perfil en Redis
+            deadline = time.monotonic() + PROFILE_FILL_WAIT_SECONDS
+            while time.monotonic() < deadline:
+                await asyncio.sleep(PROFILE_FILL_POLL_SECONDS)
+                profile_json = self.redis_client.get(key)
+                if profile_json is not None:
+                    return self._decode_profile(profile_json, user_id)
+            logger.warning(f"Timeout esperando la carga del perfil de {user_id} en otro worker")
+
+        try:
+            profile = await self.profile_store.aload(user_id)
+            if acquired:
+                try:
+                    # NX: una escritura del perfil posterior a la consulta no se sobrescribe
+                    if profile is None:
+                        value, ttl = self.codecs["profile"].encode({}), PROFILE_MISSING_TTL
+                    else:
+                        value, ttl = self.codecs["profile"].encode(profile), self.profile_ttl
+                    self.redis_client.eval(FILL_PROFILE_SCRIPT, 2, key, lock_key, token, value, ttl)
+                except Exception as e:
+                    logger.error(f"Error guardando perfil en Redis: {str(e)}")
+            return profile or {}
+        finally:
+            if acquired:
+                try:
+                    self.redis_client.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+                except Exception as e:
+                    logger.error(f"Error liberando lock de carga de perfil: {str(e)}")
+
+    def _decode_profile(self, profile_json: Optional[bytes], user_id: str) -> Dict[str, Any]:
+        if not profile_json:
+            return {}
+        profile = self.codecs["profile"].decode(profile_json)
+        if not profile:
+            return {}  # usuario sin perfil en la BD
+        # user_id y version identifican el contexto renderizado en caché
+        profile.setdefault("user_id", user_id)
+        return profile
+
+    @traced("memory.update_user_profile")
+    async def update_user_profile(self, user_id: str, profile_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Actualiza el perfil del usuario (BD y después Redis) e incrementa su versión; devuelve el perfil guardado"""
+        saved_in_db = True
+        try:
+            key = profile_key(user_id)
             
-            # Obtener perfil existente
-            existing_profile = await self.get_user_profile(user_id)
+            # Obtener perfil existente (de Redis o la BD: la caché local puede ir por detrás)
+            existing_profile = await self._load_profile(user_id)
             
-            # Merge con nueva información
-            existing_profile.update(profile_data)
-            existing_profile["last_updated"] = datetime.utcnow().isoformat()
+            for _ in range(PROFILE_WRITE_ATTEMPTS):
+                # Merge con nueva información
+                profile = {**existing_profile, **profile_data}
+                profile["user_id"] = user_id
+                profile["version"] = existing_profile.get("version", 0) + 1
+                profile["last_updated"] = datetime.utcnow().isoformat()
+                
+                try:
+                    if await self.profile_store.asave(profile):
+                        break
+                except Exception as e:
+                    # Sin BD el perfil queda sólo en Redis; migrate_profiles lo sincroniza después
+                    logger.error(f"Error guardando perfil en la BD: {str(e)}")
+                    saved_in_db = False
+                    break
+                # Otro worker guardó antes la misma versión: el cambio se aplica sobre la suya
+                existing_profile = await self.profile_store.aload(user_id) or {}
+            else:
+                logger.error(f"Conflicto de versiones guardando el perfil de {user_id}; no se ha actualizado")
+                return None
             
-            # Guardar
-            self.redis_client.set(key, json.dumps(existing_profile), ex=self.profile_ttl)
+            if saved_in_db:
+                # Se borra la copia de Redis en lugar de sobrescribirla: un SET de este worker
+                # podría llegar después del de otro con una versión más nueva. La próxima
+                # lectura la carga de la BD; borrar el lock de carga impide que una carga en
+                # curso, que pudo leer la versión anterior, la deje en Redis
+                self.redis_client.delete(key, profile_fill_key(user_id))
+            else:
+                # Redis es la única copia hasta que migrate_profiles la lleve a la BD
+                self.redis_client.set(key, self.codecs["profile"].encode(profile), ex=self.profile_ttl)
+            
+            # Los demás workers descartan su copia; este guarda la nueva
+            self.profile_cache.invalidate(user_id)
+            self.profile_cache.put(user_id, profile)
+            await self.profile_cache.publish_invalidation(user_id)
+            return profile
             
         except Exception as e:
             logger.error(f"Error actualizando perfil: {str(e)}")
+            return None
 
+    @traced("memory.cache_api_response")
     async def cache_api_response(self, api_key: str, response_data: Any, ttl: int = 3600):
         """Cachea respuestas de APIs externas"""
         try:
-            key = f"api_cache:{api_key}"
-            self.redis_client.set(key, json.dumps(response_data), ex=ttl)
+            key = api_cache_key(api_key)
+            self.redis_client.set(key, self.codecs["api_cache"].encode(response_data), ex=ttl)
         except Exception as e:
             logger.error(f"Error cacheando respuesta API: {str(e)}")
 
+    @traced("memory.get_cached_api_response")
     async def get_cached_api_response(self, api_key: str) -> Optional[Any]:
         """Obtiene respuesta cacheada de API"""
         try:
-            key = f"api_cache:{api_key}"
+            key = api_cache_key(api_key)
             cached_data = self.redis_client.get(key)
-            return json.loads(cached_data) if cached_data else None
+            record_cache("api", cached_data is not None)
+            return self.codecs["api_cache"].decode(cached_data) if cached_data else None
         except Exception as e:
             logger.error(f"Error obteniendo cache API: {str(e)}")
             return None
 
+    @traced("memory.save_plan")
+    async def save_plan(self, plan_data: Dict[str, Any]):
+        """Guarda un plan generado"""
+        try:
+            key = plan_key(plan_data["id"], plan_data.get("user_id"))
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.set(key, self.codecs["plan"].encode(plan_data), ex=self.plan_ttl)
+            # Índice de planes por usuario para poder bajarlos a la BD con el resto de sus datos
+            if plan_data.get("user_id"):
+                index_key = plans_index_key(plan_data["user_id"])
+                pipe.sadd(index_key, plan_data["id"])
+                pipe.expire(index_key, self.plan_ttl)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Error guardando plan: {str(e)}")
+
+    @traced("memory.get_plan")
+    async def get_plan(self, plan_id: str, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Obtiene un plan guardado (sin user_id, el dueño se deduce del id del plan)"""
+        try:
+            plan_data = self.redis_client.get(plan_key(plan_id, user_id))
+            if plan_data is None:
+                plan_data = await asyncio.to_thread(rehydrate_plan, self.redis_client, plan_id, user_id)
+            return self.codecs["plan"].decode(plan_data) if plan_data else None
+        except Exception as e:
+            logger.error(f"Error obteniendo plan: {str(e)}")
+            return None
+
+    @traced("memory.get_active_plans")
+    async def get_active_plans(self, user_id: str) -> Dict[str, Dict[str, Any]]:
+        """Plan vigente (el más reciente) de cada tipo del usuario"""
+        try:
+            plan_ids = [_decode_member(member) for member in self.redis_client.smembers(plans_index_key(user_id))]
+            if not plan_ids:
+                # Los planes de un usuario inactivo pueden estar en la BD (ver tiering.py)
+                plan_ids = await asyncio.to_thread(cold_plan_ids, user_id)
+        except Exception as e:
+            logger.error(f"Error obteniendo planes del usuario: {str(e)}")
+            return {}
+
+        # plan_id = <tipo>_<user_id>_<timestamp> (ver plan_generator.py)
+        latest: Dict[str, str] = {}
+        for plan_id in plan_ids:
+            plan_type = plan_id.split("_", 1)[0]
+            if plan_type not in latest or _plan_timestamp(plan_id) > _plan_timestamp(latest[plan_type]):
+                latest[plan_type] = plan_id
+
+        plans = {}
+        for plan_type, plan_id in latest.items():
+            plan = await self.get_plan(plan_id, user_id)
+            if plan:
+                plans[plan_type] = plan
+        return plans
+
     async def close(self):
         """Cierra la conexión Redis"""
         try:
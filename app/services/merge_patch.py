@@ -0,0 +1,62 @@
+# ========================================
+# app/services/merge_patch.py - JSON Merge Patch (RFC 7396)
+# ========================================
+#
+# Los patches comparten estructura con los documentos de entrada (no se copian
+# en profundidad): no deben modificarse después de calcularlos.
+
+from typing import Any, Dict
+
+
+class UnrepresentableChange(ValueError):
+    """El cambio asigna None a una clave, algo que RFC 7396 interpreta como borrado"""
+
+
+def _check_representable(value: Any, key: str = ""):
+    """Un dict del patch se fusiona recursivamente: ningún None dentro puede sobrevivir a apply"""
+    if isinstance(value, dict):
+        for inner_key, inner in value.items():
+            path = f"{key}.{inner_key}" if key else str(inner_key)
+            if inner is None:
+                raise UnrepresentableChange(path)
+            _check_representable(inner, path)
+
+
+def diff(old: Any, new: Any) -> Any:
+    """Patch mínimo que transforma old en new (las claves eliminadas van a None)"""
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        _check_representable(new)
+        return new
+
+    patch: Dict[str, Any] = {}
+    for key, value in new.items():
+        if key in old and old[key] == value:
+            continue
+        if value is None:
+            raise UnrepresentableChange(key)
+        if isinstance(old.get(key), dict) and isinstance(value, dict):
+            patch[key] = diff(old[key], value)
+        else:
+            # Listas y escalares se reemplazan completos; un dict nuevo se fusiona sobre {}
+            _check_representable(value, key)
+            patch[key] = value
+    for key in old:
+        if key not in new:
+            patch[key] = None
+    return patch
+
+
+def apply(document: Any, patch: Any) -> Any:
+    """Aplica un merge patch sin modificar el documento original"""
+    if not isinstance(patch, dict):
+        return patch
+
+    result = dict(document) if isinstance(document, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        elif isinstance(value, dict):
+            result[key] = apply(result.get(key), value)
+        else:
+            result[key] = value
+    return result
@@ -0,0 +1,214 @@
+# ========================================
+# app/services/metrics.py - Métricas Prometheus
+# ========================================
+
+from typing import Any, Dict
+from functools import wraps
+import asyncio
+import os
+import time
+import logging
+
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+
+logger = logging.getLogger(__name__)
+
+# Buckets en segundos: de llamadas a Redis (sub-ms) a ejecuciones de agentes (decenas de s)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+PROCESS_MESSAGE_SECONDS = Histogram(
+    "nutriagent_process_message_seconds", "Duración de process_message por agente enrutado",
+    ["agent"], buckets=SLOW_BUCKETS
+)
+TOOL_CALL_SECONDS = Histogram(
+    "nutriagent_tool_call_seconds", "Latencia de llamadas a herramientas",
+    ["tool"], buckets=SLOW_BUCKETS
+)
+TOOL_ERRORS = Counter(
+    "nutriagent_tool_errors_total", "Errores en llamadas a herramientas", ["tool"]
+)
+LLM_CALL_SECONDS = Histogram(
+    "nutriagent_llm_call_seconds", "Latencia de llamadas al LLM", ["agent"], buckets=SLOW_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "nutriagent_llm_tokens_total", "Tokens consumidos en llamadas al LLM", ["agent", "kind"]
+)
+REDIS_COMMAND_SECONDS = Histogram(
+    "nutriagent_redis_command_seconds", "RTT de comandos Redis de MemoryService",
+    ["command"], buckets=FAST_BUCKETS
+)
+CACHE_REQUESTS = Counter(
+    "nutriagent_cache_requests_total", "Consultas a cachés por resultado (hit/miss)", ["cache", "result"]
+)
+WEBSOCKET_CONNECTIONS = Gauge(
+    "nutriagent_websocket_connections", "WebSockets activos en ConnectionManager",
+    multiprocess_mode="livesum"
+)
+ADMISSION_REJECTIONS = Counter(
+    "nutriagent_admission_rejections_total", "Mensajes rechazados por control de admisión", ["agent", "reason"]
+)
+API_CACHE_REFRESHES = Counter(
+    "nutriagent_api_cache_refreshes_total", "Recargas de la caché de APIs externas por motivo y resultado",
+    ["trigger", "result"]
+)
+CIRCUIT_BREAKER_STATE = Gauge(
+    "nutriagent_circuit_breaker_state", "Estado del circuit breaker por endpoint (0 cerrado, 1 semiabierto, 2 abierto)",
+    ["endpoint"], multiprocess_mode="max"
+)
+CIRCUIT_BREAKER_TRANSITIONS = Counter(
+    "nutriagent_circuit_breaker_transitions_total", "Cambios de estado del circuit breaker", ["endpoint", "state"]
+)
+UPSTREAM_RETRIES = Counter(
+    "nutriagent_upstream_retries_total", "Reintentos de peticiones a APIs externas", ["endpoint"]
+)
+UPSTREAM_HEDGES = Counter(
+    "nutriagent_upstream_hedged_requests_total", "Peticiones duplicadas tras superar el p95 y cuál respondió",
+    ["endpoint", "winner"]
+)
+TIERING_DEMOTED_KEYS = Counter(
+    "nutriagent_tiering_demoted_keys_total", "Claves de usuarios inactivos bajadas de Redis a la BD", ["kind"]
+)
+TIERING_REHYDRATIONS = Counter(
+    "nutriagent_tiering_rehydrations_total", "Claves devueltas a Redis desde la BD al volver a usarse", ["kind"]
+)
+PLAN_GENERATION_SECONDS = Histogram(
+    "nutriagent_plan_generation_seconds", "Duración de generate_plan", ["plan_type"], buckets=SLOW_BUCKETS
+)
+
+
+class CacheStats:
+    """Aciertos y fallos de una caché; se vuelcan a CACHE_REQUESTS en bloque"""
+
+    # Los aciertos de las cachés en proceso cuestan menos de 1 µs: incrementar un Counter
+    # (labels + lock) en cada consulta lo duplicaría, así que el camino caliente sólo
+    # suma enteros y flush() publica la diferencia.
+    __slots__ = ("hits", "misses", "_flushed_hits", "_flushed_misses", "_hit_counter", "_miss_counter")
+
+    def __init__(self, cache: str):
+        self.hits = self.misses = 0
+        self._flushed_hits = self._flushed_misses = 0
+        self._hit_counter = CACHE_REQUESTS.labels(cache, "hit")
+        self._miss_counter = CACHE_REQUESTS.labels(cache, "miss")
+
+    def flush(self):
+        hits, misses = self.hits, self.misses
+        if hits != self._flushed_hits:
+            self._hit_counter.inc(hits - self._flushed_hits)
+            self._flushed_hits = hits
+        if misses != self._flushed_misses:
+            self._miss_counter.inc(misses - self._flushed_misses)
+            self._flushed_misses = misses
+
+
+_cache_stats: Dict[str, CacheStats] = {}
+
+
+def cache_stats(cache: str) -> CacheStats:
+    """Contadores de la caché indicada (uno por nombre y proceso)"""
+    stats = _cache_stats.get(cache)
+    if stats is None:
+        stats = _cache_stats[cache] = CacheStats(cache)
+    return stats
+
+
+def record_cache(cache: str, hit: bool):
+    """Cuenta un acierto o fallo de caché"""
+    stats = cache_stats(cache)
+    if hit:
+        stats.hits += 1
+    else:
+        stats.misses += 1
+
+
+def flush_cache_counts():
+    """Publica en CACHE_REQUESTS lo acumulado por las cachés de este proceso"""
+    for stats in list(_cache_stats.values()):
+        stats.flush()
+
+
+def _is_error_result(result: Any) -> bool:
+    # Las herramientas devuelven {"error": ...} en lugar de lanzar excepciones
+    return isinstance(result, dict) and "error" in result
+
+
+def instrument_tool(tool_name: str):
+    """Decorador que mide latencia y errores del método run de una herramienta (sync o async)"""
+    def decorator(func):
+        histogram = TOOL_CALL_SECONDS.labels(tool_name)
+        errors = TOOL_ERRORS.labels(tool_name)
+
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception:
+                    errors.inc()
+                    raise
+                finally:
+                    histogram.observe(time.perf_counter() - start)
+                if _is_error_result(result):
+                    errors.inc()
+                return result
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - start)
+            if _is_error_result(result):
+                errors.inc()
+            return result
+        return wrapper
+    return decorator
+
+
+class TimedRedis:
+    """Proxy de un cliente Redis que mide el RTT de cada comando"""
+
+    def __init__(self, client):
+        self._client = client
+        self._wrapped: Dict[str, Any] = {}
+
+    def __getattr__(self, name: str):
+        wrapped = self._wrapped.get(name)
+        if wrapped is not None:
+            return wrapped
+
+        attr = getattr(self._client, name)
+        if not callable(attr) or name.startswith("_") or name in ("pipeline", "pubsub", "close"):
+            return attr
+
+        histogram = REDIS_COMMAND_SECONDS.labels(name)
+
+        @wraps(attr)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start)
+
+        self._wrapped[name] = timed
+        return timed
+
+
+def render_metrics() -> tuple:
+    """Serializa las métricas en formato de exposición Prometheus"""
+    flush_cache_counts()
+    # Con varios workers de uvicorn, PROMETHEUS_MULTIPROC_DIR agrega todos los procesos
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -2,58 +2,115 @@
 # app/services/plan_generator.py - Generador de Planes
 # ========================================
 
-from typing import Dict, Any, Optional
-from datetime import datetime, timedelta
-import json
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from datetime import datetime
 import logging
-from sqlalchemy.orm import Session
+import time
 
-from ..database.connection import get_db
-from ..models.plans import NutritionPlan, WorkoutPlan
+from . import merge_patch
 from .memory_service import MemoryService
+from .plan_history import plan_history
+from .plan_store import plan_store
+from .shopping_list import ShoppingListAggregator
+from .metrics import PLAN_GENERATION_SECONDS
+from .targets import calculate_daily_calories, calculate_macros
+from .tracing import traced
 
 logger = logging.getLogger(__name__)
 
+# Campos recalculables de cada tipo de plan: campo -> (campos del perfil, campos del
+# plan) de los que se deriva. En orden de cálculo: cada campo va después de los suyos.
+PLAN_FIELD_DEPENDENCIES: Dict[str, Dict[str, Tuple[Tuple[str, ...], Tuple[str, ...]]]] = {
+    "nutrition": {
+        "daily_calories": (("age", "weight", "height", "gender", "activity_level", "goals"), ()),
+        "macros": (("goals",), ("daily_calories",)),
+        "meal_targets": ((), ("daily_calories", "macros")),
+        "guidelines": (("restrictions",), ()),
+        "shopping_list": (("household_size",), ("daily_calories",)),
+    },
+    "fitness": {
+        "fitness_level": (("fitness_level",), ()),
+        "weekly_schedule": (("fitness_level",), ()),
+    },
+}
+
+
+def affected_fields(plan_type: str, changed: Iterable[str]) -> List[str]:
+    """Campos del plan que dependen (directa o indirectamente) de los campos del perfil cambiados"""
+    changed = set(changed)
+    affected: List[str] = []
+    for field, (profile_fields, plan_fields) in PLAN_FIELD_DEPENDENCIES.get(plan_type, {}).items():
+        if changed.intersection(profile_fields) or any(dep in affected for dep in plan_fields):
+            affected.append(field)
+    return affected
+
+
 class PlanGenerator:
     def __init__(self):
         self.memory_service = MemoryService()
+        self.shopping_list_aggregator = ShoppingListAggregator()
+        self.plan_store = plan_store
+        self.plan_history = plan_history
+
+    @traced("plan_generator.generate_plan")
+    async def generate_plan(self, user_id: str, plan_type: str, plan_data: Dict[str, Any],
+                            user_profile: Optional[Dict[str, Any]] = None,
+                            targets: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Genera un plan personalizado y lo guarda en BD.
 
-    async def generate_plan(self, user_id: str, plan_type: str, plan_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Genera un plan personalizado y lo guarda en BD"""
+        user_profile y targets (calorías y macros) se reutilizan si el llamante ya los
+        tiene cargados; si no, el perfil se lee de Redis.
+        """
+        start = time.perf_counter()
         try:
             if plan_type == "nutrition":
-                return await self._generate_nutrition_plan(user_id, plan_data)
+                return await self._generate_nutrition_plan(user_id, plan_data, user_profile, targets)
             elif plan_type == "fitness":
-                return await self._generate_fitness_plan(user_id, plan_data)
+                return await self._generate_fitness_plan(user_id, plan_data, user_profile)
             else:
                 raise ValueError(f"Tipo de plan no soportado: {plan_type}")
                 
         except Exception as e:
             logger.error(f"Error generando plan: {str(e)}")
             return {"error": str(e)}
+        finally:
+            PLAN_GENERATION_SECONDS.labels(plan_type).observe(time.perf_counter() - start)
 
-    async def _generate_nutrition_plan(self, user_id: str, plan_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def _generate_nutrition_plan(self, user_id: str, plan_data: Dict[str, Any],
+                                       user_profile: Optional[Dict[str, Any]] = None,
+                                       targets: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Genera plan nutricional detallado"""
         
         # Obtener perfil de usuario para cálculos
-        user_profile = await self.memory_service.get_user_profile(user_id)
+        if user_profile is None:
+            user_profile = await self.memory_service.get_user_profile(user_id)
         
-        # Calcular requerimientos calóricos básicos
-        calories = self._calculate_daily_calories(user_profile)
-        macros = self._calculate_macros(calories, user_profile.get('goals', 'maintenance'))
+        # Calcular requerimientos calóricos básicos (o reutilizar los precalculados)
+        if targets:
+            calories, macros = targets["daily_calories"], targets["macros"]
+        else:
+            calories = self._calculate_daily_calories(user_profile)
+            macros = self._calculate_macros(calories, user_profile.get('goals', 'maintenance'))
+        duration = plan_data.get("duration", "7_days")
+        meals = self._generate_meal_structure()
         
         # Estructura del plan nutricional
         nutrition_plan = {
             "id": f"nutrition_{user_id}_{int(datetime.utcnow().timestamp())}",
             "user_id": user_id,
             "type": "nutrition",
-            "duration": plan_data.get("duration", "7_days"),
+            "duration": duration,
             "created_at": datetime.utcnow().isoformat(),
             "daily_calories": calories,
             "macros": macros,
-            "meals": self._generate_meal_structure(),
+            "meals": meals,
+            "meal_targets": self._calculate_meal_targets(calories, macros, meals),
             "guidelines": self._generate_nutrition_guidelines(user_profile),
-            "shopping_list": self._generate_shopping_list(macros),
+            "shopping_list": self._generate_shopping_list(
+                calories, meals, self._parse_duration_days(duration),
+                user_profile.get("household_size", 1)
+            ),
             "notes": plan_data.get("content", "")
         }
         
@@ -62,10 +119,12 @@ class PlanGenerator:
         
         return nutrition_plan
 
-    async def _generate_fitness_plan(self, user_id: str, plan_data: Dict[str, Any]) -> Dict[str, Any]:
+    async def _generate_fitness_plan(self, user_id: str, plan_data: Dict[str, Any],
+                                     user_profile: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """Genera plan de entrenamiento detallado"""
         
-        user_profile = await self.memory_service.get_user_profile(user_id)
+        if user_profile is None:
+            user_profile = await self.memory_service.get_user_profile(user_id)
         
         fitness_plan = {
             "id": f"fitness_{user_id}_{int(datetime.utcnow().timestamp())}",
@@ -84,71 +143,92 @@ class PlanGenerator:
         
         return fitness_plan
 
-    def _calculate_daily_calories(self, user_profile: Dict[str, Any]) -> int:
-        """Calcula calorías diarias usando fórmula Harris-Benedict"""
-        try:
-            age = user_profile.get('age', 30)
-            weight = user_profile.get('weight', 70)
-            height = user_profile.get('height', 170)
-            gender = user_profile.get('gender', 'male')
-            activity_level = user_profile.get('activity_level', 'moderate')
-            
-            # Tasa Metabólica Basal (TMB)
-            if gender.lower() == 'female':
-                bmr = 447.593 + (9.247 * weight) + (3.098 * height) - (4.330 * age)
-            else:
-                bmr = 88.362 + (13.397 * weight) + (4.799 * height) - (5.677 * age)
-            
-            # Factor de actividad
-            activity_multipliers = {
-                'sedentary': 1.2,
-                'light': 1.375,
-                'moderate': 1.55,
-                'active': 1.725,
-                'very_active': 1.9
-            }
-            
-            multiplier = activity_multipliers.get(activity_level, 1.55)
-            tdee = bmr * multiplier
-            
-            # Ajustar según objetivos
-            goals = user_profile.get('goals', 'maintenance')
-            if 'perder peso' in goals.lower() or 'lose weight' in goals.lower():
-                return int(tdee * 0.8)  # Déficit del 20%
-            elif 'ganar peso' in goals.lower() or 'gain weight' in goals.lower():
-                return int(tdee * 1.15)  # Superávit del 15%
-            else:
-                return int(tdee)  # Mantenimiento
-                
-        except Exception as e:
-            logger.error(f"Error calculando calorías: {str(e)}")
-            return 2000  # Valor por defecto
+    @traced("plan_generator.update_plans_for_profile")
+    async def update_plans_for_profile(self, user_id: str, changed: Iterable[str],
+                                       user_profile: Dict[str, Any]) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """
+        Recalcula en los planes vigentes del usuario sólo los campos que dependen de los
+        campos del perfil cambiados y los guarda. Devuelve (plan actualizado, patch) de
+        cada plan que ha cambiado.
+        """
+        changed = set(changed)
+        if not any(affected_fields(plan_type, changed) for plan_type in PLAN_FIELD_DEPENDENCIES):
+            return []
 
-    def _calculate_macros(self, calories: int, goals: str) -> Dict[str, int]:
-        """Calcula distribución de macronutrientes"""
-        
-        if 'ganar músculo' in goals.lower() or 'muscle' in goals.lower():
-            # Alto en proteína para ganancia muscular
-            protein_ratio = 0.30
-            carb_ratio = 0.40
-            fat_ratio = 0.30
-        elif 'perder peso' in goals.lower() or 'lose weight' in goals.lower():
-            # Moderado en proteína, bajo en carbos
-            protein_ratio = 0.35
-            carb_ratio = 0.30
-            fat_ratio = 0.35
-        else:
-            # Balanceado para mantenimiento
-            protein_ratio = 0.25
-            carb_ratio = 0.45
-            fat_ratio = 0.30
-        
-        return {
-            "protein_g": int((calories * protein_ratio) / 4),
-            "carbs_g": int((calories * carb_ratio) / 4),
-            "fats_g": int((calories * fat_ratio) / 9),
-            "fiber_g": max(25, int(calories / 80))  # Mínimo 25g
-        }
+        updated = []
+        for plan_type, plan in (await self.memory_service.get_active_plans(user_id)).items():
+            fields = affected_fields(plan_type, changed)
+            if not fields:
+                continue
+            try:
+                recomputed = self._recompute_fields(plan, fields, user_profile)
+            except Exception as e:
+                logger.error(f"Error recalculando el plan {plan.get('id')}: {str(e)}")
+                continue
+            previous = {field: plan.get(field) for field in fields}
+            try:
+                patch = merge_patch.diff(previous, recomputed)
+                replace = False
+            except merge_patch.UnrepresentableChange:
+                # Un None dentro de un campo: los campos cambiados se reemplazan completos
+                patch = {field: value for field, value in recomputed.items() if previous.get(field) != value}
+                replace = True
+            if not patch:
+                continue
+            patch["updated_at"] = datetime.utcnow().isoformat()
+            new_plan = {**plan, **patch} if replace else merge_patch.apply(plan, patch)
+            await self._save_plan_to_db(new_plan)
+            logger.info(f"Plan {plan['id']} recalculado: {', '.join(sorted(recomputed))}")
+            updated.append((new_plan, patch))
+        return updated
+
+    def _recompute_fields(self, plan: Dict[str, Any], fields: List[str],
+                          user_profile: Dict[str, Any]) -> Dict[str, Any]:
+        """Nuevos valores de fields (en el orden de PLAN_FIELD_DEPENDENCIES)"""
+        values: Dict[str, Any] = {}
+
+        def current(field: str) -> Any:
+            # Los campos ya recalculados en esta pasada sustituyen a los del plan
+            return values[field] if field in values else plan.get(field)
+
+        for field in fields:
+            if field == "daily_calories":
+                values[field] = self._calculate_daily_calories(user_profile)
+            elif field == "macros":
+                values[field] = self._calculate_macros(current("daily_calories"),
+                                                       user_profile.get('goals', 'maintenance'))
+            elif field == "meal_targets":
+                values[field] = self._calculate_meal_targets(current("daily_calories"), current("macros"),
+                                                             plan.get("meals") or {})
+            elif field == "guidelines":
+                values[field] = self._generate_nutrition_guidelines(user_profile)
+            elif field == "shopping_list":
+                values[field] = self._generate_shopping_list(
+                    current("daily_calories"), plan.get("meals") or {},
+                    self._parse_duration_days(plan.get("duration", "7_days")),
+                    user_profile.get("household_size", 1)
+                )
+            elif field == "fitness_level":
+                values[field] = user_profile.get("fitness_level", "beginner")
+            elif field == "weekly_schedule":
+                values[field] = self._generate_workout_schedule(user_profile)
+        return values
+
+    # Cálculos en app/services/targets.py (también los usa la precarga de sesión)
+    _calculate_daily_calories = staticmethod(calculate_daily_calories)
+    _calculate_macros = staticmethod(calculate_macros)
+
+    def _calculate_meal_targets(self, daily_calories: int, macros: Dict[str, int],
+                                meals: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+        """Calorías y macros de cada comida según su porcentaje de las calorías diarias"""
+        targets = {}
+        for meal_name, meal in meals.items():
+            share = meal.get("calories_percentage", 0) / 100
+            targets[meal_name] = {
+                "calories": int(daily_calories * share),
+                **{nutrient: int(grams * share) for nutrient, grams in macros.items()},
+            }
+        return targets
 
     def _generate_meal_structure(self) -> Dict[str, Any]:
         """Genera estructura básica de comidas"""
@@ -213,30 +293,24 @@ class PlanGenerator:
         
         return guidelines
 
-    def _generate_shopping_list(self, macros: Dict[str, int]) -> Dict[str, List[str]]:
-        """Genera lista de compras básica"""
-        return {
-            "proteins": [
-                "Pollo (pechuga)", "Pescado (salmón, atún)", "Huevos",
-                "Legumbres (lentejas, garbanzos)", "Yogur griego"
-            ],
-            "carbs": [
-                "Avena", "Quinoa", "Arroz integral", "Pan integral",
-                "Patatas", "Frutas (plátano, manzana, bayas)"
-            ],
-            "fats": [
-                "Aguacate", "Frutos secos", "Aceite de oliva",
-                "Semillas (chía, lino)", "Pescado graso"
-            ],
-            "vegetables": [
-                "Espinacas", "Brócoli", "Tomates", "Pepino",
-                "Pimientos", "Cebolla", "Ajo"
-            ],
-            "others": [
-                "Especias variadas", "Limón", "Vinagre",
-                "Té verde", "Agua con gas"
-            ]
-        }
+    def _generate_shopping_list(self, daily_calories: int, meals: Dict[str, Any],
+                                days: int, household_size: int = 1) -> Dict[str, List[Dict[str, Any]]]:
+        """Genera la lista de compras agregando los ingredientes de todos los días y comidas"""
+        try:
+            return self.shopping_list_aggregator.from_meal_plan(
+                meals, days, daily_calories, int(household_size or 1)
+            )
+        except Exception as e:
+            logger.error(f"Error generando lista de compras: {str(e)}")
+            return {}
+
+    def _parse_duration_days(self, duration: str) -> int:
+        """Convierte duraciones tipo '7_days', '4_weeks' o '1_day' a número de días"""
+        try:
+            amount, unit = duration.split("_", 1)
+            return int(amount) * (7 if unit.startswith("week") else 1)
+        except (ValueError, AttributeError):
+            return 7
 
     def _generate_workout_schedule(self, user_profile: Dict[str, Any]) -> Dict[str, Any]:
         """Genera horario semanal de entrenamientos"""
@@ -309,15 +383,12 @@ class PlanGenerator:
     async def _save_plan_to_db(self, plan_data: Dict[str, Any]):
         """Guarda el plan en la base de datos"""
         try:
-            # Aquí se implementaría la lógica de guardado en PostgreSQL
-            # Por ahora lo guardamos en cache Redis como backup
-            cache_key = f"plan:{plan_data['id']}"
-            await self.memory_service.redis_client.set(
-                cache_key, 
-                json.dumps(plan_data), 
-                ex=2592000  # 30 días
-            )
-            logger.info(f"Plan guardado: {plan_data['id']}")
+            # Redis para el chat; la tabla del tipo de plan para la API (app/api/plans.py)
+            await self.memory_service.save_plan(plan_data)
+            await self.plan_store.asave(plan_data)
+            # Nueva versión en el historial del plan (patch respecto a la anterior)
+            version = await self.plan_history.arecord(plan_data)
+            logger.info(f"Plan guardado: {plan_data['id']} (versión {version})")
             
         except Exception as e:
             logger.error(f"Error guardando plan: {str(e)}")
\ No newline at end of file
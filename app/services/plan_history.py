@@ -0,0 +1,168 @@
+# ========================================
+# app/services/plan_history.py - Historial de Versiones de Planes
+# ========================================
+#
+# Cada plan guardado es una nueva versión del plan de su usuario y tipo (tabla
+# plan_versions). Una versión se guarda como merge patch (RFC 7396, merge_patch.py)
+# respecto a la anterior y, cada cierto tiempo, como instantánea completa:
+#   - tras PLAN_HISTORY_REBASE_EVERY patches seguidos, o
+#   - si los patches desde la última instantánea ya suman más de
+#     PLAN_HISTORY_REBASE_RATIO veces el tamaño de esa instantánea.
+# Leer una versión cuesta una instantánea y como mucho PLAN_HISTORY_REBASE_EVERY
+# patches pequeños; el historial se lista sin leer los datos (columna size).
+#
+# SQLAlchemy y los modelos se importan al primer uso, como en profile_store.py.
+
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+import os
+
+from . import merge_patch
+from .codecs import ValueCodec
+
+logger = logging.getLogger(__name__)
+
+PLAN_HISTORY_REBASE_EVERY = int(os.getenv("PLAN_HISTORY_REBASE_EVERY", "10"))
+PLAN_HISTORY_REBASE_RATIO = float(os.getenv("PLAN_HISTORY_REBASE_RATIO", "0.5"))
+# Reintentos si otro worker guarda a la vez una versión del mismo plan
+PLAN_HISTORY_WRITE_ATTEMPTS = 3
+
+# Las instantáneas (listas de la compra, ejercicios) comprimen bien; los patches suelen ser pequeños
+HISTORY_CODEC = ValueCodec("msgpack", compress_threshold=512)
+
+
+class PlanHistory:
+    """Versiones de los planes en la base de datos (síncrona, en hilos aparte)"""
+
+    def __init__(self, session_factory=None):
+        self._session_factory = session_factory
+
+    def _session(self):
+        if self._session_factory is None:
+            from ..database.connection import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    def record(self, plan: Dict[str, Any]) -> Optional[int]:
+        """Guarda plan como nueva versión de su usuario y tipo; devuelve el número de versión"""
+        from sqlalchemy.exc import IntegrityError
+
+        for _ in range(PLAN_HISTORY_WRITE_ATTEMPTS):
+            try:
+                return self._record_once(plan)
+            except IntegrityError:
+                # Otro worker guardó antes la misma versión: se calcula sobre la suya
+                continue
+        logger.error(f"Conflicto de versiones guardando el historial del plan {plan.get('id')}")
+        return None
+
+    def _record_once(self, plan: Dict[str, Any]) -> int:
+        from ..models.plans import PlanVersion
+
+        user_id, plan_type = str(plan["user_id"]), plan["type"]
+        with self._session() as session:
+            chain = self._chain(session, user_id, plan_type)
+            if not chain:
+                version, kind, base_version, data = 1, "snapshot", 1, HISTORY_CODEC.encode(plan)
+            else:
+                previous = self._rebuild(chain)
+                if previous == plan:
+                    return chain[-1].version
+                version = chain[-1].version + 1
+                kind, base_version, data = self._encode_version(chain, previous, plan, version)
+            session.add(PlanVersion(
+                user_id=user_id, plan_type=plan_type, version=version, plan_id=plan["id"],
+                kind=kind, base_version=base_version, data=data, size=len(data),
+            ))
+            session.commit()
+            return version
+
+    @staticmethod
+    def _encode_version(chain, previous: Dict[str, Any], plan: Dict[str, Any], version: int):
+        """(kind, base_version, data) de la nueva versión: patch o, si toca re-basar, instantánea"""
+        snapshot = HISTORY_CODEC.encode(plan)
+        try:
+            data = HISTORY_CODEC.encode(merge_patch.diff(previous, plan))
+        except merge_patch.UnrepresentableChange:
+            # Un valor None no se puede expresar como merge patch
+            return "snapshot", version, snapshot
+        patches = chain[1:]
+        patch_bytes = sum(row.size for row in patches) + len(data)
+        if (len(patches) + 1 > PLAN_HISTORY_REBASE_EVERY
+                or patch_bytes > PLAN_HISTORY_REBASE_RATIO * chain[0].size
+                or len(data) >= len(snapshot)):
+            return "snapshot", version, snapshot
+        return "patch", chain[0].version, data
+
+    @staticmethod
+    def _chain(session, user_id: str, plan_type: str, version: Optional[int] = None) -> List[Any]:
+        """Instantánea base de version (por defecto, la última) y sus patches hasta version"""
+        from ..models.plans import PlanVersion
+
+        query = session.query(PlanVersion.version, PlanVersion.base_version).filter(
+            PlanVersion.user_id == user_id, PlanVersion.plan_type == plan_type
+        )
+        if version is not None:
+            target = query.filter(PlanVersion.version == version).one_or_none()
+        else:
+            target = query.order_by(PlanVersion.version.desc()).first()
+        if target is None:
+            return []
+        return (
+            session.query(PlanVersion.version, PlanVersion.kind, PlanVersion.data, PlanVersion.size)
+            .filter(
+                PlanVersion.user_id == user_id,
+                PlanVersion.plan_type == plan_type,
+                PlanVersion.version >= target.base_version,
+                PlanVersion.version <= target.version,
+            )
+            .order_by(PlanVersion.version)
+            .all()
+        )
+
+    @staticmethod
+    def _rebuild(chain) -> Dict[str, Any]:
+        plan = HISTORY_CODEC.decode(chain[0].data)
+        for row in chain[1:]:
+            plan = merge_patch.apply(plan, HISTORY_CODEC.decode(row.data))
+        return plan
+
+    def get_version(self, user_id: str, plan_type: str, version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Plan tal y como era en version (por defecto, la última), o None si no existe"""
+        with self._session() as session:
+            chain = self._chain(session, str(user_id), plan_type, version)
+        return self._rebuild(chain) if chain else None
+
+    def list_versions(self, user_id: str, plan_type: str, limit: int = 20,
+                      before: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Versiones más recientes primero (sin los datos); before pagina por número de versión"""
+        from ..models.plans import PlanVersion
+
+        with self._session() as session:
+            query = session.query(
+                PlanVersion.version, PlanVersion.plan_id, PlanVersion.kind,
+                PlanVersion.size, PlanVersion.created_at,
+            ).filter(PlanVersion.user_id == str(user_id), PlanVersion.plan_type == plan_type)
+            if before is not None:
+                query = query.filter(PlanVersion.version < before)
+            rows = query.order_by(PlanVersion.version.desc()).limit(limit).all()
+        return [
+            {"version": row.version, "plan_id": row.plan_id, "kind": row.kind,
+             "size": row.size, "created_at": row.created_at}
+            for row in rows
+        ]
+
+    async def arecord(self, plan: Dict[str, Any]) -> Optional[int]:
+        return await asyncio.to_thread(self.record, plan)
+
+    async def aget_version(self, user_id: str, plan_type: str,
+                           version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.get_version, user_id, plan_type, version)
+
+    async def alist_versions(self, user_id: str, plan_type: str, limit: int = 20,
+                             before: Optional[int] = None) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self.list_versions, user_id, plan_type, limit, before)
+
+
+plan_history = PlanHistory()
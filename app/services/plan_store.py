@@ -0,0 +1,105 @@
+# ========================================
+# app/services/plan_store.py - Planes en PostgreSQL
+# ========================================
+#
+# Cada plan guardado se escribe en nutrition_plans o workout_plans (upsert por
+# plan_id: un plan recalculado tras un cambio de perfil actualiza su fila) y pasa
+# a ser el plan activo de su usuario y tipo. Las columnas de resumen se rellenan
+# desde el plan para que los listados no tengan que leer plan_data (ver
+# app/api/plans.py).
+#
+# SQLAlchemy y los modelos se importan al primer uso, como en profile_store.py.
+
+from datetime import datetime, timezone
+from typing import Any, Dict
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def plan_model(plan_type: str):
+    """Modelo de la tabla de un tipo de plan (None si el tipo no tiene tabla)"""
+    from ..models.plans import NutritionPlan, WorkoutPlan
+
+    return {"nutrition": NutritionPlan, "fitness": WorkoutPlan}.get(plan_type)
+
+
+def _created_at(plan: Dict[str, Any]) -> datetime:
+    # La fecha del plan y no la de la escritura: ordena los listados (ver app/api/plans.py)
+    try:
+        created_at = datetime.fromisoformat(plan["created_at"])
+    except (KeyError, TypeError, ValueError):
+        return datetime.now(timezone.utc)
+    return created_at if created_at.tzinfo else created_at.replace(tzinfo=timezone.utc)
+
+
+def plan_to_row(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """Fila de la tabla del plan: columnas de resumen y el plan completo en plan_data"""
+    row = {
+        "plan_id": plan["id"],
+        "user_id": str(plan["user_id"]),
+        "name": plan.get("name"),
+        "duration": plan.get("duration"),
+        "plan_data": plan,
+        "is_active": 1,
+        "created_at": _created_at(plan),
+    }
+    if plan.get("type") == "nutrition":
+        macros = plan.get("macros") or {}
+        row.update({
+            "daily_calories": plan.get("daily_calories"),
+            **{nutrient: macros.get(nutrient) for nutrient in ("protein_g", "carbs_g", "fats_g", "fiber_g")},
+        })
+    else:
+        schedule = plan.get("weekly_schedule") or {}
+        row.update({
+            "fitness_level": plan.get("fitness_level"),
+            "weekly_frequency": sum(1 for day in schedule.values() if day.get("type") != "rest"),
+        })
+    return row
+
+
+class PlanStore:
+    """Escritura de planes en la base de datos (síncrona, en hilos aparte)"""
+
+    def __init__(self, session_factory=None):
+        self._session_factory = session_factory
+
+    def _session(self):
+        if self._session_factory is None:
+            from ..database.connection import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    def save(self, plan: Dict[str, Any]) -> bool:
+        """Guarda el plan como activo y desactiva los anteriores del mismo usuario y tipo"""
+        from sqlalchemy.sql import func
+
+        model = plan_model(plan.get("type"))
+        if model is None:
+            return False
+        row = plan_to_row(plan)
+        with self._session() as session:
+            if session.get_bind().dialect.name == "sqlite":
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            stmt = insert(model).values(row)
+            updates = {
+                column: stmt.excluded[column] for column in row if column not in ("plan_id", "user_id", "created_at")
+            }
+            updates["updated_at"] = func.now()
+            session.execute(stmt.on_conflict_do_update(index_elements=[model.plan_id], set_=updates))
+            # En la misma transacción: el usuario siempre tiene un solo plan activo por tipo
+            session.query(model).filter(
+                model.user_id == row["user_id"], model.is_active == 1, model.plan_id != row["plan_id"]
+            ).update({model.is_active: 0}, synchronize_session=False)
+            session.commit()
+        return True
+
+    async def asave(self, plan: Dict[str, Any]) -> bool:
+        return await asyncio.to_thread(self.save, plan)
+
+
+plan_store = PlanStore()
@@ -0,0 +1,89 @@
+# ========================================
+# app/services/profile_cache.py - Caché Local de Perfiles
+# ========================================
+#
+# Primer nivel (LRU con TTL, por proceso) delante del perfil en Redis. Cuando un
+# worker escribe un perfil publica su user_id en PROFILE_INVALIDATION_CHANNEL y el
+# resto lo descartan; el TTL acota lo que puede durar un perfil obsoleto si algún
+# aviso se pierde (p. ej. con pub/sub caído).
+
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import logging
+import os
+import time
+
+from .metrics import cache_stats
+from .pubsub import PubSubBus, bus
+
+logger = logging.getLogger(__name__)
+
+PROFILE_LOCAL_CACHE_SIZE = int(os.getenv("PROFILE_LOCAL_CACHE_SIZE", "10000"))
+PROFILE_LOCAL_CACHE_TTL = float(os.getenv("PROFILE_LOCAL_CACHE_TTL", "60"))
+PROFILE_INVALIDATION_CHANNEL = "profile:invalidate"
+
+PROFILE_CACHE_STATS = cache_stats("profile_local")
+
+
+class ProfileCache:
+    """LRU de perfiles con caducidad; devuelve copias para que nadie modifique la entrada"""
+
+    def __init__(self, max_size: int = PROFILE_LOCAL_CACHE_SIZE, ttl: float = PROFILE_LOCAL_CACHE_TTL,
+                 pubsub: PubSubBus = bus):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.pubsub = pubsub
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        # Cambia con cada invalidación: una lectura de Redis que empezó antes no se guarda
+        self.generation = 0
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            PROFILE_CACHE_STATS.misses += 1
+            return None
+        expires_at, profile = entry
+        if expires_at <= time.monotonic():
+            del self._entries[user_id]
+            PROFILE_CACHE_STATS.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        PROFILE_CACHE_STATS.hits += 1
+        return dict(profile)
+
+    def put(self, user_id: str, profile: Dict[str, Any], generation: Optional[int] = None):
+        """Guarda el perfil salvo que haya habido invalidaciones desde generation"""
+        if self.max_size <= 0 or (generation is not None and generation != self.generation):
+            return
+        self._entries[user_id] = (time.monotonic() + self.ttl, dict(profile))
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str):
+        self.generation += 1
+        self._entries.pop(user_id, None)
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+
+    async def publish_invalidation(self, user_id: str):
+        """Avisa al resto de workers de que el perfil de user_id ha cambiado"""
+        await self.pubsub.publish(PROFILE_INVALIDATION_CHANNEL, {"user_id": user_id})
+
+    async def start(self):
+        """Escucha las invalidaciones de otros workers (el bus debe estar iniciado)"""
+        await self.pubsub.subscribe(PROFILE_INVALIDATION_CHANNEL, self._on_invalidation)
+
+    async def stop(self):
+        await self.pubsub.unsubscribe(PROFILE_INVALIDATION_CHANNEL)
+        self.clear()
+
+    async def _on_invalidation(self, data: Any, origin_node: str):
+        user_id = data.get("user_id") if isinstance(data, dict) else None
+        if user_id:
+            self.invalidate(user_id)
+
+
+profile_cache = ProfileCache()
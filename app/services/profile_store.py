@@ -0,0 +1,126 @@
+# ========================================
+# app/services/profile_store.py - Perfiles en PostgreSQL
+# ========================================
+#
+# La tabla user_profiles es la fuente de verdad de los perfiles; profile:<id> en
+# Redis es sólo una caché con TTL delante (ver MemoryService). Los campos con
+# columna propia se guardan en ella y el resto del perfil va en profile_data.
+# Cada escritura lleva la versión del perfil y sólo se aplica si es más nueva que
+# la guardada: dos workers que modifican el mismo perfil no se pisan.
+#
+# SQLAlchemy y los modelos se importan al primer uso (no en el arranque del servidor).
+
+from typing import Any, Dict, Iterable, List, Optional
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Campos del perfil con columna propia y el tipo que admite la columna
+PROFILE_COLUMNS = {
+    "age": int,
+    "weight": int,
+    "height": int,
+    "gender": str,
+    "activity_level": str,
+    "fitness_level": str,
+    "goals": str,
+    "restrictions": str,
+    "injuries": str,
+    "equipment": str,
+    "time_available": str,
+}
+
+
+def profile_to_row(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Fila de user_profiles para un perfil (todas las columnas, None si falta el campo)"""
+    row: Dict[str, Any] = {"user_id": str(profile["user_id"]), "version": int(profile.get("version") or 0)}
+    extra: Dict[str, Any] = {}
+    for field, value in profile.items():
+        if field in ("user_id", "version"):
+            continue
+        expected = PROFILE_COLUMNS.get(field)
+        # bool es int en Python; un peso de 72.5 no cabe en la columna entera
+        if expected is not None and isinstance(value, expected) and not isinstance(value, bool):
+            row[field] = value
+        else:
+            extra[field] = value
+    for field in PROFILE_COLUMNS:
+        row.setdefault(field, None)
+    row["profile_data"] = extra
+    return row
+
+
+def row_to_profile(row) -> Dict[str, Any]:
+    """Perfil (el mismo dict que se guarda en Redis) a partir de una fila de user_profiles"""
+    profile: Dict[str, Any] = {
+        field: getattr(row, field) for field in PROFILE_COLUMNS if getattr(row, field) is not None
+    }
+    profile.update(row.profile_data or {})
+    profile["user_id"] = row.user_id
+    profile["version"] = row.version or 0
+    return profile
+
+
+class ProfileStore:
+    """Lectura y escritura de perfiles en la base de datos (síncrona, en hilos aparte)"""
+
+    def __init__(self, session_factory=None):
+        self._session_factory = session_factory
+
+    def _session(self):
+        if self._session_factory is None:
+            from ..database.connection import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    def load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Perfil guardado de user_id, o None si no tiene"""
+        from ..models.user import UserProfile
+
+        with self._session() as session:
+            row = session.query(UserProfile).filter(UserProfile.user_id == str(user_id)).one_or_none()
+            return row_to_profile(row) if row is not None else None
+
+    def save(self, profile: Dict[str, Any]) -> bool:
+        """Guarda el perfil si su versión es más nueva que la de la BD; False si no lo era"""
+        return self.save_many([profile]) == 1
+
+    def save_many(self, profiles: Iterable[Dict[str, Any]]) -> int:
+        """Upsert de varios perfiles en una sola sentencia; devuelve cuántos se escribieron"""
+        rows = [profile_to_row(profile) for profile in profiles]
+        if not rows:
+            return 0
+        with self._session() as session:
+            result = session.execute(self._upsert(session.get_bind().dialect.name, rows))
+            session.commit()
+            return result.rowcount
+
+    @staticmethod
+    def _upsert(dialect: str, rows: List[Dict[str, Any]]):
+        from sqlalchemy.sql import func
+        from ..models.user import UserProfile
+
+        if dialect == "sqlite":
+            # Sólo para desarrollo local; en producción la BD es PostgreSQL
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+
+        stmt = insert(UserProfile).values(rows)
+        updates = {column: stmt.excluded[column] for column in rows[0] if column != "user_id"}
+        updates["updated_at"] = func.now()
+        return stmt.on_conflict_do_update(
+            index_elements=[UserProfile.user_id],
+            set_=updates,
+            where=UserProfile.version < stmt.excluded.version,
+        )
+
+    async def aload(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.load, user_id)
+
+    async def asave(self, profile: Dict[str, Any]) -> bool:
+        return await asyncio.to_thread(self.save, profile)
+
+
+profile_store = ProfileStore()
@@ -0,0 +1,149 @@
+# ========================================
+# app/services/profiling.py - Perfilado Bajo Demanda por Petición
+# ========================================
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime
+import hmac
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Sin PROFILING_TOKEN el perfilado queda desactivado por completo
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILING_DIR = os.getenv("PROFILING_DIR", "profiles")
+PROFILING_INTERVAL = float(os.getenv("PROFILING_INTERVAL", "0.001"))
+# Máximo de perfiles por minuto y proceso
+PROFILING_RATE_LIMIT = int(os.getenv("PROFILING_RATE_LIMIT", "6"))
+PROFILE_HEADER = b"x-profile-token"
+
+# Perfil en curso de la tarea actual: (intervalo, sesiones de los hilos). asyncio.to_thread
+# copia el contexto, así que los hilos de los agentes saben si tienen que perfilarse
+_active_profile: ContextVar[Optional[Tuple[float, List[Any]]]] = ContextVar("active_profile", default=None)
+
+
+def run_profiled(func: Callable, *args, **kwargs):
+    """
+    Ejecuta func en el hilo actual; si la petición que la lanzó se está perfilando, perfila
+    también este hilo (el perfilador de la petición sólo muestrea el hilo del event loop)
+    """
+    active = _active_profile.get()
+    if active is None:
+        return func(*args, **kwargs)
+
+    from pyinstrument import Profiler
+
+    interval, sessions = active
+    profiler = Profiler(interval=interval, async_mode="disabled")
+    profiler.start()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sessions.append(profiler.stop())
+
+
+class RequestProfiler:
+    """Ejecuta peticiones concretas bajo pyinstrument y guarda el resultado en formato speedscope"""
+
+    def __init__(self, token: str = PROFILING_TOKEN, output_dir: str = PROFILING_DIR,
+                 rate_limit: int = PROFILING_RATE_LIMIT, interval: float = PROFILING_INTERVAL):
+        self.token = token
+        self.output_dir = output_dir
+        self.rate_limit = rate_limit
+        self.interval = interval
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def authorize(self, token: Optional[str]) -> bool:
+        """Comprueba el token privilegiado y el límite de perfiles por minuto"""
+        if not self.token or not token or not hmac.compare_digest(str(token), self.token):
+            return False
+
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and now - self._recent[0] > 60:
+                self._recent.popleft()
+            if len(self._recent) >= self.rate_limit:
+                logger.warning("Perfilado rechazado: límite por minuto alcanzado")
+                return False
+            self._recent.append(now)
+        return True
+
+    def new_profile_path(self, label: str) -> str:
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        safe_label = "".join(c if c.isalnum() or c in "-_" else "_" for c in label)[:40]
+        return os.path.join(self.output_dir, f"{stamp}-{safe_label}-{uuid.uuid4().hex[:8]}.speedscope.json")
+
+    @asynccontextmanager
+    async def profile(self, label: str, path: Optional[str] = None, inline: bool = False):
+        """Perfila el bloque; rellena el dict devuelto con la ruta (y el perfil si inline)"""
+        # Import diferido: pyinstrument sólo se carga cuando alguien pide un perfil
+        from pyinstrument import Profiler
+        from pyinstrument.renderers import SpeedscopeRenderer
+        from pyinstrument.session import Session
+
+        result: Dict[str, Any] = {"path": path or self.new_profile_path(label)}
+        # async_mode="enabled" limita las muestras a la tarea actual, no al resto de peticiones
+        profiler = Profiler(interval=self.interval, async_mode="enabled")
+        # Los hilos lanzados con run_profiled (ejecutores de los agentes) añaden aquí su sesión
+        thread_sessions: List[Any] = []
+        context_token = _active_profile.set((self.interval, thread_sessions))
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            yield result
+        finally:
+            session = profiler.stop()
+            _active_profile.reset(context_token)
+            result["duration_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            try:
+                for thread_session in thread_sessions:
+                    session = Session.combine(session, thread_session)
+                rendered = SpeedscopeRenderer().render(session)
+                os.makedirs(os.path.dirname(result["path"]) or ".", exist_ok=True)
+                with open(result["path"], "w", encoding="utf-8") as f:
+                    f.write(rendered)
+                if inline:
+                    result["speedscope"] = rendered
+                logger.info(f"Perfil de {label} guardado en {result['path']}")
+            except Exception as e:
+                logger.error(f"Error guardando perfil: {str(e)}")
+                result["error"] = str(e)
+
+
+request_profiler = RequestProfiler()
+
+
+class ProfilingMiddleware:
+    """Middleware ASGI: perfila peticiones HTTP con la cabecera X-Profile-Token válida"""
+
+    def __init__(self, app, profiler: RequestProfiler = request_profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        # Camino normal: sin token configurado o sin cabecera no se hace nada más
+        if scope["type"] != "http" or not self.profiler.token:
+            return await self.app(scope, receive, send)
+        token = next((v.decode("latin-1") for k, v in scope["headers"] if k == PROFILE_HEADER), None)
+        if token is None or not self.profiler.authorize(token):
+            return await self.app(scope, receive, send)
+
+        path = self.profiler.new_profile_path(scope["path"])
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-path", path.encode("latin-1")))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        async with self.profiler.profile(scope["path"], path=path):
+            await self.app(scope, receive, send_with_header)
@@ -0,0 +1,222 @@
+# ========================================
+# app/services/prompt_builder.py - Construcción de Prompts con Presupuesto de Tokens
+# ========================================
+
+from typing import Dict, Any, List, Optional, Tuple, Callable
+from collections import OrderedDict
+import math
+import re
+import logging
+
+from .metrics import cache_stats
+
+logger = logging.getLogger(__name__)
+
+# Presupuesto de tokens del input de usuario por agente (sin contar el system prompt)
+AGENT_TOKEN_BUDGETS = {
+    "nutrition": 700,
+    "fitness": 700,
+    "research": 500,
+    "personalization": 500,
+}
+DEFAULT_TOKEN_BUDGET = 600
+
+# Límites por elemento para que un solo turno no consuma el presupuesto
+MAX_TURN_TOKENS = 120
+MAX_SUMMARY_TOKENS = 150
+SUMMARY_LINE_CHARS = 90
+
+# Tamaño máximo de la caché de datos derivados por turno (render, términos, resumen)
+TURN_CACHE_SIZE = 5000
+# Tamaño máximo de la caché de perfiles renderizados (usuario, versión, agente)
+PROFILE_CACHE_SIZE = 10000
+
+# Aciertos/fallos de las cachés de turnos y perfiles renderizados (/metrics)
+PROMPT_TURN_STATS = cache_stats("prompt_turn")
+RENDERED_PROFILE_STATS = cache_stats("rendered_profile")
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = {
+    "de", "la", "el", "en", "y", "a", "que", "los", "las", "un", "una", "por",
+    "para", "con", "mi", "me", "es", "lo", "se", "del", "al", "como", "más", "qué",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Estima tokens sin tokenizador externo (~4 caracteres o ~0.75 palabras por token)"""
+    if not text:
+        return 0
+    words = len(WORD_RE.findall(text))
+    return max(math.ceil(len(text) / 4), math.ceil(words * 1.3))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Recorta un texto para que no supere el número de tokens indicado"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # Aproximación por caracteres y ajuste fino hacia abajo
+    cut = min(len(text), max_tokens * 4)
+    while cut > 0 and estimate_tokens(text[:cut]) > max_tokens:
+        cut = int(cut * 0.9)
+    return text[:cut].rstrip() + "..."
+
+
+class PromptBuilder:
+    """
+    Ensambla el input de los agentes dentro de un presupuesto de tokens.
+
+    El perfil y la consulta siempre se incluyen; los turnos de conversación se
+    ordenan por recencia y relevancia respecto a la consulta, y los turnos que no
+    entran se compactan en un resumen acumulado cuyas líneas quedan cacheadas.
+    """
+
+    # Caché compartida entre agentes: (user_id, clave de turno) -> datos derivados del turno
+    _turn_cache: "OrderedDict[Tuple[str, str, str], Dict[str, Any]]" = OrderedDict()
+    # Caché compartida de bloques de perfil: (user_id, versión, agente) -> texto
+    _rendered_profiles: "OrderedDict[Tuple[str, int, str], str]" = OrderedDict()
+
+    def __init__(self, budgets: Dict[str, int] = None, recency_half_life: float = 2.0):
+        self.budgets = budgets or AGENT_TOKEN_BUDGETS
+        self.recency_half_life = recency_half_life
+
+    def budget_for(self, agent: str) -> int:
+        return self.budgets.get(agent, DEFAULT_TOKEN_BUDGET)
+
+    def render_profile(self, agent: str, user_profile: Dict[str, Any],
+                       render: Callable[[Dict[str, Any]], str]) -> str:
+        """Devuelve el bloque de perfil del agente, memoizado por versión del perfil"""
+        user_id = (user_profile or {}).get("user_id")
+        if not user_id:
+            return render(user_profile)
+
+        key = (user_id, user_profile.get("version", 0), agent)
+        cache = PromptBuilder._rendered_profiles
+        block = cache.get(key)
+        if block is not None:
+            RENDERED_PROFILE_STATS.hits += 1
+            cache.move_to_end(key)
+            return block
+        RENDERED_PROFILE_STATS.misses += 1
+
+        block = render(user_profile)
+        cache[key] = block
+        if len(cache) > PROFILE_CACHE_SIZE:
+            cache.popitem(last=False)
+        return block
+
+    def build(self, agent: str, user_id: Optional[str], message: str, profile_block: str,
+              context: List[Dict[str, Any]]) -> Tuple[str, Dict[str, int]]:
+        """Construye el input completo del agente y devuelve sus métricas de tokens"""
+        budget = self.budget_for(agent)
+        context = context or []
+
+        profile_part = f"Perfil del usuario: {profile_block}"
+        query_part = f"Consulta: {message}"
+        used = estimate_tokens(profile_part) + estimate_tokens(query_part)
+        if used > budget:
+            # El perfil es lo único recortable de las partes obligatorias
+            profile_part = truncate_to_tokens(profile_part, max(budget - estimate_tokens(query_part), 0))
+            used = estimate_tokens(profile_part) + estimate_tokens(query_part)
+
+        # Selección de turnos por puntuación hasta agotar el presupuesto restante
+        remaining = max(budget - used - MAX_SUMMARY_TOKENS, 0)
+        selected = set()
+        for index in self._rank_turns(user_id, message, context):
+            turn_tokens = self._turn_features(user_id, context[index])["tokens"]
+            if turn_tokens <= remaining:
+                selected.add(index)
+                remaining -= turn_tokens
+
+        # Los turnos descartados se compactan en el resumen acumulado
+        dropped = [turn for i, turn in enumerate(context) if i not in selected]
+        summary = self._rolling_summary(user_id, dropped)
+
+        parts = [profile_part]
+        if summary:
+            parts.append(f"Resumen de conversaciones anteriores: {summary}")
+        if selected:
+            parts.append("Contexto reciente de la conversación:")
+            parts.extend(f"- {self._turn_features(user_id, context[i])['rendered']}" for i in sorted(selected))
+        parts.append(query_part)
+        full_input = "\n".join(parts)
+
+        metrics = {
+            "prompt_tokens": estimate_tokens(full_input),
+            "budget": budget,
+            "context_items": len(context),
+            "context_items_used": len(selected),
+            "summarized_turns": len(dropped),
+            "summary_tokens": estimate_tokens(summary),
+        }
+        logger.debug(f"Prompt {agent}: {metrics}")
+        return full_input, metrics
+
+    def _rank_turns(self, user_id: Optional[str], message: str, context: List[Dict[str, Any]]) -> List[int]:
+        """Ordena los índices de turnos por recencia y solapamiento léxico con la consulta"""
+        query_terms = self._terms(message)
+        scores = []
+        for index, turn in enumerate(context):
+            # context está en orden cronológico: el último es el más reciente
+            age = len(context) - 1 - index
+            recency = 0.5 ** (age / self.recency_half_life)
+            turn_terms = self._turn_features(user_id, turn)["terms"]
+            relevance = len(query_terms & turn_terms) / len(query_terms) if query_terms else 0.0
+            scores.append((recency + relevance, index))
+        return [index for _, index in sorted(scores, reverse=True)]
+
+    def _rolling_summary(self, user_id: Optional[str], turns: List[Dict[str, Any]]) -> str:
+        """Resumen extractivo de los turnos antiguos, limitado a MAX_SUMMARY_TOKENS"""
+        # Conservar las líneas más recientes si el resumen excede el presupuesto
+        summary_lines: List[str] = []
+        tokens = 0
+        for turn in reversed(turns):
+            features = self._turn_features(user_id, turn)
+            line_tokens = features["summary_tokens"] + 1
+            if tokens + line_tokens > MAX_SUMMARY_TOKENS:
+                break
+            summary_lines.append(features["summary"])
+            tokens += line_tokens
+        return "; ".join(reversed(summary_lines))
+
+    def _turn_features(self, user_id: Optional[str], turn: Dict[str, Any]) -> Dict[str, Any]:
+        """Render, tokens, términos y línea de resumen de un turno, cacheados por usuario y turno"""
+        if not user_id:
+            # Sin user_id (usuario sin perfil) no hay clave segura: como en render_profile
+            return self._compute_turn_features(turn)
+
+        key = (user_id, turn.get("timestamp", ""), turn.get("user_message", "")[:SUMMARY_LINE_CHARS])
+        cache = PromptBuilder._turn_cache
+        features = cache.get(key)
+        if features is not None:
+            PROMPT_TURN_STATS.hits += 1
+            cache.move_to_end(key)
+            return features
+        PROMPT_TURN_STATS.misses += 1
+
+        features = self._compute_turn_features(turn)
+        cache[key] = features
+        if len(cache) > TURN_CACHE_SIZE:
+            cache.popitem(last=False)
+        return features
+
+    def _compute_turn_features(self, turn: Dict[str, Any]) -> Dict[str, Any]:
+        question = turn.get("user_message", "")
+        answer = turn.get("agent_response", "")
+        agent = turn.get("agent", "agente")
+        rendered = truncate_to_tokens(f"Usuario: {question} | {agent}: {answer}", MAX_TURN_TOKENS)
+
+        # Primera frase de la respuesta como idea principal
+        short_question = question.strip().replace("\n", " ")[:SUMMARY_LINE_CHARS]
+        first_sentence = re.split(r"(?<=[.!?])\s", answer.strip().replace("\n", " "), maxsplit=1)[0]
+        summary = f"[{agent}] {short_question} → {first_sentence[:SUMMARY_LINE_CHARS]}"
+
+        return {
+            "rendered": rendered,
+            "tokens": estimate_tokens(rendered),
+            "terms": self._terms(f"{question} {answer}"),
+            "summary": summary,
+            "summary_tokens": estimate_tokens(summary),
+        }
+
+    def _terms(self, text: str) -> set:
+        return {w for w in WORD_RE.findall(text.lower()) if len(w) > 2 and w not in STOPWORDS}
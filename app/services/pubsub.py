@@ -0,0 +1,140 @@
+# ========================================
+# app/services/pubsub.py - Bus Pub/Sub entre Workers y Nodos
+# ========================================
+
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
+import json
+import logging
+import uuid
+
+from ..database.redis_connection import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+# Handler: recibe el payload publicado y el nodo de origen
+Handler = Callable[[Any, str], Awaitable[None]]
+
+
+class PubSubBus:
+    """Una conexión pub/sub de Redis por proceso que reparte mensajes a handlers por canal"""
+
+    def __init__(self, redis_client=None):
+        self.redis_client = redis_client
+        # Identifica a este worker para descartar sus propios mensajes
+        self.node_id = uuid.uuid4().hex
+        self._handlers: Dict[str, Handler] = {}
+        self._pubsub = None
+        self._task: Optional[asyncio.Task] = None
+        # Última entrega en curso de cada canal: las de un mismo canal van en orden y un
+        # handler lento sólo retrasa a su canal, no al resto
+        self._deliveries: Dict[str, asyncio.Task] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """Abre la conexión pub/sub y lanza la tarea que escucha mensajes"""
+        if self.running:
+            return
+        if self.redis_client is None:
+            # En Redis Cluster, conexión a un nodo: PUBLISH se propaga a todos
+            self.redis_client = get_async_redis(node=True)
+        self._pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+        # Canal propio del nodo: mantiene la suscripción activa aunque no haya otros canales
+        await self._pubsub.subscribe(self.node_channel)
+        for channel in self._handlers:
+            await self._pubsub.subscribe(channel)
+        self._task = asyncio.create_task(self._listen())
+        logger.info(f"Bus pub/sub iniciado (nodo {self.node_id[:8]})")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._deliveries.values()):
+            task.cancel()
+        self._deliveries.clear()
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.close()
+            except Exception as e:
+                logger.error(f"Error cerrando pub/sub: {str(e)}")
+            self._pubsub = None
+
+    @property
+    def node_channel(self) -> str:
+        return f"node:{self.node_id}"
+
+    async def subscribe(self, channel: str, handler: Handler):
+        """Registra un handler para un canal (reemplaza al anterior si existía)"""
+        is_new = channel not in self._handlers
+        self._handlers[channel] = handler
+        if is_new and self._pubsub is not None:
+            await self._pubsub.subscribe(channel)
+
+    async def unsubscribe(self, channel: str):
+        if self._handlers.pop(channel, None) is not None and self._pubsub is not None:
+            await self._pubsub.unsubscribe(channel)
+
+    async def publish(self, channel: str, data: Any) -> Optional[int]:
+        """Publica data en el canal; devuelve cuántos procesos lo recibieron (None si no se publicó)"""
+        if self.redis_client is None or not self.running:
+            # Bus no iniciado (sin Redis): cada worker sólo entrega a sus propias conexiones
+            return None
+        try:
+            payload = json.dumps({"node": self.node_id, "data": data})
+            return await self.redis_client.publish(channel, payload)
+        except Exception as e:
+            logger.error(f"Error publicando en {channel}: {str(e)}")
+            return None
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error leyendo pub/sub: {str(e)}")
+                await asyncio.sleep(1.0)
+                continue
+            if message is None or message.get("type") != "message":
+                continue
+            self._dispatch(message["channel"], message["data"])
+
+    def _dispatch(self, channel: str, raw: str):
+        """Entrega el mensaje en una tarea propia, detrás de la anterior del mismo canal"""
+        previous = self._deliveries.get(channel)
+        task = asyncio.create_task(self._deliver(channel, raw, previous))
+        self._deliveries[channel] = task
+
+        def done(finished: asyncio.Task):
+            if self._deliveries.get(channel) is finished:
+                del self._deliveries[channel]
+
+        task.add_done_callback(done)
+
+    async def _deliver(self, channel: str, raw: str, previous: Optional[asyncio.Task]):
+        if previous is not None:
+            # asyncio.wait no propaga errores ni cancelaciones de la entrega anterior
+            await asyncio.wait([previous])
+        handler = self._handlers.get(channel)
+        if handler is None:
+            return
+        try:
+            envelope = json.loads(raw)
+            # Los mensajes propios ya se entregaron localmente al publicarlos
+            if envelope.get("node") == self.node_id:
+                return
+            await handler(envelope.get("data"), envelope.get("node", ""))
+        except Exception as e:
+            logger.error(f"Error procesando mensaje de {channel}: {str(e)}")
+
+
+bus = PubSubBus()
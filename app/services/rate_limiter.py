@@ -0,0 +1,209 @@
+# ========================================
+# app/services/rate_limiter.py - Control de Admisión de Ejecuciones de Agentes
+# ========================================
+#
+# Token buckets por usuario y globales (por tipo de agente) y límites de
+# ejecuciones concurrentes compartidos por todos los workers. Cada ámbito se
+# evalúa con un script Lua atómico y con el reloj de Redis, para que los workers
+# no dependan de sus relojes locales: primero el del usuario (claves con su hash
+# tag) y, si lo admite, el global (claves con el tag compartido). Un script no
+# puede tocar dos slots de Redis Cluster; así sólo las comprobaciones globales
+# van al slot compartido. Si el global rechaza, se devuelve lo reservado al usuario.
+
+from typing import Dict, List, Optional
+import json
+import logging
+import os
+import uuid
+
+from ..database.redis_connection import get_async_redis
+from ..database.redis_keys import concurrency_key, rate_bucket_key
+from .metrics import ADMISSION_REJECTIONS
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+USER_MAX_CONCURRENT_RUNS = int(os.getenv("USER_MAX_CONCURRENT_RUNS", "2"))
+GLOBAL_MAX_CONCURRENT_RUNS = int(os.getenv("GLOBAL_MAX_CONCURRENT_RUNS", "100"))
+# Una ejecución que no libera su plaza (worker caído) la pierde al caducar el lease
+AGENT_RUN_LEASE_SECONDS = int(os.getenv("AGENT_RUN_LEASE_SECONDS", "120"))
+# Retry-after sugerido cuando el rechazo es por concurrencia
+CONCURRENCY_RETRY_SECONDS = float(os.getenv("CONCURRENCY_RETRY_SECONDS", "2"))
+
+# Mensajes por segundo (rate) y ráfaga máxima (burst) por tipo de agente.
+# RATE_LIMITS (JSON) sobrescribe valores, p. ej. '{"research": {"user_rate": 0.05}}'
+DEFAULT_AGENT_LIMITS = {
+    "nutrition": {"user_rate": 0.2, "user_burst": 5, "global_rate": 20, "global_burst": 100},
+    "fitness": {"user_rate": 0.2, "user_burst": 5, "global_rate": 20, "global_burst": 100},
+    "research": {"user_rate": 0.1, "user_burst": 3, "global_rate": 10, "global_burst": 50},
+    "personalization": {"user_rate": 0.5, "user_burst": 10, "global_rate": 50, "global_burst": 200},
+}
+
+# Un ámbito (usuario o global) en un solo slot
+# KEYS: buckets y después conjuntos de concurrencia
+# ARGV: n_buckets, [rate, burst, nombre]*, n_conc, [límite, nombre]*, lease_id, lease_ms, conc_retry_ms
+ADMISSION_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local n_buckets = tonumber(ARGV[1])
+local i = 2
+local tokens = {}
+for b = 1, n_buckets do
+    local rate = tonumber(ARGV[i]) / 1000
+    local burst = tonumber(ARGV[i + 1])
+    local state = redis.call('HMGET', KEYS[b], 'tokens', 'ts')
+    local level = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    level = math.min(burst, level + math.max(0, now - ts) * rate)
+    if level < 1 then
+        return {0, math.ceil((1 - level) / rate), ARGV[i + 2]}
+    end
+    tokens[b] = level
+    i = i + 3
+end
+local n_conc = tonumber(ARGV[i])
+local conc_start = i + 1
+local lease_id = ARGV[conc_start + n_conc * 2]
+local lease_ms = tonumber(ARGV[conc_start + n_conc * 2 + 1])
+local conc_retry = tonumber(ARGV[conc_start + n_conc * 2 + 2])
+for c = 1, n_conc do
+    local key = KEYS[n_buckets + c]
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now)
+    if redis.call('ZCARD', key) >= tonumber(ARGV[conc_start + (c - 1) * 2]) then
+        return {0, conc_retry, ARGV[conc_start + (c - 1) * 2 + 1]}
+    end
+end
+i = 2
+for b = 1, n_buckets do
+    local rate = tonumber(ARGV[i]) / 1000
+    local burst = tonumber(ARGV[i + 1])
+    redis.call('HSET', KEYS[b], 'tokens', tokens[b] - 1, 'ts', now)
+    redis.call('PEXPIRE', KEYS[b], math.ceil(burst / rate) + 1000)
+    i = i + 3
+end
+for c = 1, n_conc do
+    local key = KEYS[n_buckets + c]
+    redis.call('ZADD', key, now + lease_ms, lease_id)
+    redis.call('PEXPIRE', key, lease_ms)
+end
+return {1, 0, ''}
+"""
+
+
+def load_agent_limits() -> Dict[str, Dict[str, float]]:
+    limits = {agent: dict(values) for agent, values in DEFAULT_AGENT_LIMITS.items()}
+    overrides = os.getenv("RATE_LIMITS")
+    if overrides:
+        try:
+            for agent, values in json.loads(overrides).items():
+                limits.setdefault(agent, dict(DEFAULT_AGENT_LIMITS["personalization"])).update(values)
+        except (ValueError, AttributeError) as e:
+            logger.error(f"RATE_LIMITS no válido, usando valores por defecto: {str(e)}")
+    return limits
+
+
+class Admission:
+    """Resultado de una solicitud de admisión; libera la plaza de concurrencia al terminar"""
+
+    def __init__(self, allowed: bool, retry_after: float = 0.0, reason: str = "",
+                 limiter: Optional["RateLimiter"] = None, lease_id: str = "", lease_keys: List[str] = None):
+        self.allowed = allowed
+        self.retry_after = retry_after
+        self.reason = reason
+        self._limiter = limiter
+        self._lease_id = lease_id
+        self._lease_keys = lease_keys or []
+
+    async def release(self):
+        if self._limiter and self._lease_keys:
+            await self._limiter.release(self._lease_id, self._lease_keys)
+            self._lease_keys = []
+
+
+class RateLimiter:
+    """Admisión de ejecuciones de agentes coordinada entre workers a través de Redis"""
+
+    def __init__(self, redis_client=None, agent_limits: Dict[str, Dict[str, float]] = None,
+                 user_concurrency: int = USER_MAX_CONCURRENT_RUNS,
+                 global_concurrency: int = GLOBAL_MAX_CONCURRENT_RUNS,
+                 lease_seconds: int = AGENT_RUN_LEASE_SECONDS, enabled: bool = RATE_LIMIT_ENABLED):
+        self.redis_client = redis_client
+        self.agent_limits = agent_limits or load_agent_limits()
+        self.user_concurrency = user_concurrency
+        self.global_concurrency = global_concurrency
+        self.lease_seconds = lease_seconds
+        self.enabled = enabled
+        self._script = None
+
+    def _client(self):
+        if self.redis_client is None:
+            self.redis_client = get_async_redis()
+        return self.redis_client
+
+    async def acquire(self, user_id: str, agent_type: str) -> Admission:
+        """Consume un token de los buckets del agente y reserva plaza de concurrencia"""
+        if not self.enabled:
+            return Admission(True)
+
+        limits = self.agent_limits.get(agent_type) or self.agent_limits["personalization"]
+        lease_id = uuid.uuid4().hex
+        user_bucket, user_lease = rate_bucket_key(agent_type, user_id), concurrency_key(user_id)
+        global_bucket, global_lease = rate_bucket_key(agent_type), concurrency_key()
+
+        try:
+            # Primero el usuario: los rechazos más frecuentes no llegan al slot global
+            allowed, retry_ms, reason = await self._admit(
+                user_bucket, limits["user_rate"], limits["user_burst"], "user_rate",
+                user_lease, self.user_concurrency, "user_concurrency", lease_id,
+            )
+            if int(allowed):
+                allowed, retry_ms, reason = await self._admit(
+                    global_bucket, limits["global_rate"], limits["global_burst"], "global_rate",
+                    global_lease, self.global_concurrency, "global_concurrency", lease_id,
+                )
+                if not int(allowed):
+                    await self._refund(user_bucket, user_lease, lease_id)
+        except Exception as e:
+            # Si Redis falla se admite: el limitador no debe tumbar el chat
+            logger.error(f"Error en control de admisión, se admite la petición: {str(e)}")
+            return Admission(True)
+
+        if not int(allowed):
+            reason = reason.decode() if isinstance(reason, bytes) else reason
+            ADMISSION_REJECTIONS.labels(agent_type, reason).inc()
+            return Admission(False, retry_after=round(int(retry_ms) / 1000, 3), reason=reason)
+        return Admission(True, limiter=self, lease_id=lease_id, lease_keys=[user_lease, global_lease])
+
+    async def _admit(self, bucket_key: str, rate: float, burst: float, rate_reason: str,
+                     lease_key: str, concurrency: int, concurrency_reason: str, lease_id: str):
+        """Consume un token del bucket y reserva plaza en un ámbito; devuelve (admitido, retry_ms, motivo)"""
+        if self._script is None:
+            self._script = self._client().register_script(ADMISSION_SCRIPT)
+        return await self._script(
+            keys=[bucket_key, lease_key],
+            args=[1, rate, burst, rate_reason, 1, concurrency, concurrency_reason,
+                  lease_id, self.lease_seconds * 1000, int(CONCURRENCY_RETRY_SECONDS * 1000)],
+        )
+
+    async def _refund(self, bucket_key: str, lease_key: str, lease_id: str):
+        """Devuelve el token y la plaza del usuario cuando el límite global rechaza"""
+        try:
+            # Mismo slot (tag del usuario). El exceso sobre burst lo recorta el script al leer el bucket
+            pipe = self._client().pipeline(transaction=False)
+            pipe.hincrbyfloat(bucket_key, "tokens", 1)
+            pipe.zrem(lease_key, lease_id)
+            await pipe.execute()
+        except Exception as e:
+            logger.error(f"Error devolviendo la reserva del usuario: {str(e)}")
+
+    async def release(self, lease_id: str, lease_keys: List[str]):
+        try:
+            pipe = self._client().pipeline(transaction=False)
+            for key in lease_keys:
+                pipe.zrem(key, lease_id)
+            await pipe.execute()
+        except Exception as e:
+            logger.error(f"Error liberando plaza de concurrencia: {str(e)}")
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,126 @@
+# ========================================
+# app/services/session_prefetch.py - Precarga de Sesión al Conectar
+# ========================================
+#
+# Al abrir un WebSocket se cargan perfil y contexto reciente (una ida y vuelta a
+# Redis), se calculan los objetivos derivados del perfil y se calientan en segundo
+# plano las cachés de herramientas que el usuario probablemente necesitará. El
+# primer mensaje usa esta instantánea y no espera a Redis.
+
+from collections import Counter
+from typing import Any, Dict, List
+import asyncio
+import logging
+import os
+import time
+
+from .targets import derive_targets
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_ON_CONNECT = os.getenv("PREFETCH_ON_CONNECT", "true").lower() == "true"
+# Una instantánea más antigua no se usa: el perfil puede haber cambiado desde otra conexión
+PREFETCH_MAX_AGE = float(os.getenv("PREFETCH_MAX_AGE", "300"))
+# Músculos cuya lista de ejercicios se precarga por usuario
+PREFETCH_MAX_TARGETS = int(os.getenv("PREFETCH_MAX_TARGETS", "3"))
+
+# Palabras del usuario -> músculo objetivo de ExerciseDB
+MUSCLE_KEYWORDS = {
+    "pecho": "pectorals", "pectoral": "pectorals",
+    "espalda": "lats", "dorsal": "lats",
+    "pierna": "quads", "cuádriceps": "quads", "cuadriceps": "quads",
+    "isquio": "hamstrings", "femoral": "hamstrings",
+    "glúteo": "glutes", "gluteo": "glutes",
+    "hombro": "delts", "deltoides": "delts",
+    "bíceps": "biceps", "biceps": "biceps",
+    "tríceps": "triceps", "triceps": "triceps",
+    "abdominal": "abs", "abdomen": "abs", "core": "abs",
+    "gemelo": "calves", "pantorrilla": "calves",
+}
+# Músculos por defecto según el objetivo del perfil
+GOAL_TARGETS = {
+    "ganar músculo": ["pectorals", "lats", "quads"],
+    "muscle": ["pectorals", "lats", "quads"],
+    "perder peso": ["quads", "glutes", "abs"],
+    "lose weight": ["quads", "glutes", "abs"],
+}
+
+
+class SessionSnapshot:
+    """Datos de un usuario cargados al conectar, válidos durante PREFETCH_MAX_AGE"""
+
+    __slots__ = ("user_id", "context", "profile", "targets", "seq", "loaded_at")
+
+    def __init__(self, user_id: str, context: List[Dict[str, Any]], profile: Dict[str, Any],
+                 targets: Dict[str, Any], seq: int = 0):
+        self.user_id = user_id
+        self.context = context
+        self.profile = profile
+        self.targets = targets
+        # Secuencia del último turno de context (siembra la ventana de conversación)
+        self.seq = seq
+        self.loaded_at = time.monotonic()
+
+    def is_fresh(self, max_age: float = PREFETCH_MAX_AGE) -> bool:
+        return time.monotonic() - self.loaded_at < max_age
+
+
+def likely_targets(profile: Dict[str, Any], context: List[Dict[str, Any]],
+                   limit: int = PREFETCH_MAX_TARGETS) -> List[str]:
+    """Músculos que el usuario suele consultar (conversación reciente) o acordes a su objetivo"""
+    counts: Counter = Counter()
+    for turn in context:
+        text = (turn.get("user_message") or "").lower()
+        for keyword, target in MUSCLE_KEYWORDS.items():
+            if keyword in text:
+                counts[target] += 1
+    targets = [target for target, _ in counts.most_common(limit)]
+
+    goals = str(profile.get("goals") or "").lower()
+    for goal, defaults in GOAL_TARGETS.items():
+        if goal in goals:
+            targets += [t for t in defaults if t not in targets]
+            break
+    return targets[:limit]
+
+
+def wants_fitness(profile: Dict[str, Any], context: List[Dict[str, Any]]) -> bool:
+    return bool(profile.get("fitness_level")) or any(turn.get("agent") == "fitness" for turn in context)
+
+
+class SessionPrefetcher:
+    """Carga la sesión de un usuario y calienta las cachés de herramientas"""
+
+    _exercise_tool = None
+
+    def __init__(self, memory_service, context_limit: int = 10):
+        self.memory_service = memory_service
+        self.context_limit = context_limit
+        self._warm_tasks: List[asyncio.Task] = []
+
+    async def load(self, user_id: str) -> SessionSnapshot:
+        context, profile, seq = await self.memory_service.load_session(user_id, self.context_limit)
+        snapshot = SessionSnapshot(user_id, context, profile, derive_targets(profile), seq)
+        if wants_fitness(profile, context):
+            self._warm_tasks = [t for t in self._warm_tasks if not t.done()]
+            self._warm_tasks.append(asyncio.create_task(self.warm_tool_caches(likely_targets(profile, context))))
+        return snapshot
+
+    async def warm_tool_caches(self, targets: List[str]):
+        """Carga en la caché de APIs la lista de músculos y los ejercicios de targets"""
+        # Sin pasar por el agente de fitness: no hace falta importar LangChain para esto
+        if SessionPrefetcher._exercise_tool is None:
+            from ..tools.fitness_apis import ExerciseDBTool
+            SessionPrefetcher._exercise_tool = ExerciseDBTool()
+        tool = SessionPrefetcher._exercise_tool
+
+        calls = [tool.get_target_list(None)] + [tool.get_exercises_by_target(target) for target in targets]
+        results = await asyncio.gather(*calls, return_exceptions=True)
+        for target, result in zip(["targetList"] + targets, results):
+            if isinstance(result, Exception):
+                logger.warning(f"No se pudo precargar ExerciseDB ({target}): {str(result)}")
+
+    def cancel(self):
+        for task in self._warm_tasks:
+            task.cancel()
+        self._warm_tasks = []
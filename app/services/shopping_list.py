@@ -0,0 +1,284 @@
+# ========================================
+# app/services/shopping_list.py - Agregador de Lista de Compras
+# ========================================
+
+from typing import Dict, Any, List, Iterable, Tuple
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Factores de conversión a la unidad base de cada dimensión (g, ml, unit)
+UNIT_FACTORS = {
+    "mg": ("g", 0.001),
+    "g": ("g", 1.0),
+    "gr": ("g", 1.0),
+    "kg": ("g", 1000.0),
+    "ml": ("ml", 1.0),
+    "cl": ("ml", 10.0),
+    "l": ("ml", 1000.0),
+    "cup": ("ml", 240.0),
+    "cups": ("ml", 240.0),
+    "taza": ("ml", 240.0),
+    "tazas": ("ml", 240.0),
+    "tbsp": ("ml", 15.0),
+    "cucharada": ("ml", 15.0),
+    "tsp": ("ml", 5.0),
+    "cucharadita": ("ml", 5.0),
+    "unit": ("unit", 1.0),
+    "units": ("unit", 1.0),
+    "ud": ("unit", 1.0),
+    "uds": ("unit", 1.0),
+    "unidad": ("unit", 1.0),
+    "unidades": ("unit", 1.0),
+    "pieza": ("unit", 1.0),
+}
+
+# Catálogo de ingredientes: categoría, unidad de compra, tamaño de envase
+# y conversiones opcionales (densidad g/ml, gramos por unidad)
+INGREDIENTS = {
+    "pollo": {"category": "proteins", "unit": "g", "package": 500, "unit_g": 200},
+    "pescado blanco": {"category": "proteins", "unit": "g", "package": 400},
+    "salmón": {"category": "proteins", "unit": "g", "package": 250},
+    "huevos": {"category": "proteins", "unit": "unit", "package": 12, "unit_g": 60},
+    "lentejas": {"category": "proteins", "unit": "g", "package": 500},
+    "garbanzos": {"category": "proteins", "unit": "g", "package": 400},
+    "yogur griego": {"category": "proteins", "unit": "g", "package": 500, "density": 1.05},
+    "yogur natural": {"category": "proteins", "unit": "g", "package": 500, "density": 1.03},
+    "proteína en polvo": {"category": "proteins", "unit": "g", "package": 1000, "density": 0.4},
+    "hummus": {"category": "proteins", "unit": "g", "package": 200},
+    "avena": {"category": "carbs", "unit": "g", "package": 500, "density": 0.4},
+    "quinoa": {"category": "carbs", "unit": "g", "package": 500, "density": 0.8},
+    "arroz integral": {"category": "carbs", "unit": "g", "package": 1000, "density": 0.85},
+    "pan integral": {"category": "carbs", "unit": "g", "package": 500, "unit_g": 35},
+    "tortilla integral": {"category": "carbs", "unit": "unit", "package": 8, "unit_g": 60},
+    "granola": {"category": "carbs", "unit": "g", "package": 375, "density": 0.45},
+    "plátano": {"category": "carbs", "unit": "unit", "package": 1, "unit_g": 120},
+    "manzana": {"category": "carbs", "unit": "unit", "package": 1, "unit_g": 180},
+    "frutos rojos": {"category": "carbs", "unit": "g", "package": 250, "density": 0.6},
+    "leche": {"category": "others", "unit": "ml", "package": 1000},
+    "aguacate": {"category": "fats", "unit": "unit", "package": 1, "unit_g": 150},
+    "frutos secos": {"category": "fats", "unit": "g", "package": 200, "density": 0.55},
+    "aceite de oliva": {"category": "fats", "unit": "ml", "package": 750, "density": 0.92},
+    "espinacas": {"category": "vegetables", "unit": "g", "package": 300},
+    "lechuga": {"category": "vegetables", "unit": "unit", "package": 1, "unit_g": 400},
+    "brócoli": {"category": "vegetables", "unit": "g", "package": 500},
+    "tomate": {"category": "vegetables", "unit": "g", "package": 1000, "unit_g": 120},
+    "pepino": {"category": "vegetables", "unit": "unit", "package": 1, "unit_g": 300},
+    "pimiento": {"category": "vegetables", "unit": "unit", "package": 1, "unit_g": 160},
+    "zanahoria": {"category": "vegetables", "unit": "g", "package": 1000, "unit_g": 80},
+    "cebolla": {"category": "vegetables", "unit": "unit", "package": 1, "unit_g": 150},
+    "limón": {"category": "others", "unit": "unit", "package": 1, "unit_g": 100},
+}
+
+# Sinónimos que se fusionan en un mismo ingrediente del catálogo
+SYNONYMS = {
+    "pechuga de pollo": "pollo",
+    "pollo (pechuga)": "pollo",
+    "chicken breast": "pollo",
+    "merluza": "pescado blanco",
+    "bacalao": "pescado blanco",
+    "salmon": "salmón",
+    "huevo": "huevos",
+    "egg": "huevos",
+    "eggs": "huevos",
+    "yogurt griego": "yogur griego",
+    "greek yogurt": "yogur griego",
+    "yogur": "yogur natural",
+    "copos de avena": "avena",
+    "oats": "avena",
+    "arroz": "arroz integral",
+    "banana": "plátano",
+    "platano": "plátano",
+    "bayas": "frutos rojos",
+    "nueces": "frutos secos",
+    "almendras": "frutos secos",
+    "aove": "aceite de oliva",
+    "olive oil": "aceite de oliva",
+    "brocoli": "brócoli",
+    "tomates": "tomate",
+    "cebollas": "cebolla",
+    "limon": "limón",
+}
+
+# Ingredientes por ración de cada sugerencia de comida, calibrados para
+# la distribución de calorías de una dieta de referencia de 2000 kcal
+MEAL_RECIPES = {
+    "Avena con frutas y frutos secos": [
+        ("avena", 0.5, "cup"), ("plátano", 1, "unit"), ("frutos secos", 20, "g"), ("leche", 200, "ml")
+    ],
+    "Tostadas integrales con aguacate": [
+        ("pan integral", 2, "unit"), ("aguacate", 0.5, "unit"), ("tomate", 60, "g"), ("aceite de oliva", 1, "tsp")
+    ],
+    "Yogur griego con granola": [
+        ("yogur griego", 200, "g"), ("granola", 0.33, "cup"), ("frutos rojos", 80, "g")
+    ],
+    "Ensalada con proteína (pollo/pescado/legumbres)": [
+        ("pechuga de pollo", 150, "g"), ("lechuga", 0.25, "unit"), ("tomate", 1, "unit"),
+        ("pepino", 0.5, "unit"), ("aceite de oliva", 1, "tbsp")
+    ],
+    "Bowl de quinoa con verduras": [
+        ("quinoa", 0.5, "cup"), ("garbanzos", 100, "g"), ("pimiento", 0.5, "unit"),
+        ("espinacas", 50, "g"), ("aceite de oliva", 1, "tbsp")
+    ],
+    "Wrap integral con hummus y vegetales": [
+        ("tortilla integral", 1, "unit"), ("hummus", 60, "g"), ("zanahoria", 1, "unit"),
+        ("espinacas", 30, "g"), ("pechuga de pollo", 100, "g")
+    ],
+    "Frutas con frutos secos": [
+        ("manzana", 1, "unit"), ("frutos secos", 25, "g")
+    ],
+    "Yogur natural": [
+        ("yogur", 125, "g"), ("frutos rojos", 50, "g")
+    ],
+    "Batido de proteínas": [
+        ("proteína en polvo", 30, "g"), ("leche", 250, "ml"), ("plátano", 0.5, "unit")
+    ],
+    "Pescado con verduras al vapor": [
+        ("merluza", 180, "g"), ("brócoli", 150, "g"), ("zanahoria", 1, "unit"), ("aceite de oliva", 1, "tbsp")
+    ],
+    "Pollo a la plancha con ensalada": [
+        ("pechuga de pollo", 160, "g"), ("lechuga", 0.25, "unit"), ("tomate", 1, "unit"),
+        ("cebolla", 0.25, "unit"), ("aceite de oliva", 1, "tbsp")
+    ],
+    "Legumbres con arroz integral": [
+        ("lentejas", 80, "g"), ("arroz integral", 0.33, "cup"), ("cebolla", 0.5, "unit"),
+        ("zanahoria", 1, "unit"), ("aceite de oliva", 1, "tsp")
+    ],
+}
+
+REFERENCE_CALORIES = 2000
+CATEGORIES = ["proteins", "carbs", "fats", "vegetables", "others"]
+
+
+class ShoppingListAggregator:
+    """
+    Agrega los ingredientes de todas las comidas de un plan multi-día.
+
+    El catálogo y las recetas se compilan una sola vez a arrays de numpy;
+    cada agregación es un par de np.bincount sobre índices de ingrediente,
+    sin bucles anidados por día y comida.
+    """
+
+    def __init__(self):
+        self.ingredient_names = list(INGREDIENTS.keys())
+        self.ingredient_index = {name: i for i, name in enumerate(self.ingredient_names)}
+        self.categories = np.array([INGREDIENTS[n]["category"] for n in self.ingredient_names])
+        self.base_units = np.array([INGREDIENTS[n]["unit"] for n in self.ingredient_names])
+        self.packages = np.array([INGREDIENTS[n]["package"] for n in self.ingredient_names], dtype=float)
+        # Conversión g/ml ↔ unidad de compra (NaN si no está definida)
+        self.density = np.array(
+            [INGREDIENTS[n].get("density", np.nan) for n in self.ingredient_names], dtype=float
+        )
+        self.unit_grams = np.array(
+            [INGREDIENTS[n].get("unit_g", np.nan) for n in self.ingredient_names], dtype=float
+        )
+
+        # Recetas compiladas en formato COO: (receta, ingrediente, cantidad)
+        self.recipe_names = list(MEAL_RECIPES.keys())
+        self.recipe_index = {name: i for i, name in enumerate(self.recipe_names)}
+        rows = [
+            (r, name, qty, unit)
+            for r, recipe in enumerate(self.recipe_names)
+            for name, qty, unit in MEAL_RECIPES[recipe]
+        ]
+        self.row_recipe = np.array([row[0] for row in rows], dtype=np.intp)
+        self.row_ingredient, self.row_quantity = self._encode(
+            [row[1] for row in rows], [row[2] for row in rows], [row[3] for row in rows]
+        )
+
+    def canonical_name(self, name: str) -> str:
+        """Normaliza un nombre de ingrediente aplicando sinónimos"""
+        key = name.strip().lower()
+        return SYNONYMS.get(key, key)
+
+    def _encode(self, names: List[str], quantities: List[float], units: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Convierte filas (nombre, cantidad, unidad) a índices y cantidades en la unidad de compra"""
+        # Sólo se resuelven los nombres y unidades distintos; el resto es vectorial
+        unique_names, name_inverse = np.unique(np.array(names, dtype=object), return_inverse=True)
+        name_ids = np.array(
+            [self.ingredient_index.get(self.canonical_name(n), -1) for n in unique_names], dtype=np.intp
+        )
+        ingredient = name_ids[name_inverse]
+        if (ingredient < 0).any():
+            unknown = sorted({str(n) for n, i in zip(unique_names, name_ids) if i < 0})
+            raise ValueError(f"Ingredientes no reconocidos: {', '.join(unknown)}")
+
+        unique_units, unit_inverse = np.unique(
+            np.array([u.strip().lower() for u in units], dtype=object), return_inverse=True
+        )
+        try:
+            unit_info = [UNIT_FACTORS[u] for u in unique_units]
+        except KeyError as e:
+            raise ValueError(f"Unidad no reconocida: {e.args[0]}")
+        source_dim = np.array([dim for dim, _ in unit_info])[unit_inverse]
+        factor = np.array([f for _, f in unit_info], dtype=float)[unit_inverse]
+
+        quantity = np.asarray(quantities, dtype=float) * factor
+        target_dim = self.base_units[ingredient]
+        density = self.density[ingredient]
+        unit_g = self.unit_grams[ingredient]
+
+        # Pasar todo a gramos como dimensión puente cuando difiere de la unidad de compra
+        grams = np.select(
+            [source_dim == "g", source_dim == "ml", source_dim == "unit"],
+            [quantity, quantity * np.nan_to_num(density, nan=1.0), quantity * unit_g],
+        )
+        converted = np.select(
+            [source_dim == target_dim, target_dim == "g", target_dim == "ml", target_dim == "unit"],
+            [quantity, grams, grams / np.nan_to_num(density, nan=1.0), grams / unit_g],
+        )
+        if np.isnan(converted).any():
+            bad = {self.ingredient_names[i] for i in ingredient[np.isnan(converted)]}
+            raise ValueError(f"Sin conversión de unidades para: {', '.join(sorted(bad))}")
+
+        return ingredient, converted
+
+    def aggregate(self, ingredients: np.ndarray, quantities: np.ndarray) -> Dict[str, List[Dict[str, Any]]]:
+        """Suma cantidades por ingrediente y redondea a envases comprables"""
+        totals = np.bincount(ingredients, weights=quantities, minlength=len(self.ingredient_names))
+        needed = totals > 1e-9
+        # Redondeo hacia arriba al múltiplo del tamaño de envase
+        packages = np.ceil(totals / self.packages - 1e-9)
+        purchase = packages * self.packages
+
+        shopping_list: Dict[str, List[Dict[str, Any]]] = {category: [] for category in CATEGORIES}
+        for i in np.flatnonzero(needed):
+            shopping_list[self.categories[i]].append({
+                "item": self.ingredient_names[i],
+                "quantity": round(float(purchase[i]), 2),
+                "unit": str(self.base_units[i]),
+                "packages": int(packages[i]),
+                "required": round(float(totals[i]), 2),
+            })
+        return shopping_list
+
+    def from_meal_plan(self, meal_structure: Dict[str, Any], days: int,
+                       daily_calories: int, household_size: int = 1) -> Dict[str, List[Dict[str, Any]]]:
+        """Agrega la lista de compras rotando las sugerencias de cada comida día a día"""
+        day_idx = np.arange(days)
+        selected = []
+        for offset, meal in enumerate(meal_structure.values()):
+            suggestions = [s for s in meal.get("suggestions", []) if s in self.recipe_index]
+            if not suggestions:
+                continue
+            recipe_ids = np.array([self.recipe_index[s] for s in suggestions], dtype=np.intp)
+            # Rotación de sugerencias: día d usa la sugerencia (d + offset) % n
+            selected.append(recipe_ids[(day_idx + offset) % len(recipe_ids)])
+
+        if not selected:
+            return {category: [] for category in CATEGORIES}
+
+        scale = (daily_calories or REFERENCE_CALORIES) / REFERENCE_CALORIES * max(1, household_size)
+        servings = np.bincount(np.concatenate(selected), minlength=len(self.recipe_names)) * scale
+        return self.aggregate(self.row_ingredient, self.row_quantity * servings[self.row_recipe])
+
+    def from_ingredients(self, items: Iterable[Tuple[str, float, str]],
+                         servings: float = 1.0) -> Dict[str, List[Dict[str, Any]]]:
+        """Agrega ingredientes arbitrarios (p. ej. de recetas de Edamam) como (nombre, cantidad, unidad)"""
+        items = list(items)
+        if not items:
+            return {category: [] for category in CATEGORIES}
+        names, quantities, units = zip(*items)
+        ingredients, converted = self._encode(list(names), list(quantities), list(units))
+        return self.aggregate(ingredients, converted * servings)
@@ -0,0 +1,89 @@
+# ========================================
+# app/services/targets.py - Objetivos Nutricionales Derivados del Perfil
+# ========================================
+#
+# Sin dependencias pesadas: lo usan tanto PlanGenerator como la precarga de sesión.
+
+from typing import Any, Dict
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def calculate_daily_calories(user_profile: Dict[str, Any]) -> int:
+    """Calcula calorías diarias usando fórmula Harris-Benedict"""
+    try:
+        age = user_profile.get('age', 30)
+        weight = user_profile.get('weight', 70)
+        height = user_profile.get('height', 170)
+        gender = user_profile.get('gender', 'male')
+        activity_level = user_profile.get('activity_level', 'moderate')
+
+        # Tasa Metabólica Basal (TMB)
+        if gender.lower() == 'female':
+            bmr = 447.593 + (9.247 * weight) + (3.098 * height) - (4.330 * age)
+        else:
+            bmr = 88.362 + (13.397 * weight) + (4.799 * height) - (5.677 * age)
+
+        # Factor de actividad
+        activity_multipliers = {
+            'sedentary': 1.2,
+            'light': 1.375,
+            'moderate': 1.55,
+            'active': 1.725,
+            'very_active': 1.9
+        }
+
+        multiplier = activity_multipliers.get(activity_level, 1.55)
+        tdee = bmr * multiplier
+
+        # Ajustar según objetivos
+        goals = user_profile.get('goals', 'maintenance')
+        if 'perder peso' in goals.lower() or 'lose weight' in goals.lower():
+            return int(tdee * 0.8)  # Déficit del 20%
+        elif 'ganar peso' in goals.lower() or 'gain weight' in goals.lower():
+            return int(tdee * 1.15)  # Superávit del 15%
+        else:
+            return int(tdee)  # Mantenimiento
+
+    except Exception as e:
+        logger.error(f"Error calculando calorías: {str(e)}")
+        return 2000  # Valor por defecto
+
+
+def calculate_macros(calories: int, goals: str) -> Dict[str, int]:
+    """Calcula distribución de macronutrientes"""
+
+    if 'ganar músculo' in goals.lower() or 'muscle' in goals.lower():
+        # Alto en proteína para ganancia muscular
+        protein_ratio = 0.30
+        carb_ratio = 0.40
+        fat_ratio = 0.30
+    elif 'perder peso' in goals.lower() or 'lose weight' in goals.lower():
+        # Moderado en proteína, bajo en carbos
+        protein_ratio = 0.35
+        carb_ratio = 0.30
+        fat_ratio = 0.35
+    else:
+        # Balanceado para mantenimiento
+        protein_ratio = 0.25
+        carb_ratio = 0.45
+        fat_ratio = 0.30
+
+    return {
+        "protein_g": int((calories * protein_ratio) / 4),
+        "carbs_g": int((calories * carb_ratio) / 4),
+        "fats_g": int((calories * fat_ratio) / 9),
+        "fiber_g": max(25, int(calories / 80))  # Mínimo 25g
+    }
+
+
+def derive_targets(user_profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Calorías y macros diarios del perfil (vacío si el perfil no tiene datos)"""
+    if not user_profile:
+        return {}
+    calories = calculate_daily_calories(user_profile)
+    return {
+        "daily_calories": calories,
+        "macros": calculate_macros(calories, user_profile.get('goals', 'maintenance')),
+    }
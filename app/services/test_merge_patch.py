@@ -0,0 +1,40 @@
+# Prueba manual de JSON Merge Patch: apply(old, diff(old, new)) == new.
+# Uso: python -m app.services.test_merge_patch
+from app.services.merge_patch import UnrepresentableChange, apply, diff
+
+CASES = [
+    ({"x": 1}, {"x": 2}),
+    ({"x": 1, "y": 2}, {"x": 1}),
+    ({"a": {"b": 1, "c": 2}}, {"a": {"b": 1, "c": 3, "d": [1, 2]}}),
+    ({"a": [1, 2]}, {"a": {"b": {"c": 1}}}),
+    ({"a": 1}, {"a": {"b": 1}}),
+    ({"a": {"b": 1}}, {"a": [1, None]}),  # None dentro de una lista: la lista se reemplaza completa
+    ({"a": {"b": {"c": 1}}}, {"a": {"b": {"c": 1, "d": {"e": [None]}}}}),
+    ([1, 2], {"a": 1}),
+]
+
+UNREPRESENTABLE = [
+    ({"x": 1}, {"x": None}),
+    ({"x": 1}, {"x": 1, "meta": {"notes": None}}),
+    ({"a": [1]}, {"a": {"b": None}}),
+    ({"a": 1}, {"a": {"b": {"c": None}}}),
+    ({"a": {"b": 1}}, {"a": {"b": 1, "c": {"d": None}}}),
+    ([1], {"a": None}),
+]
+
+
+def main():
+    for old, new in CASES:
+        assert apply(old, diff(old, new)) == new, (old, new)
+    for old, new in UNREPRESENTABLE:
+        try:
+            diff(old, new)
+        except UnrepresentableChange as e:
+            print(f"no representable ({e}): {new}")
+        else:
+            raise AssertionError(f"diff debería rechazar {new}")
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
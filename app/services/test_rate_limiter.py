@@ -0,0 +1,104 @@
+# Prueba manual del control de admisión.
+# Uso: python -m app.services.test_rate_limiter [redis://localhost:6379/15]
+# Sin URL usa fakeredis en memoria (compartido por los dos "workers"); con URL se vacía esa base de datos.
+import asyncio
+import sys
+import time
+
+import redis.asyncio as aioredis
+
+from app.database.redis_keys import concurrency_key, rate_bucket_key, user_from_key
+from app.services.rate_limiter import RateLimiter
+
+LIMITS = {
+    "fitness": {"user_rate": 1, "user_burst": 3, "global_rate": 100, "global_burst": 100},
+    "research": {"user_rate": 100, "user_burst": 100, "global_rate": 0.5, "global_burst": 2},
+    "personalization": {"user_rate": 100, "user_burst": 100, "global_rate": 100, "global_burst": 100},
+}
+
+
+def make_clients(redis_url: str = None):
+    if redis_url:
+        return aioredis.Redis.from_url(redis_url), aioredis.Redis.from_url(redis_url)
+    import fakeredis
+    server = fakeredis.FakeServer()
+    return fakeredis.aioredis.FakeRedis(server=server), fakeredis.aioredis.FakeRedis(server=server)
+
+
+async def main(redis_url: str = None):
+    client_a, client_b = make_clients(redis_url)
+    await client_a.flushdb()
+    # Dos limitadores con clientes distintos simulan dos workers
+    worker_a = RateLimiter(client_a, LIMITS, user_concurrency=2, global_concurrency=3, enabled=True)
+    worker_b = RateLimiter(client_b, LIMITS, user_concurrency=2, global_concurrency=3, enabled=True)
+
+    # Ráfaga por usuario: 3 admitidos, el cuarto rechazado con retry-after ~1s
+    results = []
+    for _ in range(4):
+        admission = await worker_a.acquire("ana", "fitness")
+        results.append(admission)
+        await admission.release()
+    print("ráfaga usuario:", [(r.allowed, r.reason, r.retry_after) for r in results])
+    assert [r.allowed for r in results] == [True, True, True, False]
+    assert results[-1].reason == "user_rate" and 0 < results[-1].retry_after <= 1.0
+
+    # Otro usuario no se ve afectado
+    other = await worker_b.acquire("luis", "fitness")
+    assert other.allowed
+    await other.release()
+
+    # El bucket se rellena con el tiempo
+    await asyncio.sleep(1.1)
+    refilled = await worker_a.acquire("ana", "fitness")
+    assert refilled.allowed
+    await refilled.release()
+
+    # Límite global por tipo de agente, compartido entre workers
+    research = [await worker.acquire(f"user-{i}", "research") for i, worker in enumerate([worker_a, worker_b] * 2)]
+    print("global research:", [(r.allowed, r.reason) for r in research])
+    assert [r.allowed for r in research] == [True, True, False, False]
+    assert research[2].reason == "global_rate"
+    for admission in research:
+        await admission.release()
+
+    # El rechazo global devuelve al usuario su token y su plaza
+    bucket = await client_a.hget(rate_bucket_key("research", "user-2"), "tokens")
+    print("bucket usuario tras rechazo global:", bucket)
+    assert float(bucket) >= 99 and await client_a.zcard(concurrency_key("user-2")) == 0
+
+    # Claves de usuario en su slot y sólo las globales en el slot compartido
+    assert user_from_key(rate_bucket_key("research", "ana")) == "ana" == user_from_key(concurrency_key("ana"))
+    assert user_from_key(rate_bucket_key("research")) == "admission" == user_from_key(concurrency_key())
+
+    # Concurrencia por usuario coordinada entre workers
+    first = await worker_a.acquire("eva", "personalization")
+    second = await worker_b.acquire("eva", "personalization")
+    third = await worker_a.acquire("eva", "personalization")
+    print("concurrencia usuario:", first.allowed, second.allowed, (third.allowed, third.reason))
+    assert first.allowed and second.allowed and not third.allowed and third.reason == "user_concurrency"
+    await first.release()
+    fourth = await worker_b.acquire("eva", "personalization")
+    assert fourth.allowed
+
+    # Concurrencia global: 3 plazas ocupadas (second, fourth y una más)
+    extra = await worker_a.acquire("otro", "personalization")
+    blocked = await worker_b.acquire("tercero", "personalization")
+    print("concurrencia global:", extra.allowed, (blocked.allowed, blocked.reason))
+    assert extra.allowed and not blocked.allowed and blocked.reason == "global_concurrency"
+    for admission in (second, fourth, extra):
+        await admission.release()
+
+    # Coste del rechazo
+    start = time.perf_counter()
+    for _ in range(200):
+        await worker_a.acquire("ana", "fitness")
+    print(f"latencia media de admisión: {(time.perf_counter() - start) / 200 * 1000:.2f} ms")
+
+    # Sin Redis se admite (fail-open)
+    offline = RateLimiter(aioredis.Redis.from_url("redis://127.0.0.1:1/0"), LIMITS, enabled=True)
+    assert (await offline.acquire("ana", "fitness")).allowed
+    print("OK")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else None))
@@ -0,0 +1,325 @@
+# ========================================
+# app/services/tiering.py - Bajada de Datos Fríos de Redis a PostgreSQL
+# ========================================
+#
+# MemoryService anota en ACTIVITY_KEY (sorted set, puntuación = última actividad)
+# a cada usuario que conecta o escribe un turno, y la misma marca en active_at:{id}
+# (en el slot del usuario). Cada TIERING_INTERVAL un worker:
+#   - baja a la BD, por lotes, la conversación y los planes de los usuarios sin
+#     actividad en TIERING_INACTIVE_SECONDS (tabla cold_data, ver cold_storage.py)
+#     y borra de Redis esos valores y la copia del perfil (el perfil ya está en
+#     user_profiles);
+#   - si Redis supera TIERING_MEMORY_BUDGET_MB, sigue con los usuarios menos
+#     recientes (nunca con menos de TIERING_MIN_IDLE_SECONDS de inactividad).
+# Al volver, MemoryService devuelve los datos a Redis al primer acceso
+# (rehydrate_conversation, rehydrate_plan) con el TTL que les quedaba.
+# Las respuestas de APIs externas no se bajan: son compartidas y caducan solas.
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
+
+from ..database.redis_connection import get_redis
+from ..database.redis_keys import (
+    ACTIVITY_KEY, active_at_key, conversation_key, conversation_seq_key, plan_key, plans_index_key, profile_key
+)
+from .codecs import CODECS
+from .cold_storage import (
+    ColdStorage, cold_storage, pack_conversation, pack_value, unpack_conversation, unpack_value
+)
+from .metrics import TIERING_DEMOTED_KEYS, TIERING_REHYDRATIONS
+from .profile_store import ProfileStore, profile_store
+
+logger = logging.getLogger(__name__)
+
+TIERING_ENABLED = os.getenv("TIERING_ENABLED", "true").lower() == "true"
+TIERING_INTERVAL = float(os.getenv("TIERING_INTERVAL", "600"))
+# Por debajo de las 24 h de TTL de las conversaciones: se bajan antes de caducar
+TIERING_INACTIVE_SECONDS = float(os.getenv("TIERING_INACTIVE_SECONDS", "10800"))
+# Presupuesto de memoria de Redis en MB (0 = sin presupuesto, sólo por inactividad)
+TIERING_MEMORY_BUDGET_MB = float(os.getenv("TIERING_MEMORY_BUDGET_MB", "0"))
+TIERING_MIN_IDLE_SECONDS = float(os.getenv("TIERING_MIN_IDLE_SECONDS", "900"))
+TIERING_BATCH_SIZE = int(os.getenv("TIERING_BATCH_SIZE", "200"))
+# Tope de usuarios por pasada, para que una pasada no se alargue indefinidamente
+TIERING_MAX_USERS = int(os.getenv("TIERING_MAX_USERS", "20000"))
+# Turnos que conserva una conversación restaurada (MemoryService pasa el suyo)
+CONVERSATION_MAX_TURNS = 50
+
+LOCK_KEY = "tiering:lock"
+
+# Borra las claves del usuario (KEYS[1] es active_at) sólo si no ha vuelto a estar
+# activo desde que se leyeron. Todas en el slot del usuario.
+DEMOTE_SCRIPT = """
+local active_at = redis.call('GET', KEYS[1])
+if active_at and tonumber(active_at) ~= tonumber(ARGV[1]) then
+    return 0
+end
+for i = 1, #KEYS do
+    redis.call('DEL', KEYS[i])
+end
+return 1
+"""
+
+# Quita al usuario de ACTIVITY_KEY salvo que haya vuelto entre medias
+FORGET_ACTIVITY_SCRIPT = """
+if tonumber(redis.call('ZSCORE', KEYS[1], ARGV[1])) == tonumber(ARGV[2]) then
+    return redis.call('ZREM', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+# Restaura una conversación. Si el usuario ya escribió turnos nuevos antes de la
+# restauración, los antiguos van detrás (LRANGE empieza por el más reciente) y la
+# secuencia cuenta ambos. Devuelve {entradas en orden de LRANGE, secuencia}
+# KEYS: conversation, conversation_seq; ARGV: TTL (ms), secuencia, máximo de turnos, entradas
+RESTORE_CONVERSATION_SCRIPT = """
+local newer = redis.call('LLEN', KEYS[1])
+for i = 4, #ARGV do
+    redis.call('RPUSH', KEYS[1], ARGV[i])
+end
+redis.call('LTRIM', KEYS[1], 0, tonumber(ARGV[3]) - 1)
+if newer == 0 then
+    redis.call('PEXPIRE', KEYS[1], ARGV[1])
+    redis.call('SET', KEYS[2], ARGV[2], 'PX', ARGV[1], 'NX')
+else
+    redis.call('INCRBY', KEYS[2], ARGV[2])
+end
+return {redis.call('LRANGE', KEYS[1], 0, -1), redis.call('GET', KEYS[2])}
+"""
+
+
+def _ttl_ms(ttl: Optional[float]) -> Optional[int]:
+    return None if ttl is None else int(ttl * 1000)
+
+
+def rehydrate_conversation(redis_client, user_id: str, store: ColdStorage = cold_storage,
+                           max_turns: int = CONVERSATION_MAX_TURNS) -> Optional[Tuple[List[bytes], int]]:
+    """
+    Devuelve a Redis la conversación bajada a la BD; (entradas en orden de LRANGE,
+    secuencia) o None si no había. Síncrona: se llama con asyncio.to_thread.
+    """
+    key = conversation_key(user_id)
+    row = store.get(key)
+    if row is None:
+        return None
+    _, payload, ttl = row
+    if ttl is not None and ttl <= 0:
+        store.delete([key])
+        return None  # habría caducado igualmente
+    entries, seq = unpack_conversation(payload)
+    if entries:
+        ttl_ms = _ttl_ms(ttl) if ttl is not None else 86400 * 1000
+        entries, seq = redis_client.eval(RESTORE_CONVERSATION_SCRIPT, 2, key, conversation_seq_key(user_id),
+                                         ttl_ms, seq, max_turns, *entries)
+        seq = int(seq)
+    # Sólo cuando la conversación ya está en Redis: si el script falla, sigue en la BD
+    store.delete([key])
+    TIERING_REHYDRATIONS.labels("conversation").inc()
+    return entries, seq
+
+
+def rehydrate_plan(redis_client, plan_id: str, user_id: Optional[str] = None,
+                   store: ColdStorage = cold_storage) -> Optional[bytes]:
+    """Devuelve a Redis un plan bajado a la BD; su valor actual en Redis, o None"""
+    key = plan_key(plan_id, user_id)
+    row = store.get(key)
+    if row is None:
+        return None
+    user_id, payload, ttl = row
+    if ttl is not None and ttl <= 0:
+        store.delete([key])
+        return None
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.set(key, unpack_value(payload), px=_ttl_ms(ttl), nx=True)
+    pipe.sadd(plans_index_key(user_id), plan_id)
+    pipe.get(key)
+    restored, _, raw = pipe.execute()
+    if restored:
+        store.delete([key])
+        TIERING_REHYDRATIONS.labels("plan").inc()
+    else:
+        # Ya había una versión en Redis (recalculada mientras tanto): la fila se conserva
+        # y la sustituye la próxima bajada del plan
+        logger.info(f"Plan {plan_id} ya estaba en Redis; se conserva su copia en la BD")
+    return raw
+
+
+def cold_plan_ids(user_id: str, store: ColdStorage = cold_storage) -> List[str]:
+    """plan_id de los planes de un usuario que están en la BD y no en Redis"""
+    # plan:{<user_id>}:<plan_id>
+    return [key.split(":", 2)[2] for key in store.keys_for_user(user_id, "plan")]
+
+
+def _decode(value: Any) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class TieringJob:
+    """Baja a PostgreSQL los datos de Redis de los usuarios inactivos"""
+
+    def __init__(self, redis_client=None, store: ColdStorage = cold_storage,
+                 profiles: ProfileStore = profile_store, enabled: bool = TIERING_ENABLED):
+        self.redis_client = redis_client
+        self.store = store
+        self.profiles = profiles
+        self.enabled = enabled
+        self._demote_script = None
+        self._forget_script = None
+        self._scheduler: Optional[asyncio.Task] = None
+
+    def _client(self):
+        if self.redis_client is None:
+            self.redis_client = get_redis()
+        return self.redis_client
+
+    def run_once(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Una pasada completa; devuelve usuarios bajados por motivo y filas purgadas"""
+        now = time.time() if now is None else now
+        stats = {"inactive": 0, "memory": 0, "purged": self.store.purge_expired()}
+
+        while stats["inactive"] < TIERING_MAX_USERS:
+            users = self._candidates(now - TIERING_INACTIVE_SECONDS)
+            demoted = self.demote(users) if users else 0
+            if not demoted:
+                # Sin candidatos, o todos han vuelto: la próxima pasada los verá con su nueva actividad
+                break
+            stats["inactive"] += demoted
+
+        budget = TIERING_MEMORY_BUDGET_MB * 1024 * 1024
+        while budget and stats["inactive"] + stats["memory"] < TIERING_MAX_USERS:
+            if self._client().info("memory")["used_memory"] <= budget:
+                break
+            users = self._candidates(now - TIERING_MIN_IDLE_SECONDS)
+            demoted = self.demote(users) if users else 0
+            if not demoted:
+                logger.warning("Redis supera el presupuesto de memoria y no quedan usuarios inactivos que bajar")
+                break
+            stats["memory"] += demoted
+        return stats
+
+    def _candidates(self, idle_before: float) -> List[Tuple[str, float]]:
+        """Usuarios menos recientes con última actividad anterior a idle_before"""
+        users = self._client().zrangebyscore(
+            ACTIVITY_KEY, "-inf", idle_before, start=0, num=TIERING_BATCH_SIZE, withscores=True
+        )
+        return [(_decode(user_id), score) for user_id, score in users]
+
+    def demote(self, users: List[Tuple[str, float]]) -> int:
+        """Baja un lote de usuarios; devuelve cuántos se borraron de Redis"""
+        client = self._client()
+        pipe = client.pipeline(transaction=False)
+        for user_id, _ in users:
+            pipe.lrange(conversation_key(user_id), 0, -1)
+            pipe.pttl(conversation_key(user_id))
+            pipe.get(conversation_seq_key(user_id))
+            pipe.get(profile_key(user_id))
+            pipe.smembers(plans_index_key(user_id))
+        results = pipe.execute()
+        per_user = [results[i:i + 5] for i in range(0, len(results), 5)]
+
+        plan_keys = [plan_key(_decode(plan_id), user_id)
+                     for (user_id, _), (_, _, _, _, plan_ids) in zip(users, per_user) for plan_id in plan_ids]
+        pipe = client.pipeline(transaction=False)
+        for key in plan_keys:
+            pipe.get(key)
+            pipe.pttl(key)
+        plan_results = iter(pipe.execute())
+        plans = {key: (next(plan_results), next(plan_results)) for key in plan_keys}
+
+        now = datetime.now(timezone.utc)
+        rows, profiles, keys_by_user = [], [], {}
+        for (user_id, _), (entries, conv_ttl, seq, profile_raw, plan_ids) in zip(users, per_user):
+            keys = [active_at_key(user_id), conversation_key(user_id), conversation_seq_key(user_id),
+                    profile_key(user_id), plans_index_key(user_id)]
+            if entries:
+                rows.append(self._row(conversation_key(user_id), user_id, "conversation",
+                                      pack_conversation(entries, int(seq or 0)), conv_ttl, now))
+            for plan_id in plan_ids:
+                key = plan_key(_decode(plan_id), user_id)
+                raw, ttl = plans[key]
+                if raw is not None:
+                    rows.append(self._row(key, user_id, "plan", pack_value(raw), ttl, now))
+                    keys.append(key)
+            profile = self._decode_profile(profile_raw, user_id)
+            if profile:
+                profiles.append(profile)
+            keys_by_user[user_id] = keys
+
+        # Primero la BD: si falla, no se borra nada de Redis
+        self.store.save_many(rows)
+        self.profiles.save_many(profiles)
+
+        if self._demote_script is None:
+            self._demote_script = client.register_script(DEMOTE_SCRIPT)
+            self._forget_script = client.register_script(FORGET_ACTIVITY_SCRIPT)
+        demoted, returned = 0, []
+        for user_id, score in users:
+            keys = keys_by_user[user_id]
+            if self._demote_script(keys=keys, args=[repr(score)]):
+                self._forget_script(keys=[ACTIVITY_KEY], args=[user_id, repr(score)])
+                demoted += 1
+            else:
+                # Ha vuelto mientras tanto: sus datos siguen en Redis y la copia fría sobra
+                returned += [key for key in keys if key.startswith(("conversation:", "plan:"))]
+        self.store.delete(returned)
+
+        for row in rows:
+            if row["key"] not in returned:
+                TIERING_DEMOTED_KEYS.labels(row["kind"]).inc()
+        return demoted
+
+    @staticmethod
+    def _row(key: str, user_id: str, kind: str, payload: bytes, pttl: int, now: datetime) -> Dict[str, Any]:
+        # PTTL: -1 sin caducidad, -2 la clave ya no existe
+        expires_at = now + timedelta(milliseconds=pttl) if pttl is not None and pttl >= 0 else None
+        return {"key": key, "user_id": user_id, "kind": kind, "payload": payload, "expires_at": expires_at}
+
+    @staticmethod
+    def _decode_profile(raw: Optional[bytes], user_id: str) -> Optional[Dict[str, Any]]:
+        if not raw:
+            return None
+        try:
+            profile = CODECS["profile"].decode(raw)
+        except ValueError:
+            logger.warning(f"Perfil de {user_id} ilegible en Redis; se descarta la copia")
+            return None
+        if not profile:
+            return None  # marca de usuario sin perfil
+        profile["user_id"] = user_id
+        return profile
+
+    def start_scheduler(self, interval: float = TIERING_INTERVAL):
+        if self.enabled and (self._scheduler is None or self._scheduler.done()):
+            self._scheduler = asyncio.create_task(self._run_scheduler(interval))
+
+    async def stop_scheduler(self):
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            await asyncio.gather(self._scheduler, return_exceptions=True)
+            self._scheduler = None
+
+    async def _run_scheduler(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                # Una pasada por intervalo en todo el clúster: el lock caduca solo
+                if not self._client().set(LOCK_KEY, os.getpid(), nx=True, ex=max(1, int(interval))):
+                    continue
+                stats = await asyncio.to_thread(self.run_once)
+                if stats["inactive"] or stats["memory"] or stats["purged"]:
+                    logger.info(f"Tiering: {stats['inactive']} usuarios inactivos y {stats['memory']} por "
+                                f"memoria bajados a la BD, {stats['purged']} filas caducadas purgadas")
+            except Exception as e:
+                logger.error(f"Error en la bajada de datos fríos: {str(e)}")
+
+
+tiering_job = TieringJob()
+
+
+if __name__ == "__main__":
+    # Pasada manual o desde cron: python -m app.services.tiering
+    logging.basicConfig(level=logging.INFO)
+    logger.info(f"Tiering: {tiering_job.run_once()}")
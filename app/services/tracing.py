@@ -0,0 +1,134 @@
+# ========================================
+# app/services/tracing.py - Trazas Distribuidas (OpenTelemetry)
+# ========================================
+
+from typing import Any, Dict, Optional, Sequence
+from functools import wraps
+import asyncio
+import json
+import logging
+import os
+import threading
+
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider, ReadableSpan
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+logger = logging.getLogger(__name__)
+
+# TRACING_EXPORTER: "none" (por defecto), "file" (JSON por línea) u "otlp" (colector local)
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none").lower()
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+TRACING_SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", "0.1"))
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318")
+
+tracer = trace.get_tracer("nutriagent")
+
+
+class FileSpanExporter(SpanExporter):
+    """Escribe cada span como una línea JSON en un fichero local"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        lines = [json.dumps(self._to_dict(span)) for span in spans]
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            return SpanExportResult.SUCCESS
+        except OSError as e:
+            logger.error(f"Error exportando trazas a {self.path}: {str(e)}")
+            return SpanExportResult.FAILURE
+
+    def _to_dict(self, span: ReadableSpan) -> Dict[str, Any]:
+        context = span.get_span_context()
+        return {
+            "name": span.name,
+            "trace_id": format(context.trace_id, "032x"),
+            "span_id": format(context.span_id, "016x"),
+            "parent_id": format(span.parent.span_id, "016x") if span.parent else None,
+            "start_ns": span.start_time,
+            "duration_ms": round((span.end_time - span.start_time) / 1e6, 3),
+            "status": span.status.status_code.name,
+            "attributes": dict(span.attributes or {}),
+        }
+
+    def shutdown(self):
+        pass
+
+
+def _build_exporter() -> Optional[SpanExporter]:
+    if TRACING_EXPORTER == "file":
+        return FileSpanExporter(TRACING_FILE)
+    if TRACING_EXPORTER == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            logger.warning("opentelemetry-exporter-otlp-proto-http no instalado; trazas desactivadas")
+            return None
+        return OTLPSpanExporter(endpoint=f"{OTLP_ENDPOINT.rstrip('/')}/v1/traces")
+    return None
+
+
+def setup_tracing(service_name: str = "nutriagent"):
+    """Configura el proveedor de trazas global y la correlación con los logs"""
+    install_log_correlation()
+
+    exporter = _build_exporter()
+    if exporter is None:
+        # Sin proveedor SDK los spans son no-op: coste prácticamente nulo
+        return
+
+    # El muestreo se decide en la raíz (mensaje WebSocket) y los spans hijos la heredan
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": service_name}),
+        sampler=ParentBased(TraceIdRatioBased(TRACING_SAMPLE_RATE)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    logger.info(f"Trazas activas: exportador={TRACING_EXPORTER}, muestreo={TRACING_SAMPLE_RATE}")
+
+
+def current_trace_id() -> str:
+    """trace_id del span activo en hexadecimal, o '-' si no hay traza"""
+    context = trace.get_current_span().get_span_context()
+    return format(context.trace_id, "032x") if context.is_valid else "-"
+
+
+class TraceIdFilter(logging.Filter):
+    """Añade trace_id a cada registro de log para correlacionarlo con las trazas"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = current_trace_id()
+        return True
+
+
+def install_log_correlation(fmt: str = "%(asctime)s %(levelname)s [trace_id=%(trace_id)s] %(name)s: %(message)s"):
+    """Instala TraceIdFilter y un formato con trace_id en los handlers del logger raíz"""
+    formatter = logging.Formatter(fmt)
+    for handler in logging.getLogger().handlers:
+        if not any(isinstance(f, TraceIdFilter) for f in handler.filters):
+            handler.addFilter(TraceIdFilter())
+        handler.setFormatter(formatter)
+
+
+def traced(span_name: str):
+    """Decorador que ejecuta la función (sync o async) dentro de un span hijo del activo"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.start_as_current_span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.start_as_current_span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,230 @@
+# ========================================
+# app/services/turn_events.py - Stream de Turnos de Conversación
+# ========================================
+#
+# MemoryService.update_conversation añade cada turno al stream events:turns (XADD
+# con MAXLEN aproximado, en el mismo pipeline que guarda el turno: no añade idas y
+# vueltas a Redis). El análisis, la indexación o el archivo de conversaciones leen
+# el stream fuera del camino del chat, cada uno con su grupo de consumidores:
+#   - varios procesos en el mismo grupo se reparten los eventos;
+#   - un evento se confirma (XACK) sólo si el handler termina sin error; los que
+#     quedan pendientes (handler con error o consumidor caído) los reclama un
+#     consumidor del grupo pasado TURN_EVENT_CLAIM_IDLE_MS;
+#   - tras TURN_EVENT_MAX_DELIVERIES entregas fallidas el evento pasa a
+#     events:turns:dead y se confirma;
+#   - --replay-from <id> vuelve a procesar el stream desde ese id (0 = lo que
+#     conserve el stream), así que los handlers deben ser idempotentes.
+#
+# python -m app.services.turn_events archive [--consumer <nombre>] [--replay-from <id>]
+
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import argparse
+import logging
+import os
+import socket
+import time
+
+from ..database.redis_connection import get_redis
+from ..database.redis_keys import TURN_DEAD_LETTER_KEY, TURN_STREAM_KEY
+
+logger = logging.getLogger(__name__)
+
+TURN_STREAM_ENABLED = os.getenv("TURN_STREAM_ENABLED", "true").lower() == "true"
+# Eventos que conserva el stream (aproximado: Redis recorta por nodos enteros)
+TURN_STREAM_MAXLEN = int(os.getenv("TURN_STREAM_MAXLEN", "100000"))
+TURN_EVENT_BATCH_SIZE = int(os.getenv("TURN_EVENT_BATCH_SIZE", "100"))
+TURN_EVENT_BLOCK_MS = int(os.getenv("TURN_EVENT_BLOCK_MS", "5000"))
+TURN_EVENT_CLAIM_IDLE_MS = int(os.getenv("TURN_EVENT_CLAIM_IDLE_MS", "60000"))
+TURN_EVENT_MAX_DELIVERIES = int(os.getenv("TURN_EVENT_MAX_DELIVERIES", "5"))
+
+TurnEvent = Tuple[str, Dict[str, str]]
+
+
+def turn_event_fields(user_id: str, entry: Dict[str, Any]) -> Dict[str, str]:
+    """Campos del evento de un turno (texto plano: cualquier consumidor puede leerlo)"""
+    return {
+        "user_id": user_id,
+        "agent": entry.get("agent") or "",
+        "timestamp": entry["timestamp"],
+        "user_message": entry.get("user_message") or "",
+        "agent_response": entry.get("agent_response") or "",
+    }
+
+
+def _text(value: Any) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class TurnEventConsumer:
+    """Consumidor de un grupo del stream de turnos; handler recibe lotes de (id, campos)"""
+
+    def __init__(self, group: str, handler: Callable[[List[TurnEvent]], Any],
+                 consumer: Optional[str] = None, redis_client=None,
+                 batch_size: int = TURN_EVENT_BATCH_SIZE, block_ms: int = TURN_EVENT_BLOCK_MS):
+        self.group = group
+        self.handler = handler
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.redis_client = redis_client or get_redis(decode_responses=True)
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        # Al arrancar se leen primero los pendientes de este consumidor (id 0)
+        self._recovering = True
+        self._next_claim = 0.0
+
+    def ensure_group(self, start_id: str = "0"):
+        """Crea el grupo si no existe; uno nuevo empieza por lo que conserve el stream"""
+        try:
+            self.redis_client.xgroup_create(TURN_STREAM_KEY, self.group, id=start_id, mkstream=True)
+            logger.info(f"Grupo {self.group} creado en {TURN_STREAM_KEY}")
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def replay_from(self, start_id: str):
+        """Vuelve a entregar al grupo los eventos posteriores a start_id"""
+        self.ensure_group(start_id)
+        self.redis_client.xgroup_setid(TURN_STREAM_KEY, self.group, start_id)
+        logger.info(f"Grupo {self.group} reposicionado en {start_id}")
+
+    def run_once(self) -> int:
+        """Lee y procesa un lote; devuelve los eventos confirmados"""
+        if time.monotonic() >= self._next_claim:
+            self._next_claim = time.monotonic() + TURN_EVENT_CLAIM_IDLE_MS / 1000
+            events = self._claim_stale()
+            if events:
+                return self._handle(events)
+
+        read_id = "0" if self._recovering else ">"
+        response = self.redis_client.xreadgroup(
+            self.group, self.consumer, {TURN_STREAM_KEY: read_id},
+            count=self.batch_size, block=None if self._recovering else self.block_ms,
+        )
+        events = response[0][1] if response else []
+        if self._recovering and not events:
+            # Sin pendientes propios: a partir de aquí, sólo eventos nuevos
+            self._recovering = False
+        return self._handle(events)
+
+    def _handle(self, events: List[TurnEvent]) -> int:
+        # Un pendiente que el MAXLEN ya recortó llega sin campos: sólo se confirma
+        valid = [(event_id, fields) for event_id, fields in events if fields]
+        if valid:
+            try:
+                self.handler(valid)
+            except Exception as e:
+                logger.error(f"Error procesando eventos de turnos en {self.group}: {str(e)}")
+                # Quedan pendientes: se reintentan al reclamarlos pasado TURN_EVENT_CLAIM_IDLE_MS
+                self._recovering = False
+                return 0
+        ids = [event_id for event_id, _ in events]
+        if ids:
+            self.redis_client.xack(TURN_STREAM_KEY, self.group, *ids)
+        return len(ids)
+
+    def _claim_stale(self) -> List[TurnEvent]:
+        """Reclama los pendientes de consumidores caídos; los que fallan demasiado van a dead"""
+        pending = self.redis_client.xpending_range(
+            TURN_STREAM_KEY, self.group, min="-", max="+", count=self.batch_size,
+            idle=TURN_EVENT_CLAIM_IDLE_MS,
+        )
+        if not pending:
+            return []
+        dead = [p["message_id"] for p in pending if p["times_delivered"] >= TURN_EVENT_MAX_DELIVERIES]
+        retry = [p["message_id"] for p in pending if p["times_delivered"] < TURN_EVENT_MAX_DELIVERIES]
+        if dead:
+            self._dead_letter(dead)
+        if not retry:
+            return []
+        return self.redis_client.xclaim(
+            TURN_STREAM_KEY, self.group, self.consumer, TURN_EVENT_CLAIM_IDLE_MS, retry
+        )
+
+    def _dead_letter(self, ids: List[str]):
+        pipe = self.redis_client.pipeline(transaction=False)
+        for event_id in ids:
+            pipe.xrange(TURN_STREAM_KEY, min=event_id, max=event_id)
+        for event_id, found in zip(ids, pipe.execute()):
+            fields = found[0][1] if found else {}
+            self.redis_client.xadd(
+                TURN_DEAD_LETTER_KEY, {"group": self.group, "event_id": event_id, **fields},
+                maxlen=TURN_STREAM_MAXLEN, approximate=True,
+            )
+            logger.warning(f"Evento {event_id} descartado por {self.group} tras "
+                           f"{TURN_EVENT_MAX_DELIVERIES} entregas fallidas")
+        self.redis_client.xack(TURN_STREAM_KEY, self.group, *ids)
+
+    def run(self, stop: Optional[Callable[[], bool]] = None):
+        """Bucle del consumidor; sigue tras errores de Redis"""
+        self.ensure_group()
+        logger.info(f"Consumidor {self.consumer} del grupo {self.group} en marcha")
+        while not (stop and stop()):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Error leyendo {TURN_STREAM_KEY}: {str(e)}")
+                time.sleep(1)
+
+
+class TurnArchive:
+    """Handler que guarda los turnos en la tabla conversation_turns (idempotente)"""
+
+    def __init__(self, session_factory=None):
+        self._session_factory = session_factory
+
+    def _session(self):
+        if self._session_factory is None:
+            from ..database.connection import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory()
+
+    @staticmethod
+    def _row(event_id: str, fields: Dict[str, str]) -> Dict[str, Any]:
+        created_at = datetime.fromisoformat(_text(fields["timestamp"]))
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        return {
+            "event_id": _text(event_id),
+            "user_id": _text(fields["user_id"]),
+            "agent": _text(fields.get("agent")) or None,
+            "user_message": _text(fields.get("user_message")),
+            "agent_response": _text(fields.get("agent_response")),
+            "created_at": created_at,
+        }
+
+    def save_many(self, events: List[TurnEvent]) -> int:
+        from ..models.conversation_turn import ConversationTurn
+
+        rows = [self._row(event_id, fields) for event_id, fields in events]
+        with self._session() as session:
+            if session.get_bind().dialect.name == "sqlite":
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            # Un evento repetido (reintento o replay) ya está guardado
+            stmt = insert(ConversationTurn).values(rows).on_conflict_do_nothing(
+                index_elements=[ConversationTurn.event_id]
+            )
+            session.execute(stmt)
+            session.commit()
+        return len(rows)
+
+
+# Grupos disponibles desde la línea de comandos: nombre del grupo -> handler
+HANDLERS: Dict[str, Callable[[List[TurnEvent]], Any]] = {
+    "archive": TurnArchive().save_many,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Consumidor del stream de turnos de conversación")
+    parser.add_argument("group", choices=sorted(HANDLERS), help="Grupo de consumidores")
+    parser.add_argument("--consumer", help="Nombre del consumidor (por defecto, host-pid)")
+    parser.add_argument("--replay-from", help="Reprocesar el stream desde este id (0 = todo lo que conserva)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    consumer = TurnEventConsumer(args.group, HANDLERS[args.group], consumer=args.consumer)
+    if args.replay_from is not None:
+        consumer.replay_from(args.replay_from)
+    consumer.run()
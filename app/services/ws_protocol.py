@@ -0,0 +1,100 @@
+# ========================================
+# app/services/ws_protocol.py - Protocolo de Mensajes WebSocket
+# ========================================
+#
+# El cliente elige el formato con el subprotocolo WebSocket al conectar:
+#   - sin subprotocolo:       JSON en frames de texto, plan completo (compatible con clientes antiguos)
+#   - "nutriagent.v2.json":   JSON en frames de texto, planes como delta
+#   - "nutriagent.v2.msgpack": MessagePack en frames binarios, planes como delta
+# La compresión permessage-deflate la negocia uvicorn (--ws-per-message-deflate, activo por defecto).
+
+from typing import Any, Dict, Iterable, Optional
+import logging
+
+import msgpack
+import orjson
+from fastapi import WebSocket, WebSocketDisconnect
+
+from . import merge_patch
+
+logger = logging.getLogger(__name__)
+
+JSON_V2 = "nutriagent.v2.json"
+MSGPACK_V2 = "nutriagent.v2.msgpack"
+SUPPORTED_SUBPROTOCOLS = (MSGPACK_V2, JSON_V2)
+
+# orjson admite claves no str (como json.dumps) y serializa datetime de forma nativa
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def encode_json(message: Dict[str, Any]) -> str:
+    return orjson.dumps(message, option=ORJSON_OPTIONS).decode("utf-8")
+
+
+def negotiate(requested: Iterable[str]) -> Optional[str]:
+    """Primer subprotocolo soportado en el orden de preferencia del cliente"""
+    for subprotocol in requested:
+        if subprotocol in SUPPORTED_SUBPROTOCOLS:
+            return subprotocol
+    return None
+
+
+class WireProtocol:
+    """Estado de protocolo de una conexión: formato y últimos planes enviados"""
+
+    def __init__(self, subprotocol: Optional[str] = None):
+        self.subprotocol = subprotocol
+        self.binary = subprotocol == MSGPACK_V2
+        # Los clientes v2 reciben los planes como delta respecto al último de cada tipo
+        self.deltas = subprotocol in SUPPORTED_SUBPROTOCOLS
+        self.sent_plans: Dict[str, Dict[str, Any]] = {}
+
+    @classmethod
+    def for_websocket(cls, websocket: WebSocket) -> "WireProtocol":
+        return cls(negotiate(websocket.scope.get("subprotocols", [])))
+
+    def prepare(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Sustituye el plan por un delta si el cliente ya tiene uno anterior del mismo tipo"""
+        plan = message.get("plan")
+        if not self.deltas or not isinstance(plan, dict) or "error" in plan:
+            return message
+
+        plan_type = plan.get("type", "")
+        previous = self.sent_plans.get(plan_type)
+        # Los planes no se modifican tras enviarse: basta con guardar la referencia
+        self.sent_plans[plan_type] = plan
+        if previous is None:
+            return message
+
+        try:
+            patch = merge_patch.diff(previous, plan)
+        except merge_patch.UnrepresentableChange:
+            return message
+
+        prepared = dict(message)
+        prepared["plan"] = None
+        prepared["plan_delta"] = {"base": previous.get("id"), "type": plan_type, "patch": patch}
+        return prepared
+
+    def encode(self, message: Dict[str, Any]):
+        """bytes para frames binarios (MessagePack) o str para frames de texto (JSON)"""
+        message = self.prepare(message)
+        if self.binary:
+            return msgpack.packb(message, use_bin_type=True, default=str)
+        return encode_json(message)
+
+    async def send(self, websocket: WebSocket, message: Dict[str, Any]):
+        payload = self.encode(message)
+        if self.binary:
+            await websocket.send_bytes(payload)
+        else:
+            await websocket.send_text(payload)
+
+    async def receive(self, websocket: WebSocket) -> Dict[str, Any]:
+        """Lee el siguiente mensaje del cliente (texto JSON o binario MessagePack)"""
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        if message.get("bytes") is not None:
+            return msgpack.unpackb(message["bytes"], raw=False)
+        return orjson.loads(message["text"])
@@ -1,7 +1,12 @@
 # Herramientas de cálculo nutricional
+from ..services.metrics import instrument_tool
+from ..services.tracing import traced
 
 class MacroCalculatorTool:
     name = "MacroCalculatorTool"
+
+    @traced("tool.MacroCalculatorTool")
+    @instrument_tool("MacroCalculatorTool")
     def run(self, params: dict):
         """
         Calcula la distribucion de proteinas, grasas y carbohidratos en gramos, pasandole
@@ -29,6 +34,9 @@ class MacroCalculatorTool:
 
 class CalorieCalculatorTool:
     name = "CalorieCalculatorTool"
+
+    @traced("tool.CalorieCalculatorTool")
+    @instrument_tool("CalorieCalculatorTool")
     def run(self, params: dict):
         """
         Calcula calorías diarias recomendadas usando Harris-Benedict.
@@ -62,6 +70,9 @@ class CalorieCalculatorTool:
 
 class WorkoutCalculatorTool:
     name = "WorkoutCalculatorTool"
+
+    @traced("tool.WorkoutCalculatorTool")
+    @instrument_tool("WorkoutCalculatorTool")
     def run(self, params: dict):
         """
         Genera una rutina semanal básica según nivel y objetivo.
@@ -1,13 +1,23 @@
 # Herramientas de integración con APIs de fitness
 import httpx
-from typing import Dict, Any
+from typing import Dict, Any, List
 import logging
 import os
 from dotenv import load_dotenv
 
+from ..services.api_cache import api_cache
+from ..services.metrics import instrument_tool
+from ..services.tracing import traced
+from .resilience import ResilientClient
+
 load_dotenv()
 
 API_EXERCICEDB = os.getenv('API_EXERCICEDB_KEY')
+EXERCISEDB_BASE_URL = os.getenv('EXERCISEDB_BASE_URL', 'https://exercisedb.p.rapidapi.com')
+
+# Los datos de ExerciseDB casi no cambian: frescos 6 h, se sirven hasta 7 días
+EXERCISEDB_SOFT_TTL = int(os.getenv('EXERCISEDB_CACHE_SOFT_TTL', '21600'))
+EXERCISEDB_HARD_TTL = int(os.getenv('EXERCISEDB_CACHE_HARD_TTL', '604800'))
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -25,15 +35,18 @@ class ExerciseDBTool:
         Args:
             api_key: Clave API de RapidAPI para ExerciseDB (requerida)
         """
-        self.base_url = "https://exercisedb.p.rapidapi.com"
+        self.base_url = EXERCISEDB_BASE_URL
         self.api_key = API_EXERCICEDB  # Cargar desde variable de entorno
         self.headers = {
             "X-RapidAPI-Key": self.api_key or "TU_API_KEY_AQUI",
             "X-RapidAPI-Host": "exercisedb.p.rapidapi.com"
         }
-        self.exercises_list = {}
         self.timeout = 30.0
+        # Circuit breaker, reintentos y conexiones reutilizadas entre llamadas
+        self.http = ResilientClient("exercisedb", self.base_url, self.headers, timeout=self.timeout)
     
+    @traced("tool.ExerciseDBTool")
+    @instrument_tool("ExerciseDBTool")
     async def run(self, **kwargs) -> Dict[str, Any]:
         """
         Ejecuta una acción específica con la API de ExerciseDB
@@ -61,60 +74,71 @@ class ExerciseDBTool:
     async def get_exercises_by_target(self, target: str) -> Dict[str, Any]:
         """Obtiene ejercicios por músculo objetivo"""
         try:
+            exercises = await api_cache.get_or_fetch(
+                f"exercisedb:target:{target}",
+                lambda: self._fetch_exercises_by_target(target),
+                soft_ttl=EXERCISEDB_SOFT_TTL,
+                hard_ttl=EXERCISEDB_HARD_TTL
+            )
+            # Resultado propio de cada llamada: la herramienta es compartida entre usuarios
+            exercises_list = {
+                exercise["id"]: {
+                    "id": exercise["id"],
+                    "name": exercise["name"],
+                    "difficulty": exercise["difficulty"],
+                }
+                for exercise in exercises
+            }
 
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                try:
-                    url = f"{self.base_url}/exercises/target/{target}"
-                    response = await client.get(url, headers=self.headers)
-                
-                    if response.status_code == 200:
-                        exercises = response.json()
-                        for exercise in exercises:
-                            data = {
-                                "id": exercise["id"],
-                                "name": exercise["name"],
-                                "difficulty": exercise["difficulty"],
-                            }
-                            self.exercises_list.update(data)
-                    
-                        return {
-                            "success": True,
-                            "data": self.exercises_list,
-                        }
-                    else:
-                        raise Exception(
-                            status_code=response.status_code,
-                            detail=f"Error en ExerciseDB API: {response.status_code}"
-                        )
-                except httpx.TimeoutException:
-                    raise Exception("Request timeout")
-                except httpx.RequestError as e:
-                    raise Exception(f"Error de conexión: {str(e)}")
+            return {
+                "success": True,
+                "data": exercises_list,
+            }
         except httpx.HTTPStatusError as e:
             logger.error(f"Error al obtener ejercicios por objetivo: {e}")
             raise Exception(f"Error: {e.response.status_code} - {e.response.text}")
 
+    async def _fetch_exercises_by_target(self, target: str) -> List[Dict[str, Any]]:
+        try:
+            response = await self.http.get(f"/exercises/target/{target}", endpoint="exercises/target")
+
+            if response.status_code == 200:
+                return response.json()
+            else:
+                raise Exception(f"Error en ExerciseDB API: {response.status_code}")
+        except httpx.TimeoutException:
+            raise Exception("Request timeout")
+        except httpx.RequestError as e:
+            raise Exception(f"Error de conexión: {str(e)}")
+
 
     async def get_target_list(self, limit: str) -> Dict[str, Any]:
         """Obtiene lista de músculos objetivo disponibles"""
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            try:
-                url = f"{self.base_url}/exercises/targetList"
-                response = await client.get(url, headers=self.headers)
-                
-                if response.status_code == 200:
-                    targets = response.json()
-                    return {
-                        "success": True,
-                        "data": targets [:limit] if limit else targets,
-                        "count": len(targets)
-                    }
-                else:
-                    raise Exception(f"Error en ExerciseDB API: {response.status_code}"
-                    )
-            except httpx.TimeoutException:
-                raise Exception("Timeout en la API de ExerciseDB")
-            except httpx.HTTPStatusError as e:
-                logger.error(f"Error al obtener lista de objetivos: {e}")
-                raise Exception(f"Error de conexión: {str(e)}")
+        # La lista es la misma para todos: se recarga de forma programada (hot)
+        targets = await api_cache.get_or_fetch(
+            "exercisedb:targetList",
+            self._fetch_target_list,
+            soft_ttl=EXERCISEDB_SOFT_TTL,
+            hard_ttl=EXERCISEDB_HARD_TTL,
+            hot=True
+        )
+        return {
+            "success": True,
+            "data": targets [:limit] if limit else targets,
+            "count": len(targets)
+        }
+
+    async def _fetch_target_list(self) -> List[str]:
+        try:
+            response = await self.http.get("/exercises/targetList", endpoint="exercises/targetList")
 
+            if response.status_code == 200:
+                return response.json()
+            else:
+                raise Exception(f"Error en ExerciseDB API: {response.status_code}"
+                )
+        except httpx.TimeoutException:
+            raise Exception("Timeout en la API de ExerciseDB")
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Error al obtener lista de objetivos: {e}")
+            raise Exception(f"Error de conexión: {str(e)}")
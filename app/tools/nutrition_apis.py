@@ -1,25 +1,40 @@
 # Herramientas de integración con APIs de nutrición
+import hashlib
 import httpx
+import orjson
 import os
 from dotenv import load_dotenv
 
+from ..services.api_cache import api_cache
+from ..services.metrics import instrument_tool
+from ..services.tracing import traced
+from .resilience import CircuitOpenError, ResilientClient
+
 load_dotenv()
 
 APP_ID = os.getenv('APP_EDAMAM_ID')
 API_KEY = os.getenv('API_EDAMAM_KEY')
+EDAMAM_BASE_URL = os.getenv('EDAMAM_BASE_URL', 'https://api.edamam.com')
+# Misma consulta, mismo plan: fresco 1 h, se sirve hasta 24 h
+EDAMAM_SOFT_TTL = int(os.getenv('EDAMAM_CACHE_SOFT_TTL', '3600'))
+EDAMAM_HARD_TTL = int(os.getenv('EDAMAM_CACHE_HARD_TTL', '86400'))
 
 class EdamamMealPlannerTool:
 
     def __init__(self):
 
-        self.base_url = "https://api.edamam.com/api/meal-planner/v1"
+        self.base_url = f"{EDAMAM_BASE_URL}/api/meal-planner/v1"
         self.api_id = APP_ID
         self.api_key = API_KEY
         self.headers = {
             "Content-Type": "application/json",
             "Edamam-Account-User": "juanjomg"
         }
+        # Circuit breaker y conexiones reutilizadas; el POST no se reintenta
+        self.http = ResilientClient("edamam", self.base_url, self.headers, timeout=20.0)
 
+    @traced("tool.EdamamMealPlannerTool")
+    @instrument_tool("EdamamMealPlannerTool")
     async def run(self, params: dict):
         """
         Crea un plan de comidas usando la API Meal Planner de Edamam.
@@ -27,22 +42,30 @@ class EdamamMealPlannerTool:
         """
 
         try:
-            tipo = params.get("type", "public")
-            async with httpx.AsyncClient() as client:
-                url = f"{self.base_url}/{self.api_id}/select?type={tipo}"
-                response = await client.post(
-                    url,
-                    json=params,
-                    headers=self.headers,
-                    timeout=20.0
-                )
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    return {"error": response.text}
+            digest = hashlib.sha1(orjson.dumps(params, option=orjson.OPT_SORT_KEYS)).hexdigest()
+            return await api_cache.get_or_fetch(
+                f"edamam:select:{digest}",
+                lambda: self._select(params),
+                soft_ttl=EDAMAM_SOFT_TTL,
+                hard_ttl=EDAMAM_HARD_TTL
+            )
+        except CircuitOpenError as e:
+            return {"error": str(e)}
         except httpx.TimeoutException as e:
             return {"error": f"Timeout error: {str(e)}"}
         except httpx.RequestError as e:
             return {"error": f"Request error: {str(e)}"}
         except httpx.HTTPStatusError as e:
             return Exception(f"HTTP error: {e.response.status_code} - {e.response.text}")
+
+    async def _select(self, params: dict):
+        tipo = params.get("type", "public")
+        response = await self.http.post(
+            f"/{self.api_id}/select?type={tipo}",
+            endpoint="meal-planner/select",
+            json=params
+        )
+        if response.status_code == 200:
+            return response.json()
+        else:
+            return {"error": response.text}
@@ -0,0 +1,282 @@
+# ========================================
+# app/tools/resilience.py - Resiliencia de Llamadas a APIs Externas
+# ========================================
+#
+# Cliente HTTP compartido por las herramientas con:
+#   - circuit breaker por endpoint: tras varios fallos seguidos falla al instante
+#     (CircuitOpenError) hasta que pasa el tiempo de recuperación y una petición de
+#     prueba sale bien;
+#   - reintentos acotados con backoff exponencial y jitter, sólo para GET;
+#   - petición duplicada (hedging, opcional) si un GET supera el p95 del endpoint.
+# El tiempo total de un GET con reintentos nunca supera el timeout de la herramienta.
+
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+import asyncio
+import logging
+import os
+import random
+import time
+
+import httpx
+
+from ..services.metrics import (
+    CIRCUIT_BREAKER_STATE, CIRCUIT_BREAKER_TRANSITIONS, UPSTREAM_HEDGES, UPSTREAM_RETRIES
+)
+
+logger = logging.getLogger(__name__)
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("TOOL_BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RECOVERY_SECONDS = float(os.getenv("TOOL_BREAKER_RECOVERY_SECONDS", "30"))
+RETRY_MAX_ATTEMPTS = int(os.getenv("TOOL_RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("TOOL_RETRY_BASE_DELAY", "0.2"))
+RETRY_MAX_DELAY = float(os.getenv("TOOL_RETRY_MAX_DELAY", "2.0"))
+HEDGING_ENABLED = os.getenv("TOOL_HEDGING_ENABLED", "false").lower() == "true"
+# Muestras de latencia necesarias antes de fiarse del p95 para duplicar peticiones
+HEDGE_MIN_SAMPLES = int(os.getenv("TOOL_HEDGE_MIN_SAMPLES", "20"))
+LATENCY_WINDOW = 200
+
+# Respuestas que indican un upstream degradado: se reintentan y cuentan como fallo
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """El endpoint está marcado como caído; no se ha hecho la petición"""
+
+    def __init__(self, endpoint: str, retry_after: float):
+        super().__init__(f"Servicio no disponible temporalmente ({endpoint}); reintentar en {retry_after:.0f}s")
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Circuit breaker por endpoint (por proceso): cerrado -> abierto -> semiabierto -> cerrado"""
+
+    def __init__(self, endpoint: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 recovery_seconds: float = BREAKER_RECOVERY_SECONDS, half_open_max_calls: int = 1):
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.state = CLOSED
+        self.failures = 0
+        self.changed_at = time.monotonic()
+        self.half_open_calls = 0
+        self._gauge = CIRCUIT_BREAKER_STATE.labels(endpoint)
+        self._gauge.set(STATE_VALUES[CLOSED])
+
+    def retry_after(self) -> float:
+        return max(0.0, self.changed_at + self.recovery_seconds - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        elapsed = time.monotonic() - self.changed_at
+        if self.state == OPEN:
+            if elapsed < self.recovery_seconds:
+                return False
+            self._transition(HALF_OPEN)
+        elif self.half_open_calls >= self.half_open_max_calls:
+            # Una prueba que no terminó (cancelada) no bloquea el circuito para siempre
+            if elapsed < self.recovery_seconds:
+                return False
+            self.half_open_calls = 0
+            self.changed_at = time.monotonic()
+        self.half_open_calls += 1
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        if self.state != CLOSED:
+            self._transition(CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            self._transition(OPEN)
+
+    def _transition(self, state: str):
+        if state == OPEN:
+            logger.warning(f"Circuit breaker abierto para {self.endpoint} tras {self.failures} fallos")
+        elif state == CLOSED:
+            logger.info(f"Circuit breaker cerrado para {self.endpoint}")
+        self.state = state
+        self.changed_at = time.monotonic()
+        self.half_open_calls = 0
+        self._gauge.set(STATE_VALUES[state])
+        CIRCUIT_BREAKER_TRANSITIONS.labels(self.endpoint, state).inc()
+
+
+class LatencyTracker:
+    """Ventana deslizante de latencias de un endpoint para estimar su p95"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def p95(self, min_samples: int = HEDGE_MIN_SAMPLES) -> Optional[float]:
+        if len(self.samples) < min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_latencies: Dict[str, LatencyTracker] = {}
+_clients: List["ResilientClient"] = []
+
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        breaker = _breakers[endpoint] = CircuitBreaker(endpoint)
+    return breaker
+
+
+def get_latency_tracker(endpoint: str) -> LatencyTracker:
+    tracker = _latencies.get(endpoint)
+    if tracker is None:
+        tracker = _latencies[endpoint] = LatencyTracker()
+    return tracker
+
+
+def backoff_delay(attempt: int, response: Optional[httpx.Response] = None) -> float:
+    """Backoff exponencial con jitter completo; respeta Retry-After (en segundos) si viene"""
+    if response is not None:
+        try:
+            return min(RETRY_MAX_DELAY, float(response.headers.get("retry-after", "")))
+        except ValueError:
+            pass
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class ResilientClient:
+    """Cliente HTTP de una API externa; reutiliza conexiones entre llamadas"""
+
+    def __init__(self, name: str, base_url: str, headers: Optional[Dict[str, str]] = None,
+                 timeout: float = 10.0, max_attempts: int = RETRY_MAX_ATTEMPTS, hedging: bool = HEDGING_ENABLED):
+        self.name = name
+        self.base_url = base_url
+        self.headers = headers or {}
+        self.timeout = timeout
+        self.max_attempts = max(1, max_attempts)
+        self.hedging = hedging
+        self._http: Optional[httpx.AsyncClient] = None
+        _clients.append(self)
+
+    def _client(self) -> httpx.AsyncClient:
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(base_url=self.base_url, headers=self.headers, timeout=self.timeout)
+        return self._http
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def get(self, path: str, endpoint: str, params: Optional[Dict[str, Any]] = None) -> httpx.Response:
+        """
+        GET con circuit breaker, reintentos y hedging.
+
+        endpoint es la etiqueta del breaker y de las métricas (sin parámetros de la URL).
+        Devuelve la última respuesta aunque sea un error HTTP; lanza CircuitOpenError o el
+        error de transporte de httpx si ningún intento obtuvo respuesta.
+        """
+        key = f"{self.name}:{endpoint}"
+        breaker = get_breaker(key)
+        deadline = time.monotonic() + self.timeout
+        response: Optional[httpx.Response] = None
+        error: Optional[Exception] = None
+
+        for attempt in range(self.max_attempts):
+            if not breaker.allow():
+                raise CircuitOpenError(key, breaker.retry_after())
+            try:
+                response = await self._get_hedged(key, path, params, deadline - time.monotonic())
+                error = None
+            except httpx.TransportError as e:
+                response, error = None, e
+                breaker.record_failure()
+            else:
+                if response.status_code not in RETRYABLE_STATUS:
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+
+            delay = backoff_delay(attempt, response)
+            # Sin reintentos si el breaker acaba de abrirse o no quedan intentos ni tiempo
+            if (attempt + 1 >= self.max_attempts or breaker.state != CLOSED
+                    or time.monotonic() + delay >= deadline):
+                break
+            UPSTREAM_RETRIES.labels(key).inc()
+            logger.warning(f"Reintentando {key} en {delay:.2f}s (intento {attempt + 2}/{self.max_attempts})")
+            await asyncio.sleep(delay)
+
+        if error is not None:
+            raise error
+        return response
+
+    async def post(self, path: str, endpoint: str, json: Any = None, params: Optional[Dict[str, Any]] = None,
+                   timeout: Optional[float] = None) -> httpx.Response:
+        """POST con circuit breaker; sin reintentos ni hedging (no es idempotente)"""
+        key = f"{self.name}:{endpoint}"
+        breaker = get_breaker(key)
+        if not breaker.allow():
+            raise CircuitOpenError(key, breaker.retry_after())
+        try:
+            response = await self._client().post(path, json=json, params=params, timeout=timeout or self.timeout)
+        except httpx.TransportError:
+            breaker.record_failure()
+            raise
+        if response.status_code in RETRYABLE_STATUS:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+    async def _timed_get(self, key: str, path: str, params: Optional[Dict[str, Any]], timeout: float) -> httpx.Response:
+        start = time.perf_counter()
+        response = await self._client().get(path, params=params, timeout=max(timeout, 0.001))
+        get_latency_tracker(key).add(time.perf_counter() - start)
+        return response
+
+    async def _get_hedged(self, key: str, path: str, params: Optional[Dict[str, Any]],
+                          timeout: float) -> httpx.Response:
+        threshold = get_latency_tracker(key).p95() if self.hedging else None
+        if threshold is None or threshold >= timeout:
+            return await self._timed_get(key, path, params, timeout)
+
+        primary = asyncio.ensure_future(self._timed_get(key, path, params, timeout))
+        done, _ = await asyncio.wait({primary}, timeout=threshold)
+        if done or not get_breaker(key).allow():
+            return await primary
+
+        # La primera petición va más lenta que el p95: se lanza una segunda y gana la primera buena
+        hedge = asyncio.ensure_future(self._timed_get(key, path, params, timeout - threshold))
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result().status_code not in RETRYABLE_STATUS:
+                        UPSTREAM_HEDGES.labels(key, "hedge" if task is hedge else "primary").inc()
+                        return task.result()
+            UPSTREAM_HEDGES.labels(key, "none").inc()
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+async def close_http_clients():
+    """Cierra las conexiones HTTP abiertas por las herramientas"""
+    for client in _clients:
+        try:
+            await client.aclose()
+        except Exception as e:
+            logger.error(f"Error cerrando cliente HTTP {client.name}: {str(e)}")
@@ -0,0 +1,15 @@
+# ========================================
+# benchmarks/loadtest/bench_app.py - Aplicación de los Benchmarks
+# ========================================
+#
+# La misma aplicación que app/main.py (middlewares, lifespan, /metrics y el
+# WebSocket /ws/{user_id}) pero sólo con los routers que no dependen de nada
+# externo y sin frontend: así la prueba de carga y el benchmark de arranque
+# funcionan en un checkout sin app/api/auth.py, app/api/chat.py ni frontend/.
+#
+# Uso: uvicorn benchmarks.loadtest.bench_app:app --port 9100
+
+from app.api import plans as plans_api
+from app.application import create_app
+
+app = create_app(routers=[(plans_api.router, "/api/plans", "plans")], frontend_dir=None)
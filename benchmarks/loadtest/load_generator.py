@@ -0,0 +1,133 @@
+# ========================================
+# benchmarks/loadtest/load_generator.py - Generador de Carga WebSocket
+# ========================================
+#
+# Abre N WebSockets concurrentes contra /ws/{user_id}, envía mensajes del
+# escenario con una semilla fija y mide latencia por mensaje, throughput y errores.
+#
+# Uso: python -m benchmarks.loadtest.load_generator --url ws://127.0.0.1:8000 --users 50
+
+from typing import Dict, Any, List
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import time
+
+import websockets
+
+DEFAULT_SCENARIO = os.path.join(os.path.dirname(__file__), "scenarios", "default.json")
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Percentil por rango más cercano sobre una lista ya ordenada"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+class LoadGenerator:
+    def __init__(self, base_url: str, scenario: Dict[str, Any], users: int = 10,
+                 messages_per_user: int = 5, seed: int = 42, timeout: float = 60.0,
+                 think_time: float = 0.0, ramp_up: float = 0.0):
+        self.base_url = base_url.rstrip("/")
+        self.users = users
+        self.messages_per_user = messages_per_user
+        self.seed = seed
+        self.timeout = timeout
+        self.think_time = think_time
+        self.ramp_up = ramp_up
+
+        self.texts = [m["text"] for m in scenario["messages"]]
+        self.weights = [m.get("weight", 1) for m in scenario["messages"]]
+
+        self.latencies: List[float] = []
+        self.errors: Dict[str, int] = {}
+
+    def _record_error(self, kind: str):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    async def _virtual_user(self, index: int):
+        # Cada usuario tiene su propia secuencia reproducible de mensajes
+        rng = random.Random(f"{self.seed}:{index}")
+        user_id = f"load-{self.seed}-{index}"
+        if self.ramp_up:
+            await asyncio.sleep(self.ramp_up * index / self.users)
+
+        try:
+            async with websockets.connect(f"{self.base_url}/ws/{user_id}", open_timeout=self.timeout) as ws:
+                for _ in range(self.messages_per_user):
+                    text = rng.choices(self.texts, weights=self.weights)[0]
+                    start = time.perf_counter()
+                    try:
+                        await ws.send(json.dumps({"message": text}))
+                        raw = await asyncio.wait_for(ws.recv(), timeout=self.timeout)
+                    except asyncio.TimeoutError:
+                        self._record_error("timeout")
+                        continue
+                    elapsed = time.perf_counter() - start
+
+                    response = json.loads(raw)
+                    if response.get("agent") == "error":
+                        self._record_error("agent_error")
+                    else:
+                        self.latencies.append(elapsed)
+
+                    if self.think_time:
+                        await asyncio.sleep(self.think_time)
+        except (OSError, websockets.exceptions.WebSocketException) as e:
+            self._record_error(type(e).__name__)
+
+    async def run(self) -> Dict[str, Any]:
+        start = time.perf_counter()
+        await asyncio.gather(*(self._virtual_user(i) for i in range(self.users)))
+        wall_time = time.perf_counter() - start
+
+        latencies = sorted(self.latencies)
+        attempted = self.users * self.messages_per_user
+        error_count = sum(self.errors.values())
+        return {
+            "users": self.users,
+            "messages_per_user": self.messages_per_user,
+            "seed": self.seed,
+            "wall_time_s": round(wall_time, 3),
+            "messages_ok": len(latencies),
+            "throughput_msg_s": round(len(latencies) / wall_time, 2) if wall_time else 0.0,
+            "latency_ms": {
+                "p50": round(percentile(latencies, 50) * 1000, 1),
+                "p95": round(percentile(latencies, 95) * 1000, 1),
+                "p99": round(percentile(latencies, 99) * 1000, 1),
+                "max": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+            },
+            "errors": self.errors,
+            "error_rate": round(error_count / attempted, 4) if attempted else 0.0,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generador de carga para /ws/{user_id}")
+    parser.add_argument("--url", default="ws://127.0.0.1:8000")
+    parser.add_argument("--scenario", default=DEFAULT_SCENARIO)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--think-time", type=float, default=0.0)
+    parser.add_argument("--ramp-up", type=float, default=0.0)
+    args = parser.parse_args()
+
+    with open(args.scenario, encoding="utf-8") as f:
+        scenario = json.load(f)
+
+    generator = LoadGenerator(
+        args.url, scenario, users=args.users, messages_per_user=args.messages,
+        seed=args.seed, timeout=args.timeout, think_time=args.think_time, ramp_up=args.ramp_up,
+    )
+    print(json.dumps(asyncio.run(generator.run()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
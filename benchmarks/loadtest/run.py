@@ -0,0 +1,183 @@
+# ========================================
+# benchmarks/loadtest/run.py - Prueba de Carga Hermética de Extremo a Extremo
+# ========================================
+#
+# Levanta el stub de OpenAI, los stubs de ExerciseDB/Edamam, un Redis local, una BD
+# SQLite temporal (perfiles y datos fríos) y la aplicación con uvicorn apuntando a ellos; lanza la carga WebSocket y guarda los
+# resultados junto con el commit para poder compararlos entre versiones.
+#
+# Por defecto se carga benchmarks/loadtest/bench_app.py (la app sin los routers que
+# faltan en este árbol); con --app app.main:app se prueba la aplicación completa.
+#
+# Uso: python -m benchmarks.loadtest.run --users 50 --messages 10 [--compare results/otro.json]
+
+from typing import Dict, Any, List
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from .load_generator import LoadGenerator, DEFAULT_SCENARIO
+from .stub_redis import StubRedisServer
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+BENCH_APP = "benchmarks.loadtest.bench_app:app"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"El puerto {port} no respondió en {timeout}s")
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+@contextmanager
+def uvicorn_process(app: str, port: int, env: Dict[str, str], workers: int = 1):
+    """Arranca una app ASGI con uvicorn en un subproceso y la detiene al salir"""
+    cmd = [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(workers), "--log-level", "warning"]
+    process = subprocess.Popen(cmd, cwd=ROOT, env=env)
+    try:
+        wait_for_port(port)
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Diferencias relativas de las métricas principales respecto a una ejecución previa"""
+    lines = [f"Comparación con {baseline.get('git_revision', '?')} ({baseline.get('started_at', '?')})"]
+    pairs = [("throughput_msg_s", current["load"]["throughput_msg_s"], baseline["load"]["throughput_msg_s"])]
+    pairs += [
+        (f"latency_ms.{p}", current["load"]["latency_ms"][p], baseline["load"]["latency_ms"][p])
+        for p in ("p50", "p95", "p99")
+    ]
+    pairs.append(("error_rate", current["load"]["error_rate"], baseline["load"]["error_rate"]))
+    for name, now, before in pairs:
+        delta = ((now - before) / before * 100) if before else 0.0
+        lines.append(f"  {name:18} {before:>10} -> {now:>10} ({delta:+.1f}%)")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga hermética con stubs locales")
+    parser.add_argument("--scenario", default=DEFAULT_SCENARIO)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--app", default=BENCH_APP, help="App ASGI a probar (módulo:atributo)")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=60)
+    parser.add_argument("--api-latency-ms", type=float, default=None)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", default=None, help="Ruta del JSON de resultados")
+    parser.add_argument("--compare", default=None, help="JSON de una ejecución anterior")
+    args = parser.parse_args()
+
+    with open(args.scenario, encoding="utf-8") as f:
+        scenario = json.load(f)
+
+    llm_port, apis_port, app_port = free_port(), free_port(), free_port()
+    redis_server = StubRedisServer(port=free_port()).start()
+
+    stub_env = dict(
+        os.environ,
+        STUB_SCENARIO=os.path.abspath(args.scenario),
+        STUB_SEED=str(args.seed),
+        STUB_LLM_LATENCY_MS=str(args.llm_latency_ms),
+        STUB_LLM_TOKENS_PER_SEC=str(args.llm_tokens_per_sec),
+    )
+    if args.api_latency_ms is not None:
+        stub_env["STUB_API_LATENCY_MS"] = str(args.api_latency_ms)
+
+    # La app sólo ve endpoints locales: ninguna llamada sale a servicios de pago
+    app_env = dict(
+        os.environ,
+        REDIS_URL=redis_server.url,
+        OPENAI_API_BASE=f"http://127.0.0.1:{llm_port}/v1",
+        OPENAI_API_KEY="stub-key",
+        EXERCISEDB_BASE_URL=f"http://127.0.0.1:{apis_port}",
+        API_EXERCICEDB_KEY="stub-key",
+        EDAMAM_BASE_URL=f"http://127.0.0.1:{apis_port}",
+        APP_EDAMAM_ID="stub-app",
+        API_EDAMAM_KEY="stub-key",
+    )
+
+    # Perfiles y datos fríos en una SQLite temporal en lugar de PostgreSQL
+    db_dir = tempfile.TemporaryDirectory()
+    app_env["DATABASE_URL"] = f"sqlite:///{os.path.join(db_dir.name, 'loadtest.db')}"
+    subprocess.run([sys.executable, "-m", "app.database.init_db"], cwd=ROOT, env=app_env, check=True)
+
+    started_at = datetime.utcnow().isoformat()
+    try:
+        with uvicorn_process("benchmarks.loadtest.stub_llm:app", llm_port, stub_env), \
+             uvicorn_process("benchmarks.loadtest.stub_apis:app", apis_port, stub_env), \
+             uvicorn_process(args.app, app_port, app_env, workers=args.workers):
+            generator = LoadGenerator(
+                f"ws://127.0.0.1:{app_port}", scenario, users=args.users,
+                messages_per_user=args.messages, seed=args.seed, timeout=args.timeout,
+            )
+            load = asyncio.run(generator.run())
+    finally:
+        redis_server.stop()
+        db_dir.cleanup()
+
+    result = {
+        "git_revision": git_revision(),
+        "started_at": started_at,
+        "python": sys.version.split()[0],
+        "config": {
+            "scenario": os.path.relpath(os.path.abspath(args.scenario), ROOT),
+            "app": args.app,
+            "workers": args.workers,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_tokens_per_sec": args.llm_tokens_per_sec,
+            "api_latency_ms": args.api_latency_ms,
+        },
+        "load": load,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"loadtest-{result['git_revision']}-{args.seed}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+    print(json.dumps(result, indent=2))
+    print(f"Resultados guardados en {output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print("\n".join(compare(result, json.load(f))))
+
+
+if __name__ == "__main__":
+    main()
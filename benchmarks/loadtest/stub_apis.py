@@ -0,0 +1,96 @@
+# ========================================
+# benchmarks/loadtest/stub_apis.py - Servidores sustitutos de ExerciseDB y Edamam
+# ========================================
+#
+# Un único servidor sirve las rutas de ExerciseDB (/exercises/...) y de
+# Edamam Meal Planner (/api/meal-planner/v1/...), con datos deterministas.
+#
+# Uso: uvicorn benchmarks.loadtest.stub_apis:app --port 9102
+
+from fastapi import FastAPI, Request
+from typing import Dict, Any, List
+import asyncio
+import json
+import os
+import random
+import zlib
+
+SCENARIO_PATH = os.getenv("STUB_SCENARIO", os.path.join(os.path.dirname(__file__), "scenarios", "default.json"))
+SEED = int(os.getenv("STUB_SEED", "42"))
+
+with open(SCENARIO_PATH, encoding="utf-8") as f:
+    SCENARIO = json.load(f).get("apis", {})
+
+LATENCY_MS = float(os.getenv("STUB_API_LATENCY_MS", SCENARIO.get("latency_ms", 100)))
+EXERCISES_PER_TARGET = int(SCENARIO.get("exercises_per_target", 20))
+
+TARGETS = [
+    "abductors", "abs", "adductors", "biceps", "calves", "cardiovascular system", "delts",
+    "forearms", "glutes", "hamstrings", "lats", "levator scapulae", "pectorals",
+    "quads", "serratus anterior", "spine", "traps", "triceps", "upper back",
+]
+TARGET_ALIASES = {"chest": "pectorals", "shoulders": "delts", "back": "upper back"}
+EQUIPMENT = ["barbell", "dumbbell", "cable", "body weight", "kettlebell", "leverage machine"]
+DIFFICULTY = ["beginner", "intermediate", "advanced"]
+RECIPES = [
+    "Greek Yogurt Bowl", "Chicken Quinoa Salad", "Salmon with Vegetables", "Lentil Stew",
+    "Oatmeal with Berries", "Turkey Wrap", "Chickpea Curry", "Tofu Stir Fry",
+]
+
+app = FastAPI(title="Stub ExerciseDB + Edamam")
+stats = {"exercisedb": 0, "edamam": 0}
+
+
+def _exercises_for(target: str) -> List[Dict[str, Any]]:
+    rng = random.Random(f"{SEED}:{target}")
+    return [
+        {
+            "id": f"{zlib.crc32(f'{SEED}:{target}'.encode()) % 10000:04d}{i:02d}",
+            "name": f"{rng.choice(EQUIPMENT)} {target} exercise {i + 1}",
+            "target": target,
+            "bodyPart": target,
+            "equipment": rng.choice(EQUIPMENT),
+            "difficulty": rng.choice(DIFFICULTY),
+        }
+        for i in range(EXERCISES_PER_TARGET)
+    ]
+
+
+@app.get("/exercises/targetList")
+async def target_list():
+    stats["exercisedb"] += 1
+    await asyncio.sleep(LATENCY_MS / 1000)
+    return TARGETS
+
+
+@app.get("/exercises/target/{target}")
+async def exercises_by_target(target: str):
+    stats["exercisedb"] += 1
+    await asyncio.sleep(LATENCY_MS / 1000)
+    return _exercises_for(TARGET_ALIASES.get(target, target))
+
+
+@app.post("/api/meal-planner/v1/{app_id}/select")
+async def meal_planner_select(app_id: str, request: Request):
+    stats["edamam"] += 1
+    params = await request.json()
+    await asyncio.sleep(LATENCY_MS / 1000)
+    rng = random.Random(f"{SEED}:{json.dumps(params, sort_keys=True)}")
+    days = int(params.get("size", 7))
+    return {
+        "status": "OK",
+        "selection": [
+            {
+                "sections": {
+                    meal: {"assigned": f"http://www.edamam.com/ontologies/edamam.owl#recipe_{rng.choice(RECIPES).replace(' ', '_')}"}
+                    for meal in ("Breakfast", "Lunch", "Dinner")
+                }
+            }
+            for _ in range(days)
+        ],
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
@@ -0,0 +1,153 @@
+# ========================================
+# benchmarks/loadtest/stub_llm.py - Sustituto local del endpoint de chat de OpenAI
+# ========================================
+#
+# Servidor compatible con POST /v1/chat/completions (con y sin streaming).
+# La latencia se modela como latencia base + tokens generados / tokens por segundo,
+# y las llamadas a herramientas se guionizan con las reglas del escenario.
+#
+# Uso: STUB_SCENARIO=benchmarks/loadtest/scenarios/default.json \
+#      uvicorn benchmarks.loadtest.stub_llm:app --port 9101
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Dict, Any, List, Optional
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+
+from app.services.prompt_builder import estimate_tokens
+
+SCENARIO_PATH = os.getenv("STUB_SCENARIO", os.path.join(os.path.dirname(__file__), "scenarios", "default.json"))
+LATENCY_MS = float(os.getenv("STUB_LLM_LATENCY_MS", "300"))
+TOKENS_PER_SEC = float(os.getenv("STUB_LLM_TOKENS_PER_SEC", "60"))
+SEED = int(os.getenv("STUB_SEED", "42"))
+
+with open(SCENARIO_PATH, encoding="utf-8") as f:
+    SCENARIO = json.load(f)["llm"]
+
+RULES = [(re.compile(rule["match"], re.IGNORECASE), rule["tool_calls"]) for rule in SCENARIO.get("rules", [])]
+REPLY_TOKENS = int(SCENARIO.get("reply_tokens", 150))
+
+VOCABULARY = [
+    "proteína", "entrenamiento", "series", "repeticiones", "calorías", "descanso", "hidratación",
+    "progresión", "técnica", "verduras", "legumbres", "pecho", "espalda", "piernas", "semana",
+]
+
+app = FastAPI(title="Stub OpenAI")
+stats = {"requests": 0, "tool_call_responses": 0, "completion_tokens": 0}
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def _reply_text(messages: List[Dict[str, Any]], tokens: int) -> str:
+    """Texto determinista derivado del contenido de la conversación"""
+    digest = hashlib.sha256(json.dumps(messages, sort_keys=True, ensure_ascii=False).encode()).digest()
+    rng = random.Random(SEED ^ int.from_bytes(digest[:8], "big"))
+    return " ".join(rng.choice(VOCABULARY) for _ in range(tokens))
+
+
+def _scripted_tool_calls(messages: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+    """Devuelve las llamadas guionizadas si aún no hay resultados de herramientas"""
+    if any(m.get("role") in ("tool", "function") for m in messages):
+        return None
+    last_user = next((_message_text(m) for m in reversed(messages) if m.get("role") == "user"), "")
+    for pattern, tool_calls in RULES:
+        if pattern.search(last_user):
+            return [
+                {
+                    "id": f"call_{i}",
+                    "type": "function",
+                    "function": {"name": call["name"], "arguments": json.dumps(call.get("arguments", {}))},
+                }
+                for i, call in enumerate(tool_calls)
+            ]
+    return None
+
+
+async def _simulate_generation(completion_tokens: int):
+    await asyncio.sleep(LATENCY_MS / 1000 + completion_tokens / TOKENS_PER_SEC)
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    model = body.get("model", "gpt-3.5-turbo")
+    stats["requests"] += 1
+
+    prompt_tokens = sum(estimate_tokens(_message_text(m)) for m in messages)
+    tool_calls = _scripted_tool_calls(messages) if body.get("tools") or body.get("functions") else None
+
+    if tool_calls:
+        stats["tool_call_responses"] += 1
+        message = {"role": "assistant", "content": None, "tool_calls": tool_calls}
+        completion_tokens = sum(estimate_tokens(c["function"]["arguments"]) for c in tool_calls) + 5
+        finish_reason = "tool_calls"
+    else:
+        content = _reply_text(messages, REPLY_TOKENS)
+        message = {"role": "assistant", "content": content}
+        completion_tokens = REPLY_TOKENS
+        finish_reason = "stop"
+    stats["completion_tokens"] += completion_tokens
+
+    completion_id = f"chatcmpl-stub-{stats['requests']}"
+    created = int(time.time())
+
+    if body.get("stream"):
+        return StreamingResponse(
+            _stream(completion_id, created, model, message, finish_reason),
+            media_type="text/event-stream",
+        )
+
+    await _simulate_generation(completion_tokens)
+    return JSONResponse({
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    })
+
+
+async def _stream(completion_id: str, created: int, model: str, message: Dict[str, Any], finish_reason: str):
+    """Emite la respuesta como eventos SSE al ritmo de TOKENS_PER_SEC"""
+    def chunk(delta: Dict[str, Any], finish: Optional[str] = None) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+        }
+        return f"data: {json.dumps(payload)}\n\n"
+
+    await asyncio.sleep(LATENCY_MS / 1000)
+    yield chunk({"role": "assistant", "content": ""})
+    if message.get("tool_calls"):
+        yield chunk({"tool_calls": [dict(call, index=i) for i, call in enumerate(message["tool_calls"])]})
+    else:
+        for token in message["content"].split(" "):
+            await asyncio.sleep(1 / TOKENS_PER_SEC)
+            yield chunk({"content": token + " "})
+    yield chunk({}, finish_reason)
+    yield "data: [DONE]\n\n"
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
@@ -0,0 +1,58 @@
+# ========================================
+# benchmarks/loadtest/stub_redis.py - Sustituto local de Redis
+# ========================================
+#
+# Servidor TCP que habla el protocolo RESP sobre un backend en memoria (fakeredis),
+# suficiente para MemoryService sin depender de una instancia real de Redis.
+#
+# Uso: python -m benchmarks.loadtest.stub_redis --port 6399
+
+import argparse
+import logging
+import threading
+
+from fakeredis import TcpFakeServer
+
+logger = logging.getLogger(__name__)
+
+
+class StubRedisServer:
+    """Arranca fakeredis en un hilo de fondo escuchando en host:port"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6399):
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        return f"redis://{self.host}:{self.port}/0"
+
+    def start(self) -> "StubRedisServer":
+        self.server = TcpFakeServer((self.host, self.port), server_type="redis")
+        # No esperar a las conexiones abiertas de los clientes al detenerse
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f"Stub Redis escuchando en {self.url}")
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sustituto local de Redis para benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6399)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = StubRedisServer(args.host, args.port).start()
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,131 @@
+# ========================================
+# benchmarks/micro/hot_paths.py - Casos de Microbenchmark del Camino Caliente
+# ========================================
+#
+# Cada caso es una función sin argumentos que ejecuta una vez el trabajo de CPU
+# que la app hace por mensaje. Los objetos se construyen sin __init__ para no
+# crear clientes de LLM ni conexiones: sólo se mide la lógica en proceso.
+
+from typing import Dict, Any, Callable, List
+from datetime import datetime, timedelta
+
+from app.agents.orchestrator import AgentOrchestrator
+from app.agents.nutrition_agent import NutritionAgent
+from app.agents.fitness_agent import FitnessAgent
+from app.agents.personalization_agent import PersonalizationAgent
+from app.services.codecs import CODECS
+from app.services.memory_service import MemoryService
+from app.services.plan_generator import PlanGenerator
+from app.services.prompt_builder import PromptBuilder
+from app.services.shopping_list import ShoppingListAggregator
+
+
+def _bare(cls, **attrs):
+    """Instancia una clase sin ejecutar su __init__"""
+    obj = cls.__new__(cls)
+    obj.__dict__.update(attrs)
+    return obj
+
+
+PROFILE = {
+    "user_id": "bench-user",
+    "version": 3,
+    "age": 32,
+    "gender": "female",
+    "weight": 64,
+    "height": 168,
+    "activity_level": "moderate",
+    "fitness_level": "intermediate",
+    "goals": "perder peso y ganar músculo",
+    "restrictions": "vegetariano, sin lactosa",
+    "injuries": "molestias en rodilla izquierda",
+    "equipment": "mancuernas, banda elástica",
+    "time_available": "45 minutos, 4 días por semana",
+}
+
+AGENT_RESPONSE = (
+    "Para tu objetivo te recomiendo una rutina de 4 días. Día 1: Press de banca con mancuernas "
+    "4x10, Remo con mancuerna 4x12, Curl de bíceps 3x12. Día 2: Sentadilla goblet 4x12, "
+    "Peso muerto rumano 4x10, Zancadas con mancuernas 3x12 por pierna. Mantén un déficit "
+    "moderado de calorías y prioriza 1.8 g de proteína por kilo de peso. "
+) * 4
+
+base_time = datetime(2025, 1, 1, 12, 0, 0)
+CONTEXT = [
+    {
+        "timestamp": (base_time + timedelta(minutes=i)).isoformat(),
+        "user_message": f"Pregunta {i}: ¿cómo ajusto mi rutina de entrenamiento y mis calorías esta semana?",
+        "agent_response": AGENT_RESPONSE,
+        "agent": "fitness" if i % 2 else "nutrition",
+    }
+    for i in range(10)
+]
+
+MESSAGES = [
+    "¿Qué ejercicios me recomiendas para el pecho?",
+    "Quiero una dieta con más proteína y menos carbohidratos",
+    "¿Qué dice la evidencia científica sobre la creatina?",
+    "sí",
+    "Hola, quiero actualizar mi perfil",
+]
+
+AGENT_RESULT = {"output": AGENT_RESPONSE, "intermediate_steps": []}
+
+orchestrator = _bare(AgentOrchestrator)
+nutrition_agent = _bare(NutritionAgent, prompt_builder=PromptBuilder())
+fitness_agent = _bare(FitnessAgent, prompt_builder=PromptBuilder())
+personalization_agent = _bare(PersonalizationAgent, prompt_builder=PromptBuilder())
+memory_service = _bare(MemoryService, codecs=CODECS)
+plan_generator = _bare(PlanGenerator, shopping_list_aggregator=ShoppingListAggregator())
+prompt_builder = PromptBuilder()
+
+ENCODED_WINDOW = [memory_service._encode_conversation_entry(entry) for entry in reversed(CONTEXT)]
+MEALS = plan_generator._generate_meal_structure()
+CALORIES = plan_generator._calculate_daily_calories(PROFILE)
+MACROS = plan_generator._calculate_macros(CALORIES, PROFILE["goals"])
+
+
+def determine_agent():
+    for message in MESSAGES:
+        orchestrator._determine_agent(message, CONTEXT)
+
+
+def memory_encode_window():
+    for entry in CONTEXT:
+        memory_service._encode_conversation_entry(entry)
+
+
+def memory_decode_window():
+    memory_service._decode_conversation(ENCODED_WINDOW, "bench-user")
+
+
+CASES: Dict[str, Callable[[], Any]] = {
+    "orchestrator.determine_agent[x5]": determine_agent,
+    "nutrition.prepare_user_context": lambda: nutrition_agent._prepare_user_context(PROFILE),
+    "nutrition.render_user_context": lambda: nutrition_agent._render_user_context(PROFILE),
+    "fitness.prepare_user_context": lambda: fitness_agent._prepare_user_context(PROFILE),
+    "fitness.render_user_context": lambda: fitness_agent._render_user_context(PROFILE),
+    "personalization.prepare_user_context": lambda: personalization_agent._prepare_user_context(PROFILE),
+    "prompt_builder.build": lambda: prompt_builder.build("fitness", "bench-user", MESSAGES[0], "perfil", CONTEXT),
+    "fitness.should_generate_plan": lambda: fitness_agent._should_generate_plan(MESSAGES[0], AGENT_RESPONSE),
+    "fitness.extract_tools_used": lambda: fitness_agent._extract_tools_used(AGENT_RESULT),
+    "fitness.extract_exercises": lambda: fitness_agent._extract_exercises_from_response(AGENT_RESPONSE),
+    "memory.encode_window[x10]": memory_encode_window,
+    "memory.decode_window[x10]": memory_decode_window,
+    "plan.calculate_daily_calories": lambda: plan_generator._calculate_daily_calories(PROFILE),
+    "plan.calculate_macros": lambda: plan_generator._calculate_macros(CALORIES, PROFILE["goals"]),
+    "plan.generate_meal_structure": plan_generator._generate_meal_structure,
+    "plan.generate_nutrition_guidelines": lambda: plan_generator._generate_nutrition_guidelines(PROFILE),
+    "plan.generate_shopping_list[30d]": lambda: plan_generator._generate_shopping_list(CALORIES, MEALS, 30, 1),
+    "plan.generate_workout_schedule": lambda: plan_generator._generate_workout_schedule(PROFILE),
+    "plan.generate_exercise_library": plan_generator._generate_exercise_library,
+    "plan.generate_progression_plan": plan_generator._generate_progression_plan,
+}
+
+
+def calibration():
+    """Carga fija de Python puro para normalizar resultados entre máquinas"""
+    data: List[int] = []
+    for i in range(200):
+        data.append(i * i % 7)
+    return sorted(data), {str(i): i for i in range(50)}
@@ -0,0 +1,117 @@
+# ========================================
+# benchmarks/micro/run.py - Runner de Microbenchmarks con Umbrales de Regresión
+# ========================================
+#
+# Mide cada caso de hot_paths.py, lo normaliza con una carga de calibración medida
+# justo antes y lo compara con la línea base guardada. Sale con código 1 si algún
+# caso empeora más que la tolerancia permitida.
+#
+# Uso: python -m benchmarks.micro.run                  # comparar con la línea base
+#      python -m benchmarks.micro.run --save-baseline  # regenerar la línea base
+
+from typing import Dict, Any, Callable
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+from datetime import datetime
+
+from .hot_paths import CASES, calibration
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "..", "baselines", "micro.json")
+DEFAULT_TOLERANCE = 0.25
+
+# Tolerancias específicas para casos con más ruido (dominados por asignaciones de memoria)
+CASE_TOLERANCES = {
+    "plan.generate_shopping_list[30d]": 0.35,
+}
+
+
+def measure(fn: Callable[[], Any], repeat: int = 5, min_time: float = 0.2) -> float:
+    """Nanosegundos por llamada: mínimo de varias repeticiones de duración >= min_time"""
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    # Escalar el número de iteraciones para que cada repetición dure al menos min_time
+    if elapsed < min_time:
+        number = max(number, int(number * min_time / max(elapsed, 1e-9)))
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e9
+
+
+def measure_case(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Mide un caso junto a la calibración para que el ruido de la máquina afecte a ambos"""
+    calibration_ns = measure(calibration, repeat=repeat)
+    ns = measure(fn, repeat=repeat)
+    return {"ns": round(ns, 1), "normalized": round(ns / calibration_ns, 4)}
+
+
+def run_cases(selected: Dict[str, Callable[[], Any]], repeat: int) -> Dict[str, Any]:
+    results = {}
+    for name, fn in selected.items():
+        fn()  # calentar cachés (perfiles renderizados, regex compiladas...)
+        results[name] = measure_case(fn, repeat)
+        print(f"  {name:45} {results[name]['ns']:>12.1f} ns")
+    return {
+        "created_at": datetime.utcnow().isoformat(),
+        "python": sys.version.split()[0],
+        "machine": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float,
+            selected: Dict[str, Callable[[], Any]], repeat: int, retries: int) -> int:
+    """Imprime la comparación normalizada y devuelve el número de regresiones"""
+    print()
+    regressions = 0
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"  {name:45} sin línea base")
+            continue
+        limit = 1 + CASE_TOLERANCES.get(name, tolerance)
+        ratio = result["normalized"] / before["normalized"]
+        # Re-medir antes de declarar una regresión para descartar picos de ruido
+        for _ in range(retries):
+            if ratio <= limit:
+                break
+            ratio = min(ratio, measure_case(selected[name], repeat)["normalized"] / before["normalized"])
+        status = "REGRESIÓN" if ratio > limit else "ok"
+        regressions += ratio > limit
+        print(f"  {name:45} {ratio:>6.2f}x (límite {limit:.2f}x) {status}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks del procesamiento por mensaje")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--retries", type=int, default=2, help="Re-mediciones de un caso que parece regresar")
+    parser.add_argument("--filter", default="", help="Sólo casos cuyo nombre contenga este texto")
+    args = parser.parse_args()
+
+    selected = {name: fn for name, fn in CASES.items() if args.filter in name}
+    current = run_cases(selected, args.repeat)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2, ensure_ascii=False)
+        print(f"Línea base guardada en {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        sys.exit(f"No existe línea base en {args.baseline}; ejecuta con --save-baseline")
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    regressions = compare(current, baseline, args.tolerance, selected, args.repeat, args.retries)
+    if regressions:
+        sys.exit(f"{regressions} caso(s) superan la tolerancia de regresión")
+
+
+if __name__ == "__main__":
+    main()
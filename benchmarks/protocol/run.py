@@ -0,0 +1,160 @@
+# ========================================
+# benchmarks/protocol/run.py - Bytes en el Cable y CPU por Mensaje WebSocket
+# ========================================
+#
+# Codifica una conversación representativa (respuestas de texto y planes que se
+# regeneran con pequeños cambios) con cada formato del protocolo WebSocket y mide:
+#   - bytes por mensaje sin comprimir y con permessage-deflate (zlib raw con contexto
+#     compartido entre mensajes, como hace la extensión por defecto);
+#   - CPU del servidor por mensaje (codificación + compresión).
+#
+# Uso: python -m benchmarks.protocol.run [--messages 40] [--output results/protocol.json]
+
+from typing import Any, Callable, Dict, List
+import argparse
+import copy
+import json
+import os
+import time
+import zlib
+
+from app.services.plan_generator import PlanGenerator
+from app.services.shopping_list import ShoppingListAggregator
+from app.services.ws_protocol import WireProtocol, JSON_V2, MSGPACK_V2
+
+PROFILE = {
+    "age": 32, "gender": "female", "weight": 64, "height": 168, "activity_level": "moderate",
+    "fitness_level": "intermediate", "goals": "perder peso y ganar músculo",
+}
+
+AGENT_TEXT = (
+    "Para tu objetivo te recomiendo mantener un déficit moderado, priorizar 1.8 g de proteína "
+    "por kilo y repartir las comidas en cinco tomas. Ajustaremos según tu progreso semanal. "
+) * 6
+
+
+def build_plans() -> Dict[str, Dict[str, Any]]:
+    generator = PlanGenerator.__new__(PlanGenerator)
+    generator.shopping_list_aggregator = ShoppingListAggregator()
+    calories = generator._calculate_daily_calories(PROFILE)
+    meals = generator._generate_meal_structure()
+    nutrition = {
+        "id": "nutrition_bench_1", "user_id": "bench", "type": "nutrition", "duration": "7_days",
+        "created_at": "2025-01-01T12:00:00", "daily_calories": calories,
+        "macros": generator._calculate_macros(calories, PROFILE["goals"]), "meals": meals,
+        "guidelines": generator._generate_nutrition_guidelines(PROFILE),
+        "shopping_list": generator._generate_shopping_list(calories, meals, 7, 1),
+        "notes": AGENT_TEXT,
+    }
+    fitness = {
+        "id": "fitness_bench_1", "user_id": "bench", "type": "fitness", "duration": "4_weeks",
+        "created_at": "2025-01-01T12:00:00", "fitness_level": "intermediate",
+        "weekly_schedule": generator._generate_workout_schedule(PROFILE),
+        "exercises": generator._generate_exercise_library(),
+        "progression": generator._generate_progression_plan(), "notes": AGENT_TEXT,
+    }
+    return {"nutrition": nutrition, "fitness": fitness}
+
+
+def build_conversation(count: int) -> List[Dict[str, Any]]:
+    """Uno de cada tres mensajes trae un plan regenerado con cambios pequeños"""
+    plans = build_plans()
+    messages = []
+    for i in range(count):
+        message = {
+            "agent": "nutrition" if i % 2 else "fitness",
+            "message": AGENT_TEXT,
+            "metadata": {"tools_used": ["CalorieCalculatorTool"], "prompt": {"prompt_tokens": 640}},
+            "plan": None,
+            "timestamp": f"2025-01-01T12:{i % 60:02d}:00",
+        }
+        if i % 3 == 0:
+            plan = copy.deepcopy(plans["nutrition" if i % 2 else "fitness"])
+            plan["id"] = f"{plan['type']}_bench_{i}"
+            plan["created_at"] = message["timestamp"]
+            if plan["type"] == "nutrition":
+                plan["daily_calories"] -= i
+            message["plan"] = plan
+        messages.append(message)
+    return messages
+
+
+class Deflate:
+    """permessage-deflate con context takeover: un compresor por conexión"""
+
+    def __init__(self):
+        self.compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+
+    def __call__(self, payload: bytes) -> bytes:
+        data = self.compressor.compress(payload) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        return data[:-4]  # La extensión elimina la cola 00 00 ff ff
+
+
+def legacy_encoder() -> Callable[[Dict[str, Any]], bytes]:
+    return lambda message: json.dumps(message).encode("utf-8")
+
+
+def protocol_encoder(subprotocol) -> Callable[[Dict[str, Any]], bytes]:
+    protocol = WireProtocol(subprotocol)
+
+    def encode(message):
+        payload = protocol.encode(message)
+        return payload if isinstance(payload, bytes) else payload.encode("utf-8")
+    return encode
+
+
+FORMATS = {
+    "json (stdlib, plan completo)": legacy_encoder,
+    "json v2 (orjson, deltas)": lambda: protocol_encoder(JSON_V2),
+    "msgpack v2 (deltas)": lambda: protocol_encoder(MSGPACK_V2),
+}
+
+
+def run_format(make_encoder, messages: List[Dict[str, Any]], rounds: int) -> Dict[str, Any]:
+    raw_bytes = deflated_bytes = 0
+    encode_ns = deflate_ns = 0
+    for _ in range(rounds):
+        # Conexión nueva en cada ronda: estado de deltas y compresor desde cero
+        encode, deflate = make_encoder(), Deflate()
+        raw_bytes = deflated_bytes = 0
+        for message in messages:
+            start = time.perf_counter_ns()
+            payload = encode(message)
+            middle = time.perf_counter_ns()
+            compressed = deflate(payload)
+            encode_ns += middle - start
+            deflate_ns += time.perf_counter_ns() - middle
+            raw_bytes += len(payload)
+            deflated_bytes += len(compressed)
+    total = rounds * len(messages)
+    return {
+        "bytes_per_msg": round(raw_bytes / len(messages)),
+        "deflate_bytes_per_msg": round(deflated_bytes / len(messages)),
+        "encode_us_per_msg": round(encode_ns / total / 1000, 1),
+        "deflate_us_per_msg": round(deflate_ns / total / 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tamaño y CPU por mensaje de cada formato WebSocket")
+    parser.add_argument("--messages", type=int, default=30)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    messages = build_conversation(args.messages)
+    results = {name: run_format(make, messages, args.rounds) for name, make in FORMATS.items()}
+
+    print(f"{'formato':32} {'bytes':>8} {'deflate':>8} {'cod. us':>8} {'defl. us':>9}")
+    for name, r in results.items():
+        print(f"{name:32} {r['bytes_per_msg']:>8} {r['deflate_bytes_per_msg']:>8} "
+              f"{r['encode_us_per_msg']:>8} {r['deflate_us_per_msg']:>9}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"messages": args.messages, "results": results}, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
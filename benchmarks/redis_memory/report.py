@@ -0,0 +1,148 @@
+# ========================================
+# benchmarks/redis_memory/report.py - Ahorro de Memoria Redis por Codec
+# ========================================
+#
+# Genera un conjunto de datos realista (perfiles, ventanas de conversación de 50
+# turnos, respuestas de API cacheadas y planes) y lo escribe dos veces: con
+# json.dumps como antes y con los codecs de app/services/codecs.py. Compara la
+# memoria por familia de claves con MEMORY USAGE si el servidor lo soporta
+# (Redis real); si no, con el tamaño de clave + valor.
+#
+# Uso: python -m benchmarks.redis_memory.report --users 200 [--redis-url redis://localhost:6379/15]
+
+from typing import Any, Dict, List, Tuple
+import argparse
+import copy
+import json
+import random
+
+import redis
+
+from app.services.codecs import CODECS
+from benchmarks.protocol.run import build_plans
+
+SENTENCES = [
+    "Te recomiendo aumentar la proteína a 1.8 g por kilo de peso corporal.",
+    "Para la rodilla, sustituye las zancadas por puente de glúteo y sentadilla a cajón.",
+    "Reparte las calorías en cinco comidas y deja los hidratos alrededor del entrenamiento.",
+    "Según la evidencia, la creatina monohidrato a 3-5 g diarios mejora la fuerza.",
+    "Haz 4 series de 10 repeticiones con un descanso de 90 segundos entre series.",
+    "Incluye legumbres, tofu y tempeh como fuentes de proteína vegetal.",
+    "Camina al menos 8.000 pasos al día para aumentar el gasto energético.",
+    "Hidrátate con 35 ml de agua por kilo de peso, más en días de entrenamiento.",
+]
+QUESTIONS = [
+    "¿Qué ejercicios me recomiendas para el pecho?",
+    "Quiero una dieta con más proteína",
+    "¿Qué dice la evidencia sobre la creatina?",
+    "¿Cuántas calorías debo comer?",
+    "Hazme una rutina de 4 días",
+]
+
+
+def build_dataset(users: int, seed: int) -> Dict[str, List[Tuple[str, Any]]]:
+    """Valores por familia: lista de (clave, valor) o (clave, [valores de la lista])"""
+    rng = random.Random(seed)
+    plans = build_plans()
+    data: Dict[str, List[Tuple[str, Any]]] = {"profile": [], "conversation": [], "api_cache": [], "plan": []}
+    for u in range(users):
+        user_id = f"user-{u}"
+        data["profile"].append((f"profile:{user_id}", {
+            "user_id": user_id, "version": rng.randint(1, 20), "age": rng.randint(18, 70),
+            "gender": rng.choice(["male", "female"]), "weight": rng.randint(50, 110),
+            "height": rng.randint(150, 200), "activity_level": rng.choice(["light", "moderate", "active"]),
+            "fitness_level": rng.choice(["beginner", "intermediate", "advanced"]),
+            "goals": rng.choice(["perder peso", "ganar músculo", "mantenimiento"]),
+            "restrictions": rng.choice(["", "vegetariano", "sin gluten"]),
+            "last_updated": f"2025-01-{rng.randint(1, 28):02d}T10:00:00",
+        }))
+        window = []
+        for t in range(50):
+            window.append({
+                "timestamp": f"2025-01-{1 + t % 28:02d}T{t % 24:02d}:00:00",
+                "user_message": rng.choice(QUESTIONS),
+                "agent_response": " ".join(rng.choice(SENTENCES) for _ in range(rng.randint(3, 12))),
+                "agent": rng.choice(["nutrition", "fitness", "research", "personalization"]),
+            })
+        data["conversation"].append((f"conversation:{user_id}", window))
+        for plan_type, template in plans.items():
+            plan = copy.deepcopy(template)
+            plan["id"] = f"{plan_type}_{user_id}"
+            plan["user_id"] = user_id
+            plan["notes"] = " ".join(rng.choice(SENTENCES) for _ in range(6))
+            data["plan"].append((f"plan:{plan['id']}", plan))
+    for i in range(users // 2):
+        exercises = [{"id": f"{i:04d}{j}", "name": f"ejercicio {i}-{j}", "bodyPart": "chest",
+                      "target": "pectorals", "equipment": "dumbbell",
+                      "instructions": [rng.choice(SENTENCES) for _ in range(4)]} for j in range(10)]
+        data["api_cache"].append((f"api_cache:exercisedb:{i}", exercises))
+    return data
+
+
+def write_family(client, family: str, items, encode, prefix: str):
+    pipe = client.pipeline(transaction=False)
+    for key, value in items:
+        if family == "conversation":
+            pipe.rpush(prefix + key, *[encode(family, entry) for entry in value])
+        else:
+            pipe.set(prefix + key, encode(family, value))
+    pipe.execute()
+
+
+def measure_family(client, keys: List[str]) -> Tuple[int, str]:
+    try:
+        return sum(client.memory_usage(key) or 0 for key in keys), "MEMORY USAGE"
+    except redis.ResponseError:
+        total = 0
+        for key in keys:
+            if client.type(key) == b"list":
+                total += len(key) + sum(len(v) for v in client.lrange(key, 0, -1))
+            else:
+                total += len(key) + len(client.get(key))
+        return total, "bytes clave+valor"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memoria Redis: JSON frente a codecs por familia")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--redis-url", default=None, help="Redis real (se usa y limpia el prefijo memreport:)")
+    args = parser.parse_args()
+
+    if args.redis_url:
+        client = redis.Redis.from_url(args.redis_url)
+    else:
+        import fakeredis
+        client = fakeredis.FakeRedis()
+
+    dataset = build_dataset(args.users, args.seed)
+    encoders = {
+        "json": lambda family, value: json.dumps(value),
+        "codec": lambda family, value: CODECS[family].encode(value),
+    }
+
+    print(f"{'familia':14} {'claves':>7} {'json':>12} {'codec':>12} {'ahorro':>8}")
+    totals = {"json": 0, "codec": 0}
+    method = ""
+    try:
+        for family, items in dataset.items():
+            sizes = {}
+            for name, encode in encoders.items():
+                prefix = f"memreport:{name}:"
+                write_family(client, family, items, encode, prefix)
+                sizes[name], method = measure_family(client, [prefix + key for key, _ in items])
+                totals[name] += sizes[name]
+            saving = 1 - sizes["codec"] / sizes["json"] if sizes["json"] else 0.0
+            print(f"{family:14} {len(items):>7} {sizes['json']:>12,} {sizes['codec']:>12,} {saving:>7.1%}")
+    finally:
+        keys = list(client.scan_iter("memreport:*", count=1000))
+        for i in range(0, len(keys), 500):
+            client.delete(*keys[i:i + 500])
+
+    saving = 1 - totals["codec"] / totals["json"] if totals["json"] else 0.0
+    print(f"{'total':14} {'':>7} {totals['json']:>12,} {totals['codec']:>12,} {saving:>7.1%}")
+    print(f"Medida: {method}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+# ========================================
+# benchmarks/startup/run.py - Benchmark de Arranque en Frío
+# ========================================
+#
+# Mide, en procesos nuevos y sobre la app de los benchmarks (benchmarks/loadtest/bench_app.py,
+# o la indicada con --app):
+#   - el tiempo de import del módulo de la app (mediana de varias ejecuciones) y los módulos
+#     más costosos según `python -X importtime`;
+#   - el tiempo hasta la primera respuesta HTTP (GET /metrics) desde que se lanza uvicorn;
+#   - el tiempo hasta la primera respuesta WebSocket, con los stubs de la prueba de carga
+#     (incluye la construcción diferida del agente).
+#
+# Uso: python -m benchmarks.startup.run --runs 5 [--no-warmup] [--compare results/otro.json]
+
+from typing import Dict, Any, List
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime
+
+import websockets
+
+from benchmarks.loadtest.run import BENCH_APP, ROOT, RESULTS_DIR, free_port, git_revision, uvicorn_process
+from benchmarks.loadtest.stub_redis import StubRedisServer
+from benchmarks.loadtest.load_generator import DEFAULT_SCENARIO
+
+IMPORT_SNIPPET = (
+    "import sys, time; t = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - t, int('langchain' in sys.modules), len(sys.modules))"
+)
+
+
+def measure_import(module: str, runs: int) -> Dict[str, Any]:
+    """Tiempo de import del módulo de la app en intérpretes nuevos"""
+    samples = []
+    langchain_loaded = modules = 0
+    for _ in range(runs):
+        out = subprocess.check_output([sys.executable, "-c", IMPORT_SNIPPET.format(module=module)],
+                                      cwd=ROOT, text=True)
+        seconds, langchain_loaded, modules = out.split()
+        samples.append(float(seconds) * 1000)
+    return {
+        "median_ms": round(statistics.median(samples), 1),
+        "min_ms": round(min(samples), 1),
+        "langchain_loaded": bool(int(langchain_loaded)),
+        "modules": int(modules),
+    }
+
+
+def top_imports(module: str, limit: int = 15) -> List[Dict[str, Any]]:
+    """Paquetes de primer nivel con mayor tiempo acumulado según -X importtime"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=ROOT, capture_output=True, text=True)
+    totals: Dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        # Formato: "import time: self [us] | cumulative | imported package"
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        root = parts[2].strip().split(".")[0]
+        if root in ("app", "benchmarks"):
+            continue
+        # El mayor acumulado de un paquete corresponde a su primer import, que incluye a sus hijos
+        totals[root] = max(totals.get(root, 0), int(parts[1]))
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [{"module": name, "cumulative_ms": round(us / 1000, 1)} for name, us in ranked]
+
+
+def wait_for_http(url: str, started: float, timeout: float) -> float:
+    """Segundos desde `started` hasta la primera respuesta 200"""
+    deadline = started + timeout
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter() - started
+        except OSError:
+            time.sleep(0.02)
+    raise TimeoutError(f"{url} no respondió en {timeout}s")
+
+
+async def first_websocket_reply(url: str, message: str, timeout: float) -> float:
+    start = time.perf_counter()
+    async with websockets.connect(url, open_timeout=timeout) as ws:
+        await ws.send(json.dumps({"message": message}))
+        await asyncio.wait_for(ws.recv(), timeout=timeout)
+    return time.perf_counter() - start
+
+
+def measure_first_request(app: str, app_env: Dict[str, str], message: str, timeout: float) -> Dict[str, float]:
+    """Lanza uvicorn y mide la primera respuesta HTTP y la primera respuesta WebSocket"""
+    port = free_port()
+    cmd = [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1",
+           "--port", str(port), "--log-level", "warning"]
+    started = time.perf_counter()
+    process = subprocess.Popen(cmd, cwd=ROOT, env=app_env)
+    try:
+        first_http = wait_for_http(f"http://127.0.0.1:{port}/metrics", started, timeout)
+        ws_latency = asyncio.run(first_websocket_reply(f"ws://127.0.0.1:{port}/ws/startup-bench", message, timeout))
+        first_ws = time.perf_counter() - started
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return {
+        "first_http_ms": round(first_http * 1000, 1),
+        "first_ws_reply_ms": round(first_ws * 1000, 1),
+        "first_ws_latency_ms": round(ws_latency * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de import y de primera petición de la app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--app", default=BENCH_APP, help="App ASGI a medir (módulo:atributo)")
+    parser.add_argument("--no-warmup", action="store_true", help="Arrancar con WARMUP_ON_STARTUP=false")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", default=None, help="JSON de una ejecución anterior")
+    args = parser.parse_args()
+
+    with open(DEFAULT_SCENARIO, encoding="utf-8") as f:
+        message = json.load(f)["messages"][0]["text"]
+
+    module = args.app.split(":")[0]
+    print(f"Midiendo import de {module}...")
+    imports = measure_import(module, args.runs)
+    heaviest = top_imports(module)
+
+    llm_port, apis_port = free_port(), free_port()
+    redis_server = StubRedisServer(port=free_port()).start()
+    stub_env = dict(os.environ, STUB_SCENARIO=DEFAULT_SCENARIO, STUB_LLM_LATENCY_MS="0")
+    app_env = dict(
+        os.environ,
+        REDIS_URL=redis_server.url,
+        OPENAI_API_BASE=f"http://127.0.0.1:{llm_port}/v1",
+        OPENAI_API_KEY="stub-key",
+        EXERCISEDB_BASE_URL=f"http://127.0.0.1:{apis_port}",
+        EDAMAM_BASE_URL=f"http://127.0.0.1:{apis_port}",
+        WARMUP_ON_STARTUP="false" if args.no_warmup else "true",
+    )
+
+    print("Midiendo tiempo hasta la primera petición...")
+    samples: List[Dict[str, float]] = []
+    try:
+        with uvicorn_process("benchmarks.loadtest.stub_llm:app", llm_port, stub_env), \
+             uvicorn_process("benchmarks.loadtest.stub_apis:app", apis_port, stub_env):
+            for _ in range(args.runs):
+                samples.append(measure_first_request(args.app, app_env, message, args.timeout))
+    finally:
+        redis_server.stop()
+
+    first_request = {key: round(statistics.median(s[key] for s in samples), 1) for key in samples[0]}
+    result = {
+        "git_revision": git_revision(),
+        "started_at": datetime.utcnow().isoformat(),
+        "python": sys.version.split()[0],
+        "app": args.app,
+        "warmup": not args.no_warmup,
+        "import": imports,
+        "first_request": first_request,
+        "heaviest_imports": heaviest,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"startup-{result['git_revision']}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+    print(f"Resultados guardados en {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"Comparación con {baseline.get('git_revision', '?')}")
+        pairs = [("import.median_ms", imports["median_ms"], baseline["import"]["median_ms"])]
+        pairs += [(f"first_request.{k}", v, baseline["first_request"][k]) for k, v in first_request.items()]
+        for name, now, before in pairs:
+            delta = ((now - before) / before * 100) if before else 0.0
+            print(f"  {name:34} {before:>10} -> {now:>10} ({delta:+.1f}%)")
+
+
+if __name__ == "__main__":
+    main()